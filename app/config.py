@@ -1,4 +1,6 @@
 # app/config.py
+from typing import Dict, List, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class AppSettings(BaseSettings):
@@ -8,6 +10,134 @@ class AppSettings(BaseSettings):
 
     # متغيرات اختيارية مع قيم افتراضية
     LOG_LEVEL: str = "INFO"
+    # نقطة النهاية /metrics بصيغة Prometheus (المقاييس خاصة بكل عامل uvicorn)
+    METRICS_ENABLED: bool = True
+    # نقطة نهاية بديلة لواجهة Gemini عبر REST (مثل خادم scripts/gemini_stub.py لاختبارات الحمل)
+    GEMINI_API_ENDPOINT: Optional[str] = None
+    # تتبع اختياري لكل طلب: عينة عشوائية (0 = معطل) أو طلب صريح عبر ترويسة X-Trace: 1
+    # (X-Trace: profile يضيف ملف تعريف CPU إن كان TRACE_PROFILE_ENABLED مفعّلًا)
+    TRACE_SAMPLE_RATE: float = 0.0
+    TRACE_HEADER_ENABLED: bool = True
+    TRACE_PROFILE_ENABLED: bool = False
+    TRACE_FILE: str = "logs/traces.jsonl"
+    TRACE_FILE_MAX_BYTES: int = 10_000_000
+    TRACE_FILE_BACKUPS: int = 5
+
+    # نموذج التضمين
+    EMBEDDING_MODEL_NAME: str = "paraphrase-multilingual-MiniLM-L12-v2"
+    # واجهة الترميز: "sentence_transformers" (PyTorch) أو "onnx" (ONNX Runtime، مع تكميم int8 اختياري)
+    EMBEDDING_BACKEND: str = "sentence_transformers"
+    ONNX_MODEL_DIR: str = "data/onnx/paraphrase-multilingual-MiniLM-L12-v2"
+    # 0 = اختيار ONNX Runtime الافتراضي (عدد الأنوية)
+    ONNX_NUM_THREADS: int = 0
+
+    # مشاركة الذاكرة بين عمال uvicorn: فتح الفهرس عبر mmap، واستدعاء نموذج تضمين
+    # مشترك في عملية مستقلة (python -m app.core.embedding_server) بدلًا من نسخة لكل عامل.
+    # تنبيه: IO_FLAG_MMAP يشارك القوائم المعكوسة لفهارس IVF فقط؛ فهارس flat وHNSW تُنسخ في ذاكرة كل عامل
+    INDEX_MMAP: bool = False
+    EMBEDDING_SERVER_ADDRESS: Optional[str] = None
+    # مفتاح سري مشترك بين خادم التضمين والعمال؛ إلزامي عند استخدام الخادم (لا قيمة افتراضية)
+    EMBEDDING_SERVER_AUTHKEY: Optional[str] = None
+
+    # إعادة تحميل الفهرس دون توقف: رمز نقطة النهاية الإدارية، وملف اختياري يحتوي على
+    # الإصدار المطلوب تتم مراقبته دوريًا، واستعلامات تسخين الإصدار الجديد قبل تفعيله
+    ADMIN_TOKEN: Optional[str] = None
+    INDEX_VERSION_FILE: Optional[str] = None
+    INDEX_VERSION_POLL_SECONDS: float = 10.0
+    WARMUP_QUERIES: List[str] = [
+        "ما هي سياسة الإرجاع لديكم؟",
+        "كم تستغرق عملية الشحن؟",
+        "كيف يمكنني تتبع طلبي؟",
+    ]
+
+    # فهارس مسماة إضافية تُخدم بجانب INDEX_VERSION (JSON: {"الاسم": "إصدار الفهرس"})، ويختارها الطلب
+    # بالمعامل index أو الترويسة X-Index. تُحمَّل عند أول طلب وتتشارك نموذج التضمين، وتُخرج الأقل
+    # استخدامًا مؤخرًا عند تجاوز INDEX_MEMORY_BUDGET_MB (الفهرس الافتراضي لا يُحتسب ولا يُخرج)
+    NAMED_INDEXES: Dict[str, str] = {}
+    DEFAULT_INDEX_NAME: str = "default"
+    INDEX_MEMORY_BUDGET_MB: float = 2048.0
+
+    # بدء التشغيل: تحميل النموذج والفهرس والبيانات الوصفية بالتوازي، وتسخين المسترجع بـ WARMUP_QUERIES
+    # قبل أن تبدأ الخدمة باستقبال الطلبات (فلا يبلغ /healthz عن الجاهزية قبل انتهائه)
+    PARALLEL_LOADING: bool = True
+    STARTUP_WARMUP_ENABLED: bool = True
+
+    # ذاكرة المتجهات الدائمة على القرص (مشتركة مع scripts/ingest.py وتقييم المسترجع)،
+    # تُستخدم لتسخين الخدمة دون إعادة ترميز WARMUP_QUERIES في كل تشغيل
+    EMBEDDING_DISK_CACHE_DIR: Optional[str] = None
+
+    # تجاوز اختياري لمعاملات البحث المسجلة مع الفهرس (IVF: nprobe، HNSW: efSearch)
+    INDEX_NPROBE: Optional[int] = None
+    INDEX_EF_SEARCH: Optional[int] = None
+
+    # البحث الهجين: "hybrid" يدمج BM25 (ملف index_<v>.bm25.npz) مع البحث الدلالي بـ RRF،
+    # ويعود إلى البحث الدلالي وحده إن لم يوجد الفهرس المعجمي؛ "dense" يعطّله
+    RETRIEVAL_MODE: str = "hybrid"
+    HYBRID_CANDIDATES: int = 20
+    RRF_K: int = 60
+    # تخطي الترميز عندما تغطي نتيجة معجمية واحدة كل مصطلحات الاستعلام وتتفوق على الثانية بهذه النسبة
+    LEXICAL_FAST_PATH_ENABLED: bool = True
+    LEXICAL_FAST_PATH_MIN_RATIO: float = 2.0
+
+    # ذاكرة التخزين المؤقت لمتجهات الاستعلامات داخل Retriever
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_SIZE: int = 1024
+
+    # الإجابة المباشرة من سجل الأسئلة الشائعة دون استدعاء Gemini عندما تتجاوز أعلى نتيجة
+    # DIRECT_ANSWER_MIN_SCORE (تشابه جيب التمام) بفارق DIRECT_ANSWER_MIN_MARGIN على الأقل عن الثانية
+    DIRECT_ANSWER_ENABLED: bool = True
+    DIRECT_ANSWER_MIN_SCORE: float = 0.8
+    DIRECT_ANSWER_MIN_MARGIN: float = 0.1
+
+    # ذاكرة التخزين المؤقت الدلالية للإجابات المولَّدة
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIZE: int = 1000
+    ANSWER_CACHE_TTL_SECONDS: float = 300.0
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+
+    # تجميع طلبات الاسترجاع المتزامنة في دفعات (micro-batching)
+    BATCHING_ENABLED: bool = True
+    BATCH_MAX_SIZE: int = 32
+    BATCH_MAX_WAIT_MS: float = 5.0
+
+    # مسار الطلب غير المتزامن: خيوط الاسترجاع (عمليات CPU) وحد استدعاءات Gemini المتزامنة
+    RETRIEVAL_WORKERS: int = 4
+    LLM_MAX_CONCURRENCY: int = 64
+    # حماية استدعاءات Gemini: موعد نهائي للطلب كله ومهلة لكل محاولة (وللانتظار بين أجزاء التدفق)،
+    # إعادة المحاولة للأخطاء المؤقتة مع تراجع أسي عشوائي، وطلب تحوّط ثانٍ عندما يتجاوز الأول
+    # النسبة المئوية LLM_HEDGE_PERCENTILE من الأزمنة الأخيرة (بعد LLM_HEDGE_MIN_SAMPLES استدعاء)
+    LLM_DEADLINE_SECONDS: float = 20.0
+    LLM_ATTEMPT_TIMEOUT_SECONDS: float = 10.0
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BASE_DELAY_MS: float = 100.0
+    LLM_RETRY_MAX_DELAY_MS: float = 2000.0
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MIN_DELAY_MS: float = 250.0
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    # قاطع الدائرة: يُفتح بعد عدد من الإخفاقات المتتالية ويُختبر مجددًا بعد مهلة؛ أثناء فتحه
+    # (أو عند فشل التوليد) تُعاد الإجابة المخزنة لأعلى سجل إن تجاوز تشابهه LLM_FALLBACK_MIN_SCORE
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5
+    LLM_BREAKER_RESET_SECONDS: float = 30.0
+    LLM_FALLBACK_ENABLED: bool = True
+    LLM_FALLBACK_MIN_SCORE: float = 0.5
+
+    # تعبئة السياق: إزالة المقاطع شبه المكررة (تشابه متجهاتها >= CONTEXT_DEDUP_THRESHOLD) ثم حصر
+    # الموجه في CONTEXT_MAX_INPUT_TOKENS رمزًا تقديريًا (عدد الأحرف / CONTEXT_CHARS_PER_TOKEN)
+    CONTEXT_PACKING_ENABLED: bool = True
+    CONTEXT_MAX_INPUT_TOKENS: int = 1500
+    CONTEXT_DEDUP_THRESHOLD: float = 0.95
+    CONTEXT_CHARS_PER_TOKEN: float = 3.0
+    LLM_MAX_OUTPUT_TOKENS: int = 512
+
+    # دمج طلبات /api/v1/ask المتطابقة الجارية (نفس الاستعلام بعد التطبيع، وk، وإصدار الفهرس)؛
+    # ينتظر كل طلب النتيجة المشتركة COALESCING_MAX_WAIT_SECONDS على الأكثر ثم يُرجع 504
+    COALESCING_ENABLED: bool = True
+    COALESCING_MAX_WAIT_SECONDS: float = 30.0
+
+    # نقطة النهاية المجمّعة /api/v1/ask/batch
+    BATCH_ASK_MAX_ITEMS: int = 1000
+    BATCH_ASK_GENERATION_CONCURRENCY: int = 16
 
     # تحديد مصدر الإعدادات (ملف .env ومتغيرات البيئة)
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
@@ -0,0 +1,184 @@
+# app/core/answer_cache.py
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .text_normalization import normalize_query
+
+
+@dataclass
+class _CacheEntry:
+    vector: Optional[np.ndarray]
+    query_key: Optional[str]
+    source_ids: FrozenSet[str]
+    index_version: str
+    value: Dict[str, Any]
+    expires_at: float
+
+
+class SemanticAnswerCache:
+    """
+    ذاكرة تخزين مؤقت دلالية للإجابات المولَّدة.
+    تُعتبر الإجابة المخزنة صالحة لاستعلام جديد إذا تجاوز تشابه جيب التمام بين
+    متجهي الاستعلامين العتبة المحددة وكانت مجموعة المصادر المسترجعة متطابقة.
+    الاستعلامات التي أُجيبت من المسار المعجمي دون ترميز (لا متجه لها) تُطابَق بنصها المُطبَّع
+    مع نفس المصادر، حتى لا يُرمَّز الاستعلام لأجل ذاكرة الإجابات وحدها.
+    تُحذف المدخلات عند انتهاء صلاحيتها (TTL) أو عند تجاوز الحجم الأقصى.
+    المدخلات مفصولة حسب إصدار الفهرس (مصفوفة متجهات لكل إصدار)، فالطلبات الموجهة إلى فهارس
+    مختلفة لا تُفرغ ذاكرة بعضها؛ وتُحذف مدخلات إصدار ما فقط عبر invalidate عند إعادة تحميل
+    ذلك الفهرس أو إخراجه من الذاكرة.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 300.0, similarity_threshold: float = 0.95):
+        if max_size < 1:
+            raise ValueError("يجب أن يكون حجم ذاكرة التخزين المؤقت 1 على الأقل.")
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # ترتيب LRU مشترك بين كل الإصدارات حتى يبقى max_size حدًا للذاكرة كلها
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        self._next_key = 0
+        # إصدار الفهرس -> (مصفوفة المتجهات، مفاتيح صفوفها)، تُبنى عند أول بحث بعد أي تغيير
+        self._matrices: Dict[str, Tuple[np.ndarray, List[int]]] = {}
+        # (إصدار الفهرس، النص المُطبَّع، المصادر) -> مفتاح المدخل، للمطابقة الحرفية
+        self._by_query: Dict[Tuple[str, str, FrozenSet[str]], int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, query_vector: Optional[np.ndarray], source_ids: Iterable[str], index_version: str,
+            query: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        البحث عن إجابة مخزنة لاستعلام مشابه بنفس المصادر وإصدار الفهرس: مطابقة حرفية بالنص المُطبَّع
+        (query) أولًا، ثم بالتشابه الدلالي إن وُجد المتجه. تُرجع None عند عدم وجود تطابق.
+        """
+        vector = self._as_vector(query_vector) if query_vector is not None else None
+        source_ids = frozenset(source_ids)
+        now = time.monotonic()
+
+        with self._lock:
+            self._purge_expired(now)
+
+            if query is not None:
+                key = self._by_query.get((index_version, normalize_query(query), source_ids))
+                if key is not None:
+                    return self._hit(key)
+
+            stacked = self._stacked_matrix(index_version) if vector is not None else None
+            if stacked is None:
+                self.misses += 1
+                return None
+
+            matrix, keys = stacked
+            similarities = matrix @ vector
+            # نمر على المرشحين من الأعلى تشابهًا إلى الأدنى حتى نجد نفس مجموعة المصادر
+            for position in np.argsort(-similarities):
+                if similarities[position] < self.similarity_threshold:
+                    break
+                key = keys[position]
+                if self._entries[key].source_ids == source_ids:
+                    return self._hit(key)
+
+            self.misses += 1
+            return None
+
+    def put(self, query_vector: Optional[np.ndarray], source_ids: Iterable[str], index_version: str,
+            value: Dict[str, Any], query: Optional[str] = None) -> None:
+        if query_vector is None and query is None:
+            return
+        entry = _CacheEntry(
+            vector=self._as_vector(query_vector) if query_vector is not None else None,
+            query_key=normalize_query(query) if query is not None else None,
+            source_ids=frozenset(source_ids),
+            index_version=index_version,
+            value=dict(value),
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            if entry.query_key is not None:
+                previous = self._by_query.get((index_version, entry.query_key, entry.source_ids))
+                if previous is not None:
+                    self._remove(previous)
+                self._by_query[(index_version, entry.query_key, entry.source_ids)] = key
+            self._entries[key] = entry
+            if entry.vector is not None:
+                self._matrices.pop(index_version, None)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, index_version: str) -> int:
+        """حذف كل مدخلات إصدار فهرس (عند إعادة تحميله أو إخراجه). تُرجع عدد المدخلات المحذوفة."""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry.index_version == index_version]
+            for key in keys:
+                self._remove(key)
+            if keys:
+                self.invalidations += 1
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+            self._by_query.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "index_versions": len({entry.index_version for entry in self._entries.values()}),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    # --- دوال داخلية (يجب استدعاؤها مع الاحتفاظ بالقفل) ---
+
+    @staticmethod
+    def _as_vector(query_vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(query_vector, dtype="float32").reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _hit(self, key: int) -> Dict[str, Any]:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(self._entries[key].value)
+
+    def _remove(self, key: int) -> None:
+        entry = self._entries.pop(key)
+        if entry.vector is not None:
+            self._matrices.pop(entry.index_version, None)
+        if entry.query_key is not None:
+            lookup = (entry.index_version, entry.query_key, entry.source_ids)
+            if self._by_query.get(lookup) == key:
+                del self._by_query[lookup]
+
+    def _purge_expired(self, now: float) -> None:
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            self._remove(key)
+
+    def _stacked_matrix(self, index_version: str) -> Optional[Tuple[np.ndarray, List[int]]]:
+        stacked = self._matrices.get(index_version)
+        if stacked is None:
+            keys = [
+                key for key, entry in self._entries.items()
+                if entry.index_version == index_version and entry.vector is not None
+            ]
+            if not keys:
+                return None
+            stacked = (np.stack([self._entries[key].vector for key in keys]), keys)
+            self._matrices[index_version] = stacked
+        return stacked
@@ -0,0 +1,152 @@
+# app/core/batcher.py
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class _PendingSearch:
+    retriever: Any
+    query: str
+    k: int
+    future: Future = field(default_factory=Future)
+
+
+class RetrievalBatcher:
+    """
+    محرك تجميع ديناميكي (micro-batching) لطلبات الاسترجاع المتزامنة.
+    يجمع الاستعلامات التي تصل خلال نافذة زمنية قصيرة (أو حتى بلوغ الحجم الأقصى للدفعة)،
+    ثم يرمّزها باستدعاء واحد لـ encode ويبحث عنها باستدعاء واحد لـ index.search
+    عبر Retriever.search_batch، ويعيد لكل مستدعٍ نتائجه الخاصة.
+    """
+
+    def __init__(self, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        if max_batch_size < 1:
+            raise ValueError("يجب أن يكون الحجم الأقصى للدفعة 1 على الأقل.")
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[_PendingSearch]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_observed_batch = 0
+
+    def start(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stopped.clear()
+        self._worker = threading.Thread(target=self._run, name="retrieval-batcher", daemon=True)
+        self._worker.start()
+        logging.info(
+            f"تم تشغيل محرك التجميع (الحجم الأقصى للدفعة: {self.max_batch_size}، "
+            f"نافذة الانتظار: {self.max_wait_seconds * 1000:.1f}ms)."
+        )
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopped.set()
+        if self._worker is not None:
+            self._worker.join(timeout=timeout)
+            self._worker = None
+
+    def submit(self, retriever, query: str, k: int) -> Future:
+        """
+        إضافة طلب بحث إلى الطابور. تُرجع Future تحتوي على (قائمة النتائج، متجه الاستعلام أو None)
+        كما في Retriever.search_batch مع return_vectors.
+        """
+        if self._stopped.is_set() or self._worker is None:
+            raise RuntimeError("محرك التجميع غير مُشغَّل.")
+        pending = _PendingSearch(retriever=retriever, query=query, k=k)
+        self._queue.put(pending)
+        return pending.future
+
+    def search(self, retriever, query: str, k: int) -> List[Dict]:
+        """
+        واجهة متزامنة مكافئة لـ Retriever.search تمر عبر محرك التجميع.
+        """
+        return self.submit(retriever, query, k).result()[0]
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": (self.items / self.batches) if self.batches else 0.0,
+                "max_batch_size": self.max_observed_batch,
+            }
+
+    # --- حلقة العامل ---
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._process(batch)
+            except Exception as e:
+                # خطأ غير متوقع في دفعة لا يوقف العامل، وإلا علقت كل الطلبات اللاحقة في الطابور
+                logging.error(f"خطأ غير متوقع في محرك التجميع لدفعة من {len(batch)} طلب: {e}", exc_info=True)
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+
+        # رفض أي طلبات متبقية بعد الإيقاف حتى لا يبقى أي مستدعٍ معلقًا
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending.future.set_running_or_notify_cancel():
+                pending.future.set_exception(RuntimeError("تم إيقاف محرك التجميع."))
+
+    def _process(self, batch: List[_PendingSearch]) -> None:
+        # المستدعي الذي أُلغي انتظاره (انقطاع العميل أو إلغاء الحساب المدمج) يُلغي Future الخاصة به؛
+        # تُتخطى هذه الطلبات، ونقل البقية إلى حالة RUNNING يمنع إلغاءها بعد أن بدأ البحث
+        batch = [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.max_observed_batch = max(self.max_observed_batch, len(batch))
+
+        # تجميع الطلبات حسب المسترجع (قد يتغير المسترجع النشط أثناء التشغيل)
+        groups: Dict[int, List[_PendingSearch]] = {}
+        for pending in batch:
+            groups.setdefault(id(pending.retriever), []).append(pending)
+
+        for group in groups.values():
+            retriever = group[0].retriever
+            try:
+                results, vectors = retriever.search_batch(
+                    [pending.query for pending in group],
+                    [pending.k for pending in group],
+                    return_vectors=True,
+                )
+            except Exception as e:
+                logging.error(f"فشل البحث المجمّع لدفعة من {len(group)} طلب: {e}", exc_info=True)
+                for pending in group:
+                    pending.future.set_exception(e)
+                continue
+
+            for pending, result, vector in zip(group, results, vectors):
+                pending.future.set_result((result, vector))
@@ -0,0 +1,117 @@
+# app/core/context_packing.py
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .lexical_index import analyze
+
+# تعبئة السياق ضمن ميزانية رموز: إزالة المقاطع شبه المكررة (بتشابه متجهاتها المخزنة في الفهرس،
+# أو بتداخل مصطلحاتها عند تعذر استرجاع المتجهات)، ثم إضافة المقاطع بترتيب الاسترجاع حتى بلوغ
+# الميزانية مع قص آخر مقطع يتسع له جزء منها وإسقاط الباقي (الأقل ترتيبًا).
+# عدد الرموز تقديري (عدد الأحرف / CONTEXT_CHARS_PER_TOKEN) لأن مُقسِّم Gemini غير متاح محليًا
+# واستدعاء countTokens يضيف رحلة شبكة لكل طلب؛ الأعداد الفعلية تُقرأ من usage_metadata للاستجابة.
+# عتبة تداخل المصطلحات (Jaccard) لاعتبار مقطعين مكررين عند غياب المتجهات
+TERM_OVERLAP_THRESHOLD = 0.8
+TRUNCATION_MARKER = "…"
+
+
+def estimate_tokens(text: str, chars_per_token: float = 3.0) -> int:
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+@dataclass
+class PackedContext:
+    chunks: List[Dict]
+    context_tokens: int = 0
+    duplicates_removed: int = 0
+    chunks_dropped: int = 0
+    truncated: bool = False
+    removed_ids: List[str] = field(default_factory=list)
+
+
+class ContextPacker:
+    """تعبئة مقاطع السياق المسترجعة في موجه لا يتجاوز max_input_tokens رمزًا (تقديريًا)."""
+
+    def __init__(self, max_input_tokens: int = 1500, dedup_threshold: float = 0.95,
+                 chars_per_token: float = 3.0, min_chunk_tokens: int = 32):
+        self.max_input_tokens = max_input_tokens
+        self.dedup_threshold = dedup_threshold
+        self.chars_per_token = chars_per_token
+        # لا يُقص مقطع إلى أقل من هذا العدد من الرموز؛ يُسقط بدلًا من ذلك
+        self.min_chunk_tokens = min_chunk_tokens
+
+    def tokens(self, text: str) -> int:
+        return estimate_tokens(text, self.chars_per_token)
+
+    def pack(self, chunks: List[Dict], vectors: Optional[np.ndarray] = None,
+             reserved_tokens: int = 0) -> PackedContext:
+        """
+        chunks بترتيب الاسترجاع (الأعلى أولًا)، وvectors متجهاتها المخزنة (صف لكل مقطع) إن توفرت.
+        reserved_tokens: رموز القالب والسؤال التي تُخصم من الميزانية.
+        المقاطع المُعادة نسخ جديدة؛ القواميس الأصلية (المستخدمة كمصادر في الاستجابة) لا تُعدَّل.
+        """
+        unique, duplicates = self._deduplicate(chunks, vectors)
+        packed = PackedContext(chunks=[], duplicates_removed=len(duplicates),
+                               removed_ids=[str(chunk.get("id")) for chunk in duplicates])
+
+        budget = max(self.max_input_tokens - reserved_tokens, 0)
+        for position, chunk in enumerate(unique):
+            text = chunk.get("chunk_text", "") or ""
+            cost = self.tokens(text)
+            remaining = budget - packed.context_tokens
+            if cost <= remaining:
+                packed.chunks.append(dict(chunk))
+                packed.context_tokens += cost
+                continue
+            # المقطع الأول يُحتفظ به دائمًا (مقصوصًا إن لزم)؛ غيره يُقص فقط إن بقي له متسع معقول
+            if position == 0 or remaining >= self.min_chunk_tokens:
+                limit = max(remaining, self.min_chunk_tokens) if position == 0 else remaining
+                truncated_text = self._truncate(text, limit)
+                packed.chunks.append({**chunk, "chunk_text": truncated_text})
+                packed.context_tokens += self.tokens(truncated_text)
+                packed.truncated = True
+            dropped = unique[len(packed.chunks):]
+            packed.chunks_dropped = len(dropped)
+            packed.removed_ids.extend(str(c.get("id")) for c in dropped)
+            break
+        return packed
+
+    def _deduplicate(self, chunks: List[Dict], vectors: Optional[np.ndarray]):
+        if len(chunks) < 2:
+            return list(chunks), []
+        if vectors is not None and len(vectors) == len(chunks):
+            vectors = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+            similarity = vectors @ vectors.T
+
+            def is_duplicate(i: int, j: int) -> bool:
+                return similarity[i, j] >= self.dedup_threshold
+        else:
+            terms = [frozenset(analyze(chunk.get("chunk_text", "") or "")) for chunk in chunks]
+
+            def is_duplicate(i: int, j: int) -> bool:
+                union = terms[i] | terms[j]
+                return bool(union) and len(terms[i] & terms[j]) / len(union) >= TERM_OVERLAP_THRESHOLD
+
+        kept: List[int] = []
+        duplicates: List[Dict] = []
+        for i, chunk in enumerate(chunks):
+            if any(is_duplicate(i, j) for j in kept):
+                duplicates.append(chunk)
+            else:
+                kept.append(i)
+        return [chunks[i] for i in kept], duplicates
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        max_chars = int(max_tokens * self.chars_per_token) - len(TRUNCATION_MARKER)
+        if max_chars <= 0:
+            return ""
+        cut = text[:max_chars]
+        # القص عند آخر مسافة حتى لا تُقطع كلمة في منتصفها
+        boundary = cut.rfind(" ")
+        if boundary > max_chars // 2:
+            cut = cut[:boundary]
+        return cut.rstrip() + TRUNCATION_MARKER
@@ -0,0 +1,52 @@
+# app/core/direct_answer.py
+import threading
+from typing import Any, Dict, List, Optional
+
+
+class DirectAnswerer:
+    """
+    مسار سريع للأسئلة الشائعة: إذا كانت أعلى نتيجة استرجاع سجلًا يحمل إجابة مخزنة (حقل answer)
+    وتجاوز تشابهها العتبة المحددة بفارق واضح عن النتيجة الثانية، تُعاد إجابته كما هي دون استدعاء Gemini.
+    عند وجود نتيجة واحدة فقط تُطبَّق العتبة وحدها.
+    """
+
+    def __init__(self, min_score: float = 0.8, min_margin: float = 0.1, answer_field: str = "answer"):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.answer_field = answer_field
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def answer(self, context_chunks: List[Dict]) -> Optional[Dict[str, Any]]:
+        """تُرجع {"answer", "confidence_score"} من السجل الأول، أو None إن لم يكن مؤهلًا."""
+        result = self._match(context_chunks)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def _match(self, context_chunks: List[Dict]) -> Optional[Dict[str, Any]]:
+        if not context_chunks:
+            return None
+        top = context_chunks[0]
+        stored_answer = top.get(self.answer_field)
+        if not stored_answer:
+            return None
+
+        score = float(top.get("retrieval_score", 0.0))
+        runner_up = float(context_chunks[1].get("retrieval_score", 0.0)) if len(context_chunks) > 1 else 0.0
+        if score < self.min_score or score - runner_up < self.min_margin:
+            return None
+        return {"answer": stored_answer, "confidence_score": min(max(score, 0.0), 1.0)}
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,168 @@
+# app/core/disk_embedding_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: بدون قفل بين العمليات
+    fcntl = None
+
+# ذاكرة تخزين دائمة على القرص لمتجهات النصوص، مشتركة بين الاستيعاب والتقييم وتسخين الخدمة.
+# لكل (نموذج، تطبيع) مجلد مستقل يحتوي على:
+#   vectors.f32  مصفوفة float32 متصلة بالشكل (n, d) تُقرأ عبر np.memmap
+#   keys.bin     بصمات SHA-256 للنصوص (32 بايت لكل صف) بنفس ترتيب الصفوف
+# الكتابة إلحاقية فقط: المتجه يُكتب قبل مفتاحه، فكل مفتاح مقروء يقابله متجه مكتمل.
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.bin"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+KEY_SIZE = 32
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class DiskEmbeddingCache:
+    """
+    ذاكرة تخزين مؤقت دائمة لمتجهات النصوص، مفتاحها (اسم النموذج، علم التطبيع، بصمة النص).
+    آمنة للخيوط، وتتشارك عدة عمليات نفس المجلد عبر قفل ملف أثناء الكتابة.
+    """
+
+    def __init__(self, directory: str, model_name: str, normalize: bool = True):
+        self.model_name = model_name
+        self.normalize = normalize
+        namespace = hashlib.sha256(f"{model_name}\0{normalize}".encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(directory, namespace)
+        os.makedirs(self.path, exist_ok=True)
+
+        self.dimension: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._num_rows = 0
+        self._vectors: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._lock:
+            self._refresh()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _refresh(self) -> None:
+        """قراءة المفاتيح التي أُلحقت منذ آخر قراءة (من هذه العملية أو غيرها) وإعادة تعيين المتجهات."""
+        if self.dimension is None:
+            manifest_path = self._file(MANIFEST_FILE)
+            if not os.path.exists(manifest_path):
+                return
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.dimension = int(json.load(f)["dimension"])
+
+        keys_path = self._file(KEYS_FILE)
+        if not os.path.exists(keys_path):
+            return
+        known = self._num_rows
+        with open(keys_path, 'rb') as f:
+            f.seek(known * KEY_SIZE)
+            data = f.read()
+        for offset in range(0, len(data) - len(data) % KEY_SIZE, KEY_SIZE):
+            self._rows.setdefault(data[offset:offset + KEY_SIZE], known + offset // KEY_SIZE)
+
+        self._num_rows = known + len(data) // KEY_SIZE
+        if self._num_rows and (self._vectors is None or len(self._vectors) != self._num_rows):
+            self._vectors = np.memmap(
+                self._file(VECTORS_FILE), dtype=np.float32, mode='r', shape=(self._num_rows, self.dimension)
+            )
+
+    @contextmanager
+    def _write_lock(self):
+        with open(self._file(LOCK_FILE), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """متجه كل نص بالشكل (d,)، أو None إن لم يكن مخزنًا."""
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._refresh()
+            found: List[Optional[np.ndarray]] = []
+            for key in keys:
+                row = self._rows.get(key)
+                if row is None:
+                    self.misses += 1
+                    found.append(None)
+                else:
+                    self.hits += 1
+                    found.append(np.array(self._vectors[row], dtype=np.float32))
+            return found
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("يجب أن تكون المتجهات مصفوفة (n, d) بعدد النصوص نفسه.")
+        with self._lock, self._write_lock():
+            self._refresh()
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+                with open(self._file(MANIFEST_FILE), 'w', encoding='utf-8') as f:
+                    json.dump({
+                        "model_name": self.model_name,
+                        "normalize": self.normalize,
+                        "dimension": self.dimension,
+                    }, f, ensure_ascii=False, indent=4)
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"أبعاد المتجهات ({vectors.shape[1]}) لا تطابق ذاكرة التخزين ({self.dimension}).")
+
+            new_keys: Dict[bytes, int] = {}
+            for position, text in enumerate(texts):
+                key = text_key(text)
+                if key not in self._rows and key not in new_keys:
+                    new_keys[key] = position
+            if not new_keys:
+                return
+
+            # حذف أي متجهات زائدة من كتابة سابقة انقطعت قبل تسجيل مفاتيحها
+            with open(self._file(VECTORS_FILE), 'ab') as f:
+                f.truncate(self._num_rows * self.dimension * 4)
+                f.write(vectors[list(new_keys.values())].tobytes())
+            with open(self._file(KEYS_FILE), 'ab') as f:
+                f.write(b"".join(new_keys))
+            self._refresh()
+
+    def encode(self, texts: Sequence[str], encoder: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        متجهات النصوص بالشكل (n, d). يُستدعى encoder مرة واحدة فقط للنصوص غير المخزنة،
+        ولا يُستدعى إطلاقًا إذا كانت كلها مخزنة.
+        """
+        texts = list(texts)
+        found = self.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, found) if vector is None))
+        if missing:
+            logging.info(f"ذاكرة المتجهات الدائمة: {len(texts) - len(missing)} مخزن، {len(missing)} يحتاج إلى ترميز.")
+            encoded = np.asarray(encoder(missing), dtype=np.float32)
+            self.put_many(missing, encoded)
+            by_text = dict(zip(missing, encoded))
+            found = [vector if vector is not None else by_text[text] for text, vector in zip(texts, found)]
+        if not found:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        return np.vstack(found)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._rows), "hits": self.hits, "misses": self.misses}
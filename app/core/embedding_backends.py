@@ -0,0 +1,40 @@
+# app/core/embedding_backends.py
+import logging
+import os
+from typing import Optional
+
+# واجهات الترميز المدعومة. كلاهما يوفر encode(texts, normalize_embeddings=...) بنفس الشكل.
+EMBEDDING_BACKENDS = ("sentence_transformers", "onnx")
+
+
+def load_embedding_model(model_name: str, backend: str = "sentence_transformers",
+                         onnx_model_dir: Optional[str] = None, num_threads: int = 0):
+    """
+    تحميل نموذج التضمين حسب الواجهة المختارة. واجهة onnx تقرأ نموذجًا مُصدَّرًا مسبقًا
+    (python -m app.core.onnx_encoder) ولا تستورد PyTorch.
+    """
+    if backend == "sentence_transformers":
+        from sentence_transformers import SentenceTransformer
+
+        logging.info(f"بدء تحميل نموذج التضمين: {model_name}")
+        return SentenceTransformer(model_name)
+
+    if backend == "onnx":
+        from .onnx_encoder import OnnxEncoder
+
+        if not onnx_model_dir:
+            raise ValueError("واجهة onnx تحتاج إلى مجلد النموذج المُصدَّر (ONNX_MODEL_DIR).")
+        return OnnxEncoder.load(onnx_model_dir, num_threads=num_threads)
+
+    raise ValueError(f"واجهة ترميز غير مدعومة: {backend}. الواجهات المدعومة: {', '.join(EMBEDDING_BACKENDS)}")
+
+
+def embedding_cache_name(model_name: str, backend: str = "sentence_transformers",
+                         onnx_model_dir: Optional[str] = None) -> str:
+    """
+    اسم النموذج في ذاكرة المتجهات الدائمة. متجهات ONNX (خاصة المكمّمة) تختلف قليلًا عن متجهات
+    PyTorch، لذا تُخزَّن في مساحة مستقلة.
+    """
+    if backend == "onnx":
+        return f"{model_name}@onnx:{os.path.basename(os.path.normpath(onnx_model_dir or ''))}"
+    return model_name
@@ -0,0 +1,186 @@
+# app/core/embedding_server.py
+import argparse
+import logging
+import os
+import threading
+from multiprocessing.connection import Client, Listener
+from typing import List, Optional, Union
+
+import numpy as np
+
+# يُشغَّل نموذج التضمين في عملية واحدة مشتركة يستدعيها كل عمال uvicorn عبر مقبس Unix محلي،
+# بدلًا من أن يحمّل كل عامل نسخته الخاصة من النموذج.
+# multiprocessing.connection يفك تسلسل (unpickle) ما يستقبله، لذا لا يعمل الطرفان دون مفتاح سري
+# (EMBEDDING_SERVER_AUTHKEY، لا قيمة افتراضية له)، ويُنشأ المقبس بصلاحيات 0600 داخل مجلد لا
+# يكتب فيه غير مالكه (يُنشأ بصلاحيات 0700 إن لم يكن موجودًا).
+DEFAULT_SOCKET_DIR = "/run/rag-embedding"
+
+
+def require_authkey(authkey: Optional[Union[str, bytes]]) -> bytes:
+    """المفتاح السري بصيغة bytes، أو ValueError إن كان فارغًا."""
+    if isinstance(authkey, str):
+        authkey = authkey.encode("utf-8")
+    if not authkey:
+        raise ValueError(
+            "EMBEDDING_SERVER_AUTHKEY غير مضبوط؛ ولِّد مفتاحًا سريًا عشوائيًا "
+            "(مثل: python -c 'import secrets; print(secrets.token_hex(32))') ومرّره للخادم والعمال."
+        )
+    return authkey
+
+
+def _prepare_socket_dir(address: str) -> None:
+    """إنشاء مجلد المقبس بصلاحيات 0700، ورفض مجلد يستطيع الآخرون الكتابة فيه (مثل /tmp)."""
+    directory = os.path.dirname(os.path.abspath(address))
+    if not os.path.isdir(directory):
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    if os.stat(directory).st_mode & 0o022:
+        raise PermissionError(
+            f"مجلد مقبس خادم التضمين {directory} قابل للكتابة من مستخدمين آخرين؛ استخدم مجلدًا خاصًا (0700)."
+        )
+
+
+class EmbeddingServer:
+    """
+    خادم تضمين محلي: يستقبل طلبات ("encode", texts, normalize) ويعيد مصفوفة float32.
+    كل اتصال يُخدم في خيط مستقل، واستدعاءات النموذج متسلسلة بقفل واحد.
+    """
+
+    def __init__(self, model, address: str, authkey: bytes):
+        self.model = model
+        self.address = address
+        self.authkey = require_authkey(authkey)
+        self._encode_lock = threading.Lock()
+        self._listener: Optional[Listener] = None
+        self._stopped = threading.Event()
+
+    def serve_forever(self) -> None:
+        _prepare_socket_dir(self.address)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        # umask يضمن أن المقبس لا يكون متاحًا للآخرين ولو للحظة قبل chmod
+        previous_umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(previous_umask)
+        os.chmod(self.address, 0o600)
+        logging.info(f"خادم التضمين يستمع على: {self.address}")
+        try:
+            while not self._stopped.is_set():
+                try:
+                    connection = self._listener.accept()
+                except Exception as e:
+                    if self._stopped.is_set():
+                        break
+                    # فشل اتصال واحد (مصادقة، أو انقطاع العميل أثناء المصافحة) لا يوقف الخادم
+                    logging.warning(f"رُفض اتصال بخادم التضمين: {e}")
+                    if isinstance(e, OSError):
+                        # مهلة قصيرة حتى لا يدور الحلق بلا توقف على خطأ دائم (مثل نفاد الواصفات)
+                        self._stopped.wait(0.05)
+                    continue
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def _serve_connection(self, connection) -> None:
+        with connection:
+            while True:
+                try:
+                    command, texts, normalize = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if command != "encode":
+                    connection.send(("error", f"أمر غير معروف: {command}"))
+                    continue
+                try:
+                    with self._encode_lock:
+                        vectors = self.model.encode(texts, convert_to_tensor=False, normalize_embeddings=normalize)
+                    connection.send(("ok", np.asarray(vectors, dtype="float32")))
+                except Exception as e:
+                    logging.error(f"فشل الترميز في خادم التضمين: {e}", exc_info=True)
+                    connection.send(("error", str(e)))
+
+
+class RemoteEncoder:
+    """
+    عميل لخادم التضمين بنفس واجهة SentenceTransformer.encode المستخدمة في Retriever.
+    لكل خيط اتصاله الخاص، ويُعاد الاتصال تلقائيًا مرة واحدة إذا انقطع.
+    """
+
+    def __init__(self, address: str, authkey: bytes):
+        self.address = address
+        self.authkey = require_authkey(authkey)
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            self._local.connection = connection
+        return connection
+
+    def _reset_connection(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+        self._local.connection = None
+
+    def encode(self, sentences: Union[str, List[str]], convert_to_tensor: bool = False,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        for attempt in range(2):
+            try:
+                connection = self._connection()
+                connection.send(("encode", texts, normalize_embeddings))
+                status, payload = connection.recv()
+                break
+            except (EOFError, OSError, ConnectionError):
+                self._reset_connection()
+                if attempt == 1:
+                    raise
+
+        if status != "ok":
+            raise RuntimeError(f"فشل الترميز في خادم التضمين: {payload}")
+        return payload[0] if single else payload
+
+
+def main():
+    from ..config import settings
+    from .embedding_backends import EMBEDDING_BACKENDS, load_embedding_model
+
+    parser = argparse.ArgumentParser(description="خادم تضمين مشترك لعمال uvicorn.")
+    parser.add_argument("--address", default=settings.EMBEDDING_SERVER_ADDRESS or os.path.join(DEFAULT_SOCKET_DIR, "embed.sock"))
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME)
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=settings.EMBEDDING_BACKEND)
+    parser.add_argument("--onnx-model-dir", default=settings.ONNX_MODEL_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    try:
+        authkey = require_authkey(settings.EMBEDDING_SERVER_AUTHKEY)
+    except ValueError as e:
+        parser.error(str(e))
+    logging.info(f"تحميل نموذج التضمين: {args.model} (الواجهة: {args.backend})")
+    server = EmbeddingServer(
+        load_embedding_model(
+            args.model, backend=args.backend, onnx_model_dir=args.onnx_model_dir,
+            num_threads=settings.ONNX_NUM_THREADS,
+        ),
+        address=args.address,
+        authkey=authkey,
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# app/core/gemini_rest.py
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from google.ai import generativelanguage as glm
+from google.generativeai.types import generation_types
+
+# عميل REST غير متزامن لواجهة Gemini (generateContent / streamGenerateContent) يُستخدم عند ضبط
+# GEMINI_API_ENDPOINT، مثلًا لتوجيه الخدمة إلى خادم Gemini المحلي البديل في اختبارات الحمل.
+# مكتبة google-generativeai لا تدعم الاستدعاء غير المتزامن عبر REST، لذا يُرسل الطلب عبر httpx
+# وتُحوَّل الاستجابة إلى كائنات GenerateContentResponse نفسها التي يعالجها generator.
+API_VERSION = "v1beta"
+
+
+def _camel_case(key: str) -> str:
+    head, *tail = key.split("_")
+    return head + "".join(part.title() for part in tail)
+
+
+def _to_response(payload: Dict[str, Any]) -> generation_types.GenerateContentResponse:
+    proto = glm.GenerateContentResponse.from_json(json.dumps(payload), ignore_unknown_fields=True)
+    return generation_types.GenerateContentResponse.from_response(proto)
+
+
+class RestGenerativeModel:
+    """بديل لـ genai.GenerativeModel يوفر generate_content_async (مع stream=True أو بدونه) فقط."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        api_key: str,
+        model_name: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        safety_settings: Optional[List[Dict[str, str]]] = None,
+        timeout: Optional[float] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self.generation_config = {_camel_case(k): v for k, v in (generation_config or {}).items()}
+        self.safety_settings = list(safety_settings or [])
+        self._client = httpx.AsyncClient(
+            base_url=endpoint.rstrip("/"),
+            headers={"x-goog-api-key": api_key},
+            timeout=timeout,
+            transport=transport,
+        )
+
+    def _body(self, prompt: str) -> Dict[str, Any]:
+        return {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": self.generation_config,
+            "safetySettings": self.safety_settings,
+        }
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        if stream:
+            return self._stream(prompt)
+        response = await self._client.post(f"/{API_VERSION}/{self.model_name}:generateContent", json=self._body(prompt))
+        response.raise_for_status()
+        return _to_response(response.json())
+
+    async def _stream(self, prompt: str) -> AsyncIterator[generation_types.GenerateContentResponse]:
+        async with self._client.stream(
+            "POST",
+            f"/{API_VERSION}/{self.model_name}:streamGenerateContent",
+            params={"alt": "sse"},
+            json=self._body(prompt),
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    yield _to_response(json.loads(line[len("data:"):]))
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+        logging.info("تم إغلاق عميل Gemini REST.")
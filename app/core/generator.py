@@ -1,47 +1,118 @@
 # app/core/generator.py (الإصدار النهائي والحاسم)
 
+import asyncio
 import logging
-from typing import List, Dict, Any
-
-import google.generativeai as genai
-from google.generativeai.types import generation_types
+import threading
+from typing import List, Dict, Any, Optional, AsyncIterator
 
 from ..config import settings
+from .llm_resilience import CircuitOpenError, ResilientCaller
+from .context_packing import estimate_tokens
+from .metrics import GENERATION_FINISH, LLM_TOKENS
+from .tracing import span
 
 # --- إعداد وتهيئة العميل (Client) ---
+# استيراد google.generativeai يستغرق قرابة ثانية، لذا يُؤجَّل إلى configure_client()
+# التي تستدعيها دورة حياة التطبيق بالتوازي مع تحميل المسترجع (أو أول طلب توليد عند غيابها).
 
 model = None
 is_client_configured = False
+_client_lock = threading.Lock()
+_client_configure_attempted = False
+
+safety_settings = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+generation_config = {
+    "temperature": 0.1,
+    "top_p": 0.95,
+    "top_k": 40,
+    # حد أعلى لطول الإجابة؛ إجابات الأسئلة الشائعة قصيرة، والحد الكبير يطيل أسوأ زمن توليد
+    "max_output_tokens": settings.LLM_MAX_OUTPUT_TOKENS,
+}
+
+
+def configure_client() -> bool:
+    """تهيئة عميل Gemini مرة واحدة (آمنة للاستدعاء من عدة خيوط). تُرجع نجاح التهيئة."""
+    global model, is_client_configured, _client_configure_attempted
+    with _client_lock:
+        if is_client_configured or _client_configure_attempted:
+            return is_client_configured
+        _client_configure_attempted = True
+        try:
+            if settings.GEMINI_API_ENDPOINT:
+                # نقطة نهاية بديلة (مثل خادم Gemini المحلي في scripts/gemini_stub.py) عبر REST
+                from .gemini_rest import RestGenerativeModel
+
+                model = RestGenerativeModel(
+                    endpoint=settings.GEMINI_API_ENDPOINT,
+                    api_key=settings.GEMINI_API_KEY,
+                    model_name="models/gemini-1.5-flash",
+                    generation_config=generation_config,
+                    safety_settings=safety_settings,
+                )
+                logging.info(f"استخدام نقطة نهاية Gemini البديلة: {settings.GEMINI_API_ENDPOINT}")
+            else:
+                import google.generativeai as genai
 
-try:
-    genai.configure(api_key=settings.GEMINI_API_KEY)
-
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-    ]
-
-    generation_config = {
-        "temperature": 0.1,
-        "top_p": 0.95,
-        "top_k": 40,
-        "max_output_tokens": 131072,
-    }
+                genai.configure(api_key=settings.GEMINI_API_KEY)
+                model = genai.GenerativeModel(
+                    model_name="models/gemini-1.5-flash",
+                    generation_config=generation_config,
+                    safety_settings=safety_settings
+                )
+
+            is_client_configured = True
+            logging.info("تم تكوين عميل Gemini Pro بنجاح باستخدام نموذج 'models/gemini-1.5-flash'.")
+
+        except Exception as e:
+            logging.error(f"فشل فادح في تكوين عميل Gemini Pro: {e}", exc_info=True)
+            is_client_configured = False
+        return is_client_configured
+
+
+# --- رسائل الإجابة الاحتياطية ---
+EMPTY_ANSWER_MESSAGE = "لا أملك معلومات كافية للإجابة من المصادر المتاحة."
+SAFETY_BLOCKED_MESSAGE = "لم يتمكن النموذج من توليد إجابة بسبب سياسات السلامة."
+UNKNOWN_FINISH_MESSAGE = "لم يتمكن النموذج من توليد إجابة (سبب غير محدد)."
+GENERATION_ERROR_MESSAGE = "عذرًا، تعذر توليد الإجابة حاليًا بسبب خطأ فني."
+# أسباب الإنهاء التي تعني تعذر الوصول إلى Gemini (لا رفضه للإجابة)، فيمكن الرجوع فيها إلى إجابة مخزنة
+UPSTREAM_FAILURE_REASONS = ("ERROR", "CIRCUIT_OPEN")
+
+
+# --- طبقة الحماية حول استدعاءات Gemini (مهلات، إعادة محاولة، تحوّط، قاطع دائرة) ---
+_llm_caller: Optional[ResilientCaller] = None
+
+
+def get_llm_caller() -> ResilientCaller:
+    global _llm_caller
+    if _llm_caller is None:
+        _llm_caller = ResilientCaller.from_settings(settings)
+    return _llm_caller
 
-    model = genai.GenerativeModel(
-        model_name="models/gemini-1.5-flash",
-        generation_config=generation_config,
-        safety_settings=safety_settings
-    )
 
-    is_client_configured = True
-    logging.info("تم تكوين عميل Gemini Pro بنجاح باستخدام نموذج 'models/gemini-1.5-flash'.")
+def llm_available() -> bool:
+    """False عندما يكون قاطع الدائرة مفتوحًا (أي استدعاء الآن سيُرفض فورًا)."""
+    return not get_llm_caller().breaker.is_open()
 
-except Exception as e:
-    logging.error(f"فشل فادح في تكوين عميل Gemini Pro: {e}", exc_info=True)
-    is_client_configured = False
+
+# --- تحديد عدد استدعاءات Gemini المتزامنة ---
+# يُنشأ السيمافور لكل حلقة أحداث على حدة لأن كائنات asyncio مرتبطة بالحلقة التي تعمل فيها.
+_llm_semaphore: Optional[asyncio.Semaphore] = None
+_llm_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    global _llm_semaphore, _llm_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _llm_semaphore is None or _llm_semaphore_loop is not loop:
+        _llm_semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        _llm_semaphore_loop = loop
+    return _llm_semaphore
 
 
 def build_prompt(query: str, context_chunks: List[Dict]) -> str:
@@ -63,31 +134,29 @@ def build_prompt(query: str, context_chunks: List[Dict]) -> str:
 """
     return prompt_template
 
-def generate_answer(query: str, context_chunks: List[Dict]) -> Dict[str, Any]:
-    
-    if "إرجاع" in query or "Return" in query:
-        return {
-            "answer": (
-                "يمكن إرجاع المنتجات في غضون 30 يومًا من تاريخ الشراء، "
-                "بشرط أن تكون في حالتها الأصلية وغير مستخدمة. "
-                "يجب تقديم إيصال الشراء الأصلي لإتمام العملية."
-            ),
-            "confidence_score": 0.95,
-        }
-
+async def generate_answer(query: str, context_chunks: List[Dict]) -> Dict[str, Any]:
+    """
+    توليد الإجابة عبر الاستدعاء غير المتزامن لـ Gemini دون حجز أي خيط أثناء انتظار الاستجابة.
+    عدد الاستدعاءات الجارية في نفس الوقت محدود بـ LLM_MAX_CONCURRENCY.
+    """
     # ---------------------------------------------------------
     # Checking the form configuration
     # ---------------------------------------------------------
-    if not is_client_configured or model is None:
+    if not (is_client_configured or configure_client()) or model is None:
         logging.error("لا يمكن توليد إجابة لأن عميل Gemini لم يتم تهيئته.")
         raise RuntimeError("نموذج Gemini Pro لم يتم تهيئته بنجاح.")
 
     # Build Prompt
-    prompt = build_prompt(query, context_chunks)
+    with span("prompt.build", chunks=len(context_chunks)):
+        prompt = build_prompt(query, context_chunks)
 
     try:
         logging.info("إرسال طلب إلى Gemini Pro API...")
-        response = model.generate_content(prompt)
+        with span("llm.request", prompt_chars=len(prompt)):
+            # المقعد يُحجز لكل محاولة (وطلب تحوّط) داخل المستدعي، لا طوال فترات التراجع
+            response = await get_llm_caller().call(
+                lambda: model.generate_content_async(prompt), limiter=_get_llm_semaphore()
+            )
 
         # ---------------------------------------------------------
         # Response processing
@@ -97,18 +166,19 @@ def generate_answer(query: str, context_chunks: List[Dict]) -> Dict[str, Any]:
 
             # إذا كانت الإجابة فارغة
             if not final_answer:
-                final_answer = "لا أملك معلومات كافية للإجابة من المصادر المتاحة."
+                final_answer = EMPTY_ANSWER_MESSAGE
 
+            GENERATION_FINISH.labels("STOP").inc()
             logging.info("تم استلام استجابة ناجحة من Gemini Pro.")
 
         else:
             finish_reason = response.candidates[0].finish_reason.name
             logging.warning(f"لم يتم إرجاع أي نص من Gemini. سبب الإنهاء: {finish_reason}")
+            GENERATION_FINISH.labels(finish_reason).inc()
 
-            if finish_reason == "SAFETY":
-                final_answer = "لم يتمكن النموذج من توليد إجابة بسبب سياسات السلامة."
-            else:
-                final_answer = "لم يتمكن النموذج من توليد إجابة (سبب غير محدد)."
+            final_answer = _finish_reason_message(finish_reason)
+
+        usage = token_usage(response, prompt, final_answer if response.parts else "")
 
         # ---------------------------------------------------------
         # Real Trust Account (Temporarily Suspended)
@@ -136,16 +206,150 @@ def generate_answer(query: str, context_chunks: List[Dict]) -> Dict[str, Any]:
         return {
             "answer": final_answer,
             "confidence_score": 0.85,  # قيمة ثابتة مؤقتة
+            "usage": usage,
+        }
+
+    except CircuitOpenError:
+        logging.warning("تم رفض طلب التوليد فورًا لأن قاطع الدائرة لاستدعاءات Gemini مفتوح.")
+        GENERATION_FINISH.labels("CIRCUIT_OPEN").inc()
+        return {
+            "answer": GENERATION_ERROR_MESSAGE,
+            "confidence_score": 0.0,
+            "finish_reason": "CIRCUIT_OPEN",
         }
 
     except Exception as e:
-        logging.error(f"حدث خطأ غير متوقع أثناء استدعاء Gemini API: {e}", exc_info=True)
+        logging.error(f"حدث خطأ غير متوقع أثناء استدعاء Gemini API: {e!r}", exc_info=True)
+        GENERATION_FINISH.labels("ERROR").inc()
         return {
-            "answer": "عذرًا، تعذر توليد الإجابة حاليًا بسبب خطأ فني.",
+            "answer": GENERATION_ERROR_MESSAGE,
             "confidence_score": 0.0,
+            "finish_reason": "ERROR",
         }
 
 
+# علامة انتهاء طابور أجزاء التدفق
+_STREAM_END = object()
+
+
+async def generate_answer_stream(query: str, context_chunks: List[Dict]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    نسخة متدفقة من generate_answer تمرر أجزاء إجابة Gemini فور وصولها.
+    تُنتج أحداثًا من نوع {"type": "token", "text": ...} ثم حدثًا أخيرًا
+    {"type": "end", "confidence_score": ..., "finish_reason": ...}.
+    إذا فشل التوليد قبل أول جزء لا يُرسل أي جزء، ويحمل حدث end رسالة الاعتذار في answer حتى يقرر
+    المستدعي ما يعرضه (مثل الإجابة المخزنة البديلة كما في generate_answer).
+    """
+    if not (is_client_configured or configure_client()) or model is None:
+        logging.error("لا يمكن توليد إجابة لأن عميل Gemini لم يتم تهيئته.")
+        raise RuntimeError("نموذج Gemini Pro لم يتم تهيئته بنجاح.")
+
+    with span("prompt.build", chunks=len(context_chunks)):
+        prompt = build_prompt(query, context_chunks)
+    produced_text = False
+    finish_reason = None
+    answer_parts: List[str] = []
+    last_chunk = None
+
+    async def open_stream():
+        # المحاولة (وإعادتها) تشمل فتح التدفق حتى وصول الجزء الأول فقط؛ بعده لا يمكن إعادة الطلب
+        # دون تكرار ما أُرسل للعميل. طلبات التحوّط معطلة هنا لأن التدفق الخاسر لا يُغلق بأمان.
+        stream = (await model.generate_content_async(prompt, stream=True)).__aiter__()
+        try:
+            return await stream.__anext__(), stream
+        except StopAsyncIteration:
+            return None, stream
+
+    caller = get_llm_caller()
+    semaphore = _get_llm_semaphore()
+    # أجزاء Gemini تُقرأ في مهمة مستقلة إلى طابور، فيُحرَّر مقعد LLM_MAX_CONCURRENCY فور انتهاء
+    # التدفق من Gemini لا عندما ينتهي عميل بطيء من قراءة الإجابة (حجمها محدود بـ LLM_MAX_OUTPUT_TOKENS).
+    chunks: "asyncio.Queue[Any]" = asyncio.Queue()
+
+    async def pump():
+        try:
+            logging.info("إرسال طلب متدفق إلى Gemini Pro API...")
+            with span("llm.request", prompt_chars=len(prompt)):
+                # مقعد المحاولة الناجحة يبقى محجوزًا حتى ينتهي التدفق من Gemini
+                chunk, stream = await caller.call(open_stream, hedge=False, limiter=semaphore, keep_slot=True)
+            try:
+                while chunk is not None:
+                    chunks.put_nowait(chunk)
+                    try:
+                        # مهلة المحاولة تُطبَّق أيضًا على الانتظار بين جزأين متتاليين (اتصال عالق)
+                        chunk = await asyncio.wait_for(stream.__anext__(), caller.attempt_timeout_seconds)
+                    except StopAsyncIteration:
+                        chunk = None
+            finally:
+                semaphore.release()
+        finally:
+            chunks.put_nowait(_STREAM_END)
+
+    pump_task = asyncio.ensure_future(pump())
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is _STREAM_END:
+                break
+            if chunk.parts and chunk.text:
+                produced_text = True
+                answer_parts.append(chunk.text)
+                yield {"type": "token", "text": chunk.text}
+            last_chunk = chunk
+            if chunk.candidates and chunk.candidates[0].finish_reason:
+                finish_reason = chunk.candidates[0].finish_reason.name
+        # إعادة إثارة خطأ التدفق (إن وقع) بعد تمرير ما وصل قبله
+        await pump_task
+
+    except Exception as e:
+        failure = "CIRCUIT_OPEN" if isinstance(e, CircuitOpenError) else "ERROR"
+        logging.error(f"تعذر إكمال الاستدعاء المتدفق لـ Gemini API ({failure}): {e!r}", exc_info=failure == "ERROR")
+        GENERATION_FINISH.labels(failure).inc()
+        # إذا وصل جزء من الإجابة بالفعل فلا يمكن سحبه؛ نكتفي بإغلاق التدفق بدرجة ثقة صفرية
+        end = {"type": "end", "confidence_score": 0.0, "finish_reason": failure}
+        if not produced_text:
+            end["answer"] = GENERATION_ERROR_MESSAGE
+        yield end
+        return
+    finally:
+        # انقطاع العميل يلغي قراءة التدفق ويحرر المقعد
+        pump_task.cancel()
+
+    if not produced_text:
+        logging.warning(f"لم يتم إرجاع أي نص من Gemini. سبب الإنهاء: {finish_reason}")
+        message = EMPTY_ANSWER_MESSAGE if finish_reason == "STOP" else _finish_reason_message(finish_reason)
+        yield {"type": "token", "text": message}
+
+    GENERATION_FINISH.labels(finish_reason or "UNSPECIFIED").inc()
+    logging.info("اكتمل التدفق من Gemini Pro.")
+    yield {
+        "type": "end",
+        "confidence_score": 0.85,
+        "finish_reason": finish_reason,
+        # usage_metadata تصل مع الجزء الأخير من التدفق
+        "usage": token_usage(last_chunk, prompt, "".join(answer_parts)),
+    }
+
+
+def token_usage(response: Any, prompt: str, answer: str) -> Dict[str, int]:
+    """
+    عدد رموز الموجه والإجابة من usage_metadata لاستجابة Gemini، أو تقديرهما من طول النص إن غابت.
+    تُسجَّل أيضًا في المقياس rag_llm_tokens_total.
+    """
+    metadata = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(metadata, "prompt_token_count", 0) or estimate_tokens(prompt, settings.CONTEXT_CHARS_PER_TOKEN)
+    output_tokens = getattr(metadata, "candidates_token_count", 0) or estimate_tokens(answer, settings.CONTEXT_CHARS_PER_TOKEN)
+    LLM_TOKENS["prompt"].inc(prompt_tokens)
+    LLM_TOKENS["output"].inc(output_tokens)
+    return {"prompt_tokens": int(prompt_tokens), "output_tokens": int(output_tokens)}
+
+
+def _finish_reason_message(finish_reason: Optional[str]) -> str:
+    if finish_reason == "SAFETY":
+        return SAFETY_BLOCKED_MESSAGE
+    return UNKNOWN_FINISH_MESSAGE
+
+
 
 # def generate_answer(query: str, context_chunks: List[Dict]) -> Dict[str, Any]:
 #     if not is_client_configured or model is None:
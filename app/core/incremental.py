@@ -0,0 +1,98 @@
+# app/core/incremental.py
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+import faiss
+import numpy as np
+
+from .indexing import vector_ids_for
+
+
+@dataclass
+class IngestPlan:
+    """
+    الفرق بين إصدارين من قاعدة المعرفة: السجلات الجديدة والمعدّلة تحتاج إلى ترميز،
+    والسجلات المعدّلة والمحذوفة تُزال متجهاتها القديمة من الفهرس.
+    """
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def to_embed(self) -> List[str]:
+        return self.added + self.changed
+
+    @property
+    def to_remove(self) -> List[str]:
+        return self.changed + self.removed
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.changed or self.removed)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def content_hashes(records: Iterable[Dict], text_field: str = "chunk_text") -> Dict[str, str]:
+    """بصمة المحتوى لكل سجل، مفهرسة بمعرّف السجل."""
+    hashes: Dict[str, str] = {}
+    for record in records:
+        record_id = str(record["id"])
+        if record_id in hashes:
+            raise ValueError(f"معرّف سجل مكرر في قاعدة المعرفة: {record_id}")
+        hashes[record_id] = content_hash(record[text_field])
+    return hashes
+
+
+def plan_incremental_update(previous: Dict[str, str], current: Dict[str, str]) -> IngestPlan:
+    plan = IngestPlan()
+    for record_id, digest in current.items():
+        previous_digest = previous.get(record_id)
+        if previous_digest is None:
+            plan.added.append(record_id)
+        elif previous_digest != digest:
+            plan.changed.append(record_id)
+        else:
+            plan.unchanged += 1
+    plan.removed = [record_id for record_id in previous if record_id not in current]
+    return plan
+
+
+def apply_incremental_update(index: faiss.Index, plan: IngestPlan, embeddings: Optional[np.ndarray]) -> None:
+    """
+    حذف متجهات السجلات المعدّلة والمحذوفة ثم إضافة متجهات السجلات الجديدة والمعدّلة
+    بمعرّفاتها الثابتة. ترتيب صفوف embeddings يطابق plan.to_embed.
+    """
+    if plan.to_remove:
+        removed = index.remove_ids(vector_ids_for(plan.to_remove))
+        if removed != len(plan.to_remove):
+            raise ValueError(f"عدد المتجهات المحذوفة ({removed}) لا يطابق الخطة ({len(plan.to_remove)}).")
+    if plan.to_embed:
+        index.add_with_ids(embeddings, vector_ids_for(plan.to_embed))
+
+
+def content_hashes_path(index_path: str) -> str:
+    """مسار بصمات المحتوى المرافق لملف الفهرس (index_v1.faiss -> index_v1.hashes.json)."""
+    base, _ = os.path.splitext(index_path)
+    return f"{base}.hashes.json"
+
+
+def save_content_hashes(index_path: str, hashes: Dict[str, str]) -> None:
+    with open(content_hashes_path(index_path), 'w', encoding='utf-8') as f:
+        json.dump(hashes, f, ensure_ascii=False)
+
+
+def load_content_hashes(index_path: str) -> Optional[Dict[str, str]]:
+    path = content_hashes_path(index_path)
+    if not os.path.exists(path):
+        logging.warning(f"لم يُعثر على بصمات المحتوى ({path}).")
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,189 @@
+# app/core/index_registry.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set
+
+from .retriever import Retriever
+from .singleflight import SingleFlight
+
+# فهارس مسماة إضافية (مثل قاعدة معرفة لكل خط منتجات) تُخدم من العملية نفسها بجانب الفهرس
+# الافتراضي وتتشارك نموذج التضمين وذاكرة متجهات الاستعلامات المؤقتة. يُحمَّل كل فهرس عند أول
+# طلب يوجَّه إليه، وتُبقى الفهارس المحمَّلة ضمن ميزانية ذاكرة بإخراج الأقل استخدامًا مؤخرًا (LRU).
+# الفهرس المُخرج يبقى صالحًا للطلبات الجارية التي حجزته عبر acquire، ويُغلق (ملفاته وmmap بياناته
+# الوصفية) عند تحرير آخرها، أو فورًا إن لم يكن محجوزًا.
+# عدد محاولات acquire عندما يُخرج الفهرس بين انتهاء تحميله واستئناف الطلب الذي ينتظره
+ACQUIRE_ATTEMPTS = 3
+
+
+class UnknownIndexError(KeyError):
+    """اسم فهرس غير موجود في NAMED_INDEXES."""
+
+
+class _Resident:
+    __slots__ = ("retriever", "footprint_bytes", "hits", "last_used")
+
+    def __init__(self, retriever: Retriever, footprint_bytes: int):
+        self.retriever = retriever
+        self.footprint_bytes = footprint_bytes
+        self.hits = 0
+        self.last_used = time.monotonic()
+
+
+class IndexRegistry:
+    """
+    indexes: اسم الفهرس -> إصدار الفهرس (ملفات data/index_<version>.faiss وما يرافقها).
+    shared_retriever: دالة تُرجع المسترجع الذي يُستعار منه نموذج التضمين وذاكرة المتجهات (أو None).
+    on_evict: دالة تُستدعى بإصدار الفهرس المُخرج (مثلًا لحذف إجاباته من ذاكرة الإجابات).
+    """
+
+    def __init__(self, indexes: Dict[str, str], memory_budget_bytes: int,
+                 shared_retriever: Callable[[], Optional[Retriever]] = lambda: None,
+                 warmup_queries: Optional[list] = None,
+                 on_evict: Callable[[str], None] = lambda index_version: None):
+        self.indexes = dict(indexes)
+        self.memory_budget_bytes = memory_budget_bytes
+        self._shared_retriever = shared_retriever
+        self._warmup_queries = warmup_queries or []
+        self._on_evict = on_evict
+        self._resident: "OrderedDict[str, _Resident]" = OrderedDict()
+        # الطلبات الأولى المتزامنة لفهرس غير محمَّل تنتظر تحميلًا واحدًا
+        self._loads = SingleFlight()
+        self._shared_model = None
+        # المسترجع -> عدد الطلبات الجارية التي تحجزه، والمسترجعات المُخرجة التي تنتظر تحريرها لتُغلق
+        self._leases: Dict[Retriever, int] = {}
+        self._draining: Set[Retriever] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_failures = 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.indexes
+
+    def resident(self) -> Dict[str, _Resident]:
+        return dict(self._resident)
+
+    def resident_bytes(self) -> int:
+        return sum(entry.footprint_bytes for entry in self._resident.values())
+
+    async def get(self, name: str) -> Retriever:
+        if name not in self.indexes:
+            raise UnknownIndexError(name)
+        entry = self._resident.get(name)
+        if entry is not None:
+            self._resident.move_to_end(name)
+            entry.hits += 1
+            entry.last_used = time.monotonic()
+            self.hits += 1
+            return entry.retriever
+
+        self.misses += 1
+        retriever, _ = await self._loads.do(name, lambda: self._load(name))
+        return retriever
+
+    async def acquire(self, name: str) -> Retriever:
+        """
+        مثل get، مع حجز المسترجع للطلب حتى يُستدعى release: إخراجه من الذاكرة في أثناء ذلك
+        يؤجل إغلاقه إلى أن يحرره آخر طلب.
+        """
+        for _ in range(ACQUIRE_ATTEMPTS):
+            retriever = await self.get(name)
+            entry = self._resident.get(name)
+            if entry is not None and entry.retriever is retriever:
+                break
+            # أُخرج الفهرس (وأُغلق) قبل أن يُستأنف هذا الطلب بعد تحميله؛ نطلبه من جديد
+        self._leases[retriever] = self._leases.get(retriever, 0) + 1
+        return retriever
+
+    def release(self, retriever: Retriever) -> None:
+        """تحرير حجز acquire؛ لا يفعل شيئًا لمسترجع لم يُحجز من هذا السجل (مثل الافتراضي)."""
+        count = self._leases.get(retriever)
+        if count is None:
+            return
+        if count > 1:
+            self._leases[retriever] = count - 1
+            return
+        del self._leases[retriever]
+        if retriever in self._draining:
+            self._draining.discard(retriever)
+            self._close(retriever)
+
+    async def _load(self, name: str) -> Retriever:
+        index_version = self.indexes[name]
+        shared = self._shared_retriever()
+        model = self._shared_model
+        if model is None and shared is not None and shared.is_ready:
+            model = shared.model
+        logging.info(f"تحميل الفهرس المسمى '{name}' (الإصدار: {index_version}) عند أول طلب...")
+        start = time.perf_counter()
+        retriever = Retriever(index_version=index_version, model=model)
+        if shared is not None and shared.query_cache is not None:
+            # النموذج نفسه يعطي المتجه نفسه للاستعلام، فلا داعي لترميزه مرة لكل فهرس
+            retriever.query_cache = shared.query_cache
+        try:
+            await asyncio.to_thread(retriever.load)
+            if self._warmup_queries:
+                await asyncio.to_thread(retriever.warmup, self._warmup_queries)
+        except Exception:
+            self.load_failures += 1
+            raise
+        self._shared_model = retriever.model
+
+        entry = _Resident(retriever, retriever.footprint_bytes())
+        self._resident[name] = entry
+        self._evict(keep=name)
+        logging.info(
+            f"تم تحميل الفهرس '{name}' في {(time.perf_counter() - start) * 1000:.0f}ms "
+            f"({entry.footprint_bytes / 2**20:.1f} MB؛ المحمَّل: {self.resident_bytes() / 2**20:.1f} MB)."
+        )
+        return retriever
+
+    def _evict(self, keep: str) -> None:
+        """إخراج الفهارس الأقل استخدامًا مؤخرًا حتى تعود الذاكرة ضمن الميزانية (عدا الفهرس keep)."""
+        while self.resident_bytes() > self.memory_budget_bytes:
+            victim = next((name for name in self._resident if name != keep), None)
+            if victim is None:
+                logging.warning(f"الفهرس '{keep}' وحده يتجاوز ميزانية الذاكرة INDEX_MEMORY_BUDGET_MB.")
+                return
+            entry = self._resident.pop(victim)
+            self.evictions += 1
+            logging.info(f"إخراج الفهرس '{victim}' من الذاكرة ({entry.footprint_bytes / 2**20:.1f} MB).")
+            self._on_evict(entry.retriever.index_version)
+            if entry.retriever in self._leases:
+                # طلبات جارية ما زالت تستخدمه؛ يُغلق عند تحرير آخرها
+                self._draining.add(entry.retriever)
+            else:
+                self._close(entry.retriever)
+
+    @staticmethod
+    def _close(retriever: Retriever) -> None:
+        try:
+            retriever.close()
+        except Exception as e:
+            logging.warning(f"تعذر إغلاق موارد الفهرس {retriever.index_version}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        requests = self.hits + self.misses
+        return {
+            "configured": sorted(self.indexes),
+            "resident": {
+                name: {
+                    "index_version": entry.retriever.index_version,
+                    "memory_mb": entry.footprint_bytes / 2**20,
+                    "hits": entry.hits,
+                    "idle_seconds": now - entry.last_used,
+                }
+                for name, entry in self._resident.items()
+            },
+            "memory_mb": self.resident_bytes() / 2**20,
+            "memory_budget_mb": self.memory_budget_bytes / 2**20,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+            "evictions": self.evictions,
+            "draining": len(self._draining),
+            "load_failures": self.load_failures,
+        }
@@ -0,0 +1,220 @@
+# app/core/indexing.py
+import hashlib
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, fields
+from typing import Iterable, Optional
+
+import faiss
+import numpy as np
+
+# أنواع الفهارس المدعومة
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# الأنواع التي تدعم حذف المتجهات (remove_ids)، وبالتالي التحديث التزايدي للفهرس
+INCREMENTAL_INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq")
+
+
+@dataclass
+class IndexConfig:
+    """
+    إعدادات بناء فهرس FAISS والبحث فيه. تُحفظ بجانب ملف الفهرس
+    حتى يطبّق Retriever معاملات البحث المطابقة تلقائيًا عند التحميل.
+    """
+    index_type: str = "flat"
+    # "ip": الضرب الداخلي على متجهات مُطبَّعة (درجة التشابه = تشابه جيب التمام)
+    # "l2": المسافة الإقليدية (الفهارس القديمة المبنية قبل ملف الإعدادات)
+    metric: str = "ip"
+    # IVF
+    nlist: int = 100
+    nprobe: int = 10
+    # PQ
+    pq_m: int = 16
+    pq_nbits: int = 8
+    # HNSW
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+
+    def __post_init__(self):
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"نوع فهرس غير مدعوم: {self.index_type}. الأنواع المدعومة: {', '.join(INDEX_TYPES)}")
+        if self.metric not in ("ip", "l2"):
+            raise ValueError(f"مقياس غير مدعوم: {self.metric}")
+
+    @property
+    def faiss_metric(self) -> int:
+        return faiss.METRIC_INNER_PRODUCT if self.metric == "ip" else faiss.METRIC_L2
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IndexConfig":
+        known = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+
+def index_config_path(index_path: str) -> str:
+    """مسار ملف الإعدادات المرافق لملف الفهرس (index_v1.faiss -> index_v1.config.json)."""
+    base, _ = os.path.splitext(index_path)
+    return f"{base}.config.json"
+
+
+def save_index_config(index_path: str, config: IndexConfig) -> None:
+    with open(index_config_path(index_path), 'w', encoding='utf-8') as f:
+        json.dump(config.to_dict(), f, indent=4)
+
+
+def load_index_config(index_path: str) -> IndexConfig:
+    """
+    تحميل إعدادات الفهرس. الفهارس القديمة بدون ملف إعدادات هي IndexFlatL2.
+    """
+    path = index_config_path(index_path)
+    if not os.path.exists(path):
+        logging.warning(f"لم يُعثر على ملف إعدادات الفهرس ({path})؛ سيُفترض فهرس Flat بمسافة L2.")
+        return IndexConfig(index_type="flat", metric="l2")
+    with open(path, 'r', encoding='utf-8') as f:
+        return IndexConfig.from_dict(json.load(f))
+
+
+def build_index(dimension: int, config: IndexConfig, num_vectors: Optional[int] = None) -> faiss.Index:
+    """
+    إنشاء فهرس FAISS فارغ حسب الإعدادات. الفهارس من نوع IVF تحتاج إلى train_index قبل الإضافة.
+    """
+    metric = config.faiss_metric
+
+    if config.index_type == "flat":
+        return faiss.IndexFlatIP(dimension) if config.metric == "ip" else faiss.IndexFlatL2(dimension)
+
+    if config.index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, config.hnsw_m, metric)
+        index.hnsw.efConstruction = config.ef_construction
+        return index
+
+    nlist = config.nlist
+    if num_vectors is not None and num_vectors < nlist:
+        # لا يمكن تدريب عدد من المراكز أكبر من عدد المتجهات
+        logging.warning(f"عدد المتجهات ({num_vectors}) أقل من nlist ({nlist})؛ سيتم استخدام nlist={num_vectors}.")
+        nlist = max(1, num_vectors)
+        config.nlist = nlist
+        config.nprobe = min(config.nprobe, nlist)
+
+    quantizer = faiss.IndexFlatIP(dimension) if config.metric == "ip" else faiss.IndexFlatL2(dimension)
+    if config.index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+
+    if dimension % config.pq_m != 0:
+        raise ValueError(f"يجب أن تكون أبعاد المتجه ({dimension}) من مضاعفات pq_m ({config.pq_m}).")
+    if num_vectors is not None and num_vectors < 2 ** config.pq_nbits:
+        raise ValueError(
+            f"فهرس IVF-PQ مع pq_nbits={config.pq_nbits} يحتاج إلى {2 ** config.pq_nbits} متجه على الأقل للتدريب "
+            f"(المتوفر: {num_vectors}). استخدم قيمة pq_nbits أصغر أو نوع فهرس آخر."
+        )
+    return faiss.IndexIVFPQ(quantizer, dimension, nlist, config.pq_m, config.pq_nbits, metric)
+
+
+def build_id_mapped_index(dimension: int, config: IndexConfig, num_vectors: Optional[int] = None) -> faiss.Index:
+    """
+    إنشاء فهرس تُضاف إليه المتجهات بمعرّفات صريحة (add_with_ids). فهارس IVF تدعم ذلك مباشرة،
+    أما Flat وHNSW فتُغلَّف بـ IndexIDMap2.
+    """
+    index = build_index(dimension, config, num_vectors=num_vectors)
+    if config.index_type in ("ivf_flat", "ivf_pq"):
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def record_vector_id(record_id: str) -> int:
+    """
+    معرّف متجه ثابت (int64 موجب) مشتق من معرّف السجل، فيبقى نفسه بين إصدارات الفهرس.
+    """
+    digest = hashlib.blake2b(str(record_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & 0x7FFFFFFFFFFFFFFF
+
+
+def vector_ids_for(record_ids: Iterable[str]) -> np.ndarray:
+    ids = np.fromiter((record_vector_id(record_id) for record_id in record_ids), dtype=np.int64)
+    if len(np.unique(ids)) != len(ids):
+        raise ValueError("معرّفات السجلات مكررة أو تتصادم معرّفات متجهاتها.")
+    return ids
+
+
+def vector_ids_path(index_path: str) -> str:
+    """مسار معرّفات المتجهات بترتيب صفوف البيانات الوصفية (index_v1.faiss -> index_v1.ids.npy)."""
+    base, _ = os.path.splitext(index_path)
+    return f"{base}.ids.npy"
+
+
+def save_vector_ids(index_path: str, ids: np.ndarray) -> None:
+    np.save(vector_ids_path(index_path), np.asarray(ids, dtype=np.int64))
+
+
+class VectorIdMap:
+    """
+    تحويل معرّفات المتجهات التي يُرجعها index.search إلى أرقام صفوف البيانات الوصفية
+    ببحث ثنائي متجه على نسخة مرتبة من المعرّفات.
+    """
+
+    def __init__(self, ids: np.ndarray):
+        ids = np.asarray(ids, dtype=np.int64)
+        self._ids = ids
+        self._order = np.argsort(ids, kind="stable")
+        self._sorted_ids = ids[self._order]
+
+    def __len__(self) -> int:
+        return len(self._sorted_ids)
+
+    def rows(self, vector_ids: np.ndarray) -> np.ndarray:
+        """أرقام الصفوف المقابلة، و-1 للمعرّفات غير الموجودة (مثل حشو -1 من FAISS)."""
+        vector_ids = np.asarray(vector_ids, dtype=np.int64)
+        if len(self._sorted_ids) == 0:
+            return np.full(vector_ids.shape, -1, dtype=np.int64)
+        positions = np.clip(np.searchsorted(self._sorted_ids, vector_ids), 0, len(self._sorted_ids) - 1)
+        found = self._sorted_ids[positions] == vector_ids
+        return np.where(found, self._order[positions], -1)
+
+    def ids_for_rows(self, rows: np.ndarray) -> np.ndarray:
+        """العملية العكسية: معرّفات المتجهات لأرقام صفوف البيانات الوصفية."""
+        return self._ids[np.asarray(rows, dtype=np.int64)]
+
+
+def load_vector_ids(index_path: str) -> Optional[VectorIdMap]:
+    """
+    تحميل معرّفات المتجهات. الفهارس المبنية بدونها تستخدم رقم الصف نفسه كمعرّف.
+    """
+    path = vector_ids_path(index_path)
+    if not os.path.exists(path):
+        return None
+    return VectorIdMap(np.load(path))
+
+
+def train_index(index: faiss.Index, vectors: np.ndarray) -> None:
+    if not index.is_trained:
+        logging.info(f"تدريب الفهرس على {len(vectors)} متجه...")
+        index.train(vectors)
+
+
+def apply_search_params(index: faiss.Index, config: IndexConfig) -> None:
+    """
+    تطبيق معاملات وقت البحث (nprobe أو efSearch) على الفهرس المحمَّل، بما في ذلك الفهارس المغلّفة.
+    """
+    if config.index_type in ("ivf_flat", "ivf_pq"):
+        faiss.extract_index_ivf(index).nprobe = config.nprobe
+        logging.info(f"تم ضبط nprobe={config.nprobe}")
+    elif config.index_type == "hnsw":
+        inner = index
+        while not hasattr(inner, "hnsw") and hasattr(inner, "index"):
+            inner = faiss.downcast_index(inner.index)
+        inner.hnsw.efSearch = config.ef_search
+        logging.info(f"تم ضبط efSearch={config.ef_search}")
+
+
+def distances_to_scores(distances: np.ndarray, config: IndexConfig) -> np.ndarray:
+    """
+    تحويل مخرجات index.search إلى درجات تشابه. مع المقياس "ip" على متجهات مُطبَّعة
+    تكون القيمة نفسها تشابه جيب التمام.
+    """
+    if config.metric == "ip":
+        return distances
+    return 1 - distances
@@ -0,0 +1,404 @@
+# app/core/ingestion_pipeline.py
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import faiss
+import numpy as np
+
+from .incremental import content_hash, content_hashes_path
+from .indexing import (
+    IndexConfig,
+    build_id_mapped_index,
+    record_vector_id,
+    save_index_config,
+    vector_ids_for,
+    vector_ids_path,
+)
+from .lexical_index import BM25Builder, lexical_index_path
+from .metadata_store import ColumnarMetadataWriter, metadata_store_path
+
+# خط استيعاب متدفق: قراءة السجلات تدريجيًا، تقسيمها في مجموعة عمليات، ترميزها في دفعات
+# ثابتة الحجم وإضافة كل دفعة إلى الفهرس مباشرة، مع نقاط حفظ تسمح باستئناف البناء.
+# الذاكرة المستخدمة محدودة بحجم النافذة والدفعة، لا بحجم المجموعة كاملة
+# (باستثناء مفردات الفهرس المعجمي وأطوال مستنداته، وفحص تكرار معرّفات المتجهات: 8 بايت لكل صف).
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+READ_BLOCK_SIZE = 1 << 20
+
+
+def iter_json_records(path: str) -> Iterator[Dict]:
+    """
+    قراءة السجلات تدريجيًا من ملف JSONL (سجل في كل سطر) أو من ملف JSON يحتوي على مصفوفة سجلات،
+    دون تحميل الملف كاملًا في الذاكرة.
+    """
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ""
+        position = 0
+        started = False
+        while True:
+            # تخطي المسافات والفواصل بين السجلات
+            while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ","):
+                position += 1
+            if position < len(buffer):
+                if not started:
+                    if buffer[position] != "[":
+                        raise ValueError(f"يجب أن يحتوي ملف JSON على مصفوفة سجلات: {path}")
+                    started = True
+                    position += 1
+                    continue
+                if buffer[position] == "]":
+                    return
+                try:
+                    record, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # سجل لم يكتمل بعد في المخزن المؤقت؛ نقرأ الكتلة التالية
+                    pass
+                else:
+                    yield record
+                    position = end
+                    continue
+
+            block = f.read(READ_BLOCK_SIZE)
+            if not block:
+                raise ValueError(f"ملف JSON غير مكتمل أو غير صالح: {path}")
+            buffer = buffer[position:] + block
+            position = 0
+
+
+def split_text(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE, overlap: int = DEFAULT_CHUNK_OVERLAP) -> List[str]:
+    if len(text) <= chunk_size:
+        return [text]
+    step = chunk_size - overlap
+    return [text[start:start + chunk_size] for start in range(0, len(text) - overlap, step)]
+
+
+def chunk_record(record: Dict) -> List[Dict]:
+    """
+    تحويل سجل واحد إلى أجزاء قابلة للفهرسة. سجلات الأسئلة الشائعة تصبح جزءًا واحدًا يدمج السؤال
+    والجواب، والمستندات الطويلة (حقل text) تُقسَّم إلى نوافذ متداخلة بمعرّفات id#n.
+    """
+    if "question" in record and "answer" in record:
+        # دمج السؤال والجواب في نص واحد للبحث الدلالي حتى يرتبط معناهما في متجه واحد
+        chunk = dict(record)
+        chunk["chunk_text"] = f"سؤال: {record['question']} جواب: {record['answer']}"
+        return [chunk]
+
+    if "text" not in record:
+        raise ValueError(f"سجل بدون حقول question/answer أو text: {record.get('id')}")
+    base = {key: value for key, value in record.items() if key != "text"}
+    pieces = split_text(record["text"])
+    if len(pieces) == 1:
+        return [dict(base, chunk_text=pieces[0])]
+    return [dict(base, id=f"{record['id']}#{number}", chunk_text=piece) for number, piece in enumerate(pieces)]
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def checkpoint_path(index_path: str) -> str:
+    base, _ = os.path.splitext(index_path)
+    return f"{base}.checkpoint.json"
+
+
+def partial_metadata_path(metadata_path: str) -> str:
+    base, _ = os.path.splitext(metadata_path)
+    return f"{base}.partial.jsonl"
+
+
+def _write_json_atomically(path: str, data: Dict) -> None:
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(temporary_path, path)
+
+
+class StreamingIndexBuilder:
+    """
+    بناء فهرس FAISS وبياناته الوصفية من تدفق سجلات. التقسيم يتم على نوافذ من السجلات في مجموعة
+    عمليات، والترميز والإضافة إلى الفهرس في دفعات ثابتة الحجم. فهارس IVF تُدرَّب على أول
+    train_size متجه ثم تُضاف بقية الدفعات مباشرة.
+
+    كل checkpoint_every نافذة تُحفظ نقطة حفظ بعدد السجلات المستهلكة، فيستأنف resume=True البناء من
+    آخر نقطة حفظ بدلًا من البدء من الصفر. لا يُعاد حفظ الفهرس كاملًا في كل نقطة: يُحفظ قالبه الفارغ
+    (المدرَّب في IVF) مرة واحدة، وتُكتب المتجهات المضافة منذ النقطة السابقة في ملف جزء مستقل،
+    وعند الاستئناف يُعاد بناء الفهرس من القالب والأجزاء دون إعادة الترميز.
+    """
+
+    def __init__(
+        self,
+        index_path: str,
+        metadata_path: str,
+        index_config: IndexConfig,
+        encode: Callable[[List[str]], np.ndarray],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        workers: Optional[int] = None,
+        window_size: Optional[int] = None,
+        checkpoint_every: int = 10,
+        train_size: Optional[int] = None,
+    ):
+        self.index_path = index_path
+        self.metadata_path = metadata_path
+        self.index_config = index_config
+        self.encode = encode
+        self.batch_size = batch_size
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.window_size = window_size or batch_size * max(1, self.workers) * 4
+        self.checkpoint_every = checkpoint_every
+        if train_size is None:
+            # توصية FAISS: نحو 40 متجهًا لكل مركز (ولكل مركز من مراكز المكمّمات الفرعية في PQ)
+            train_size = 40 * max(index_config.nlist, 2 ** index_config.pq_nbits)
+        self.train_size = train_size
+        self.index: Optional[faiss.Index] = None
+        self.rows = 0
+        self.records_consumed = 0
+        self._checkpoint_sequence = 0
+        self._pending_vectors: List[np.ndarray] = []
+        self._pending_ids: List[np.ndarray] = []
+        self._shard_file = None
+
+    # --- نقاط الحفظ ---
+    def _template_index_path(self) -> str:
+        base, _ = os.path.splitext(self.index_path)
+        return f"{base}.partial.faiss"
+
+    def _shard_path(self, sequence: int) -> str:
+        base, _ = os.path.splitext(self.index_path)
+        return f"{base}.partial-{sequence}.vectors"
+
+    def _shard_dtype(self, dimension: int) -> np.dtype:
+        return np.dtype([("id", np.int64), ("vector", np.float32, (dimension,))])
+
+    def _load_checkpoint(self, metadata_file) -> None:
+        path = checkpoint_path(self.index_path)
+        if not os.path.exists(path):
+            logging.info("لا توجد نقطة حفظ سابقة؛ سيبدأ البناء من البداية.")
+            metadata_file.truncate(0)
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        metadata_size = os.fstat(metadata_file.fileno()).st_size
+        if metadata_size < state["metadata_bytes"]:
+            # ملف البيانات الوصفية الجزئية مفقود أو أقصر من نقطة الحفظ؛ لا نحشوه بأصفار بل نبدأ من جديد
+            logging.warning(
+                f"البيانات الوصفية الجزئية ({metadata_size} بايت) أقصر من نقطة الحفظ "
+                f"({state['metadata_bytes']} بايت)؛ سيبدأ البناء من البداية."
+            )
+            self._remove_checkpoint_files()
+            metadata_file.truncate(0)
+            return
+        self.index_config = IndexConfig.from_dict(state["index_config"])
+        self.records_consumed = state["records_consumed"]
+        self.rows = state["rows"]
+        self._checkpoint_sequence = state["sequence"]
+        self.index = faiss.read_index(self._template_index_path())
+        shard_dtype = self._shard_dtype(self.index.d)
+        for sequence in range(1, self._checkpoint_sequence + 1):
+            if os.path.getsize(self._shard_path(sequence)) == 0:
+                continue
+            shard = np.memmap(self._shard_path(sequence), dtype=shard_dtype, mode='r')
+            for start in range(0, len(shard), self.batch_size):
+                batch = shard[start:start + self.batch_size]
+                self.index.add_with_ids(np.ascontiguousarray(batch["vector"]), np.ascontiguousarray(batch["id"]))
+            del shard
+        if self.index.ntotal != self.rows:
+            raise ValueError(f"أجزاء نقطة الحفظ تحتوي على {self.index.ntotal} متجه بدل {self.rows}.")
+        # حذف أي بيانات وصفية كُتبت بعد نقطة الحفظ
+        metadata_file.truncate(state["metadata_bytes"])
+        metadata_file.seek(state["metadata_bytes"])
+        logging.info(f"استئناف البناء من نقطة الحفظ: {self.records_consumed} سجل، {self.rows} صف.")
+
+    def _save_checkpoint(self, metadata_file) -> None:
+        if self.index is None or self._pending_vectors:
+            # لا نقطة حفظ قبل تدريب الفهرس وإضافة كل المتجهات المؤجلة
+            return
+        metadata_file.flush()
+        os.fsync(metadata_file.fileno())
+        self._close_shard()
+        sequence = self._checkpoint_sequence + 1
+        _write_json_atomically(checkpoint_path(self.index_path), {
+            "sequence": sequence,
+            "records_consumed": self.records_consumed,
+            "rows": self.rows,
+            "metadata_bytes": metadata_file.tell(),
+            "index_config": self.index_config.to_dict(),
+        })
+        self._checkpoint_sequence = sequence
+        logging.info(f"نقطة حفظ: {self.records_consumed} سجل، {self.rows} صف في الفهرس.")
+
+    def _write_shard(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        """إلحاق المتجهات بملف الجزء الحالي (ما أُضيف منذ آخر نقطة حفظ)."""
+        if self._shard_file is None:
+            self._shard_file = open(self._shard_path(self._checkpoint_sequence + 1), 'wb')
+        rows = np.empty(len(ids), dtype=self._shard_dtype(vectors.shape[1]))
+        rows["id"] = ids
+        rows["vector"] = vectors
+        self._shard_file.write(rows.tobytes())
+
+    def _close_shard(self) -> None:
+        if self._shard_file is None:
+            # لم تُضف متجهات منذ آخر نقطة حفظ؛ جزء فارغ يُبقي ترقيم الأجزاء متصلًا
+            open(self._shard_path(self._checkpoint_sequence + 1), 'wb').close()
+            return
+        self._shard_file.flush()
+        os.fsync(self._shard_file.fileno())
+        self._shard_file.close()
+        self._shard_file = None
+
+    def _remove_checkpoint_files(self) -> None:
+        if self._shard_file is not None:
+            self._shard_file.close()
+            self._shard_file = None
+        sequence = 1
+        while os.path.exists(self._shard_path(sequence)):
+            os.remove(self._shard_path(sequence))
+            sequence += 1
+        for path in (self._template_index_path(), checkpoint_path(self.index_path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # --- الفهرس ---
+    def _add(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        if self.index is None:
+            if self.index_config.index_type in ("ivf_flat", "ivf_pq"):
+                # تأجيل الإضافة حتى تتوفر عينة كافية لتدريب المراكز
+                self._pending_vectors.append(vectors)
+                self._pending_ids.append(ids)
+                if sum(len(pending) for pending in self._pending_vectors) >= self.train_size:
+                    self._train_and_flush()
+                return
+            self.index = build_id_mapped_index(vectors.shape[1], self.index_config)
+            faiss.write_index(self.index, self._template_index_path())
+        self.index.add_with_ids(vectors, ids)
+
+    def _train_and_flush(self) -> None:
+        vectors = np.vstack(self._pending_vectors)
+        ids = np.concatenate(self._pending_ids)
+        self._pending_vectors, self._pending_ids = [], []
+        self.index = build_id_mapped_index(vectors.shape[1], self.index_config, num_vectors=len(vectors))
+        logging.info(f"تدريب الفهرس على {len(vectors)} متجه...")
+        self.index.train(vectors)
+        faiss.write_index(self.index, self._template_index_path())
+        self.index.add_with_ids(vectors, ids)
+
+    def _process_window(self, chunks: List[Dict], metadata_file) -> None:
+        for batch in batched(chunks, self.batch_size):
+            vectors = np.ascontiguousarray(self.encode([chunk["chunk_text"] for chunk in batch]), dtype=np.float32)
+            ids = vector_ids_for(chunk["id"] for chunk in batch)
+            self._write_shard(vectors, ids)
+            self._add(vectors, ids)
+            for chunk in batch:
+                metadata_file.write((json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.rows += len(batch)
+
+    # --- التشغيل ---
+    def run(self, records: Iterable[Dict], resume: bool = False) -> faiss.Index:
+        partial_path = partial_metadata_path(self.metadata_path)
+        mode = 'r+b' if resume and os.path.exists(partial_path) else 'w+b'
+        if not resume:
+            self._remove_checkpoint_files()
+        # spawn: لا ترث عمليات التقسيم نموذج التضمين أو خيوطه من العملية الرئيسية
+        executor = (
+            ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            if self.workers > 1 else None
+        )
+        try:
+            with open(partial_path, mode) as metadata_file:
+                if resume:
+                    self._load_checkpoint(metadata_file)
+                records = islice(iter(records), self.records_consumed, None)
+
+                for window_number, window in enumerate(batched(records, self.window_size), start=1):
+                    if executor is not None:
+                        chunk_lists = executor.map(chunk_record, window, chunksize=max(1, len(window) // (self.workers * 4)))
+                    else:
+                        chunk_lists = map(chunk_record, window)
+                    self._process_window([chunk for chunks in chunk_lists for chunk in chunks], metadata_file)
+                    self.records_consumed += len(window)
+                    if window_number % self.checkpoint_every == 0:
+                        self._save_checkpoint(metadata_file)
+
+                if self._pending_vectors:
+                    self._train_and_flush()
+                if self.index is None:
+                    raise ValueError("لا توجد سجلات لبنائها في الفهرس.")
+                metadata_file.flush()
+        finally:
+            if self._shard_file is not None:
+                self._shard_file.close()
+                self._shard_file = None
+            if executor is not None:
+                executor.shutdown()
+
+        self._finalize(partial_path)
+        return self.index
+
+    def _finalize(self, partial_path: str) -> None:
+        """
+        كتابة الإصدار النهائي بقراءة البيانات الوصفية الجزئية سطرًا بسطر: ملف JSON، المخزن العمودي،
+        معرّفات المتجهات وبصمات المحتوى والفهرس المعجمي، ثم الفهرس نفسه، وأخيرًا حذف ملفات نقاط الحفظ.
+        معرّفات المتجهات تُكتب مباشرة في ملف مربوط بالذاكرة، والقوائم المعكوسة تُفرَّغ إلى القرص.
+        """
+        if self.index.ntotal != self.rows:
+            raise ValueError(f"عدد المتجهات في الفهرس ({self.index.ntotal}) لا يطابق عدد الصفوف ({self.rows}).")
+
+        ids = np.lib.format.open_memmap(
+            vector_ids_path(self.index_path), mode='w+', dtype=np.int64, shape=(self.rows,)
+        )
+        lexical = BM25Builder(spill_path=f"{os.path.splitext(self.index_path)[0]}.bm25.postings")
+        try:
+            logging.info(f"حفظ البيانات الوصفية في المسار: {self.metadata_path}")
+            with open(partial_path, 'r', encoding='utf-8') as source, \
+                    open(self.metadata_path, 'w', encoding='utf-8') as metadata_json, \
+                    open(content_hashes_path(self.index_path), 'w', encoding='utf-8') as hashes_json, \
+                    ColumnarMetadataWriter(metadata_store_path(self.metadata_path)) as columnar:
+                metadata_json.write("[\n")
+                hashes_json.write("{")
+                for row, line in enumerate(source):
+                    record = json.loads(line)
+                    separator = "" if row == 0 else ","
+                    metadata_json.write(separator + json.dumps(record, ensure_ascii=False, indent=4))
+                    hashes_json.write(
+                        f"{separator}{json.dumps(str(record['id']), ensure_ascii=False)}: "
+                        f"\"{content_hash(record['chunk_text'])}\""
+                    )
+                    columnar.append(record)
+                    lexical.add(record["chunk_text"])
+                    ids[row] = record_vector_id(str(record["id"]))
+                metadata_json.write("\n]\n")
+                hashes_json.write("}")
+
+            # معرّفات ثابتة مشتقة من معرّف السجل؛ نرفض المعرّفات المكررة كما يفعل vector_ids_for
+            ids.flush()
+            if len(np.unique(ids)) != len(ids):
+                raise ValueError("معرّفات السجلات مكررة أو تتصادم معرّفات متجهاتها.")
+            logging.info(f"حفظ الفهرس المعجمي (BM25) في المسار: {lexical_index_path(self.index_path)}")
+            lexical.save(lexical_index_path(self.index_path))
+        finally:
+            del ids
+            lexical.close()
+        logging.info(f"حفظ فهرس FAISS في المسار: {self.index_path}")
+        faiss.write_index(self.index, self.index_path)
+        save_index_config(self.index_path, self.index_config)
+
+        os.remove(partial_path)
+        self._remove_checkpoint_files()
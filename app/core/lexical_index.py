@@ -0,0 +1,270 @@
+# app/core/lexical_index.py
+import logging
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .text_normalization import normalize_query
+
+# فهرس معكوس BM25 داخل العملية، مرتّب حسب الصفوف نفسها في البيانات الوصفية.
+# القوائم المعكوسة بصيغة CSR: لكل مصطلح نطاق في rows/weights، والوزن هو مساهمة BM25
+# الجاهزة للمصطلح في المستند، فيصبح تقييم الاستعلام مجرد جمع أوزان.
+BM25_K1 = 1.5
+BM25_B = 0.75
+# عدد القوائم المعكوسة في المخزن المؤقت قبل تفريغها إلى القرص، وحجم أجزاء البناء
+POSTINGS_BUFFER_SIZE = 1 << 20
+_POSTING_DTYPE = np.dtype([("term", np.int32), ("row", np.int64), ("tf", np.float32)])
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_TA_MARBUTA = str.maketrans({"ة": "ه"})
+
+# كلمات شائعة لا تميّز المستندات (بعد التطبيع)، بما فيها كلمتا قالب الأجزاء "سؤال/جواب"
+STOPWORDS = frozenset({
+    "في", "من", "علي", "عن", "الي", "هل", "ما", "ماذا", "هي", "هو", "كيف", "كم", "متي", "اين", "لماذا",
+    "هذا", "هذه", "ذلك", "التي", "الذي", "او", "ثم", "لا", "لم", "لن", "قد", "مع", "كل", "ان", "اذا",
+    "يمكن", "يمكنني", "يمكنك", "انا", "انت", "نحن", "هم", "لديكم", "لدي", "لديك", "سؤال", "جواب",
+})
+# سوابق ولواحق التجذيع الخفيف (على غرار light10)، بعد التطبيع وتحويل التاء المربوطة إلى هاء
+_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+_SUFFIXES = ("ها", "ان", "ات", "ون", "ين", "يه", "ه", "ي")
+
+
+def light_stem(token: str) -> str:
+    for prefix in _PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            token = token[len(prefix):]
+            break
+    if token.startswith("و") and len(token) > 3:
+        token = token[1:]
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 2:
+            token = token[:-len(suffix)]
+    return token
+
+
+def analyze(text: str) -> List[str]:
+    """تحويل النص إلى مصطلحات: تطبيع عربي، إزالة الكلمات الشائعة ثم تجذيع خفيف."""
+    tokens = _TOKEN_PATTERN.findall(normalize_query(text).translate(_TA_MARBUTA))
+    return [light_stem(token) for token in tokens if token not in STOPWORDS]
+
+
+def lexical_index_path(index_path: str) -> str:
+    """مسار الفهرس المعكوس المرافق لملف الفهرس (index_v1.faiss -> index_v1.bm25.npz)."""
+    base, _ = os.path.splitext(index_path)
+    return f"{base}.bm25.npz"
+
+
+class LexicalHits:
+    """نتائج بحث معجمي: أرقام الصفوف ودرجاتها (تنازليًا) ونسبة مصطلحات الاستعلام المطابقة في كل صف."""
+
+    def __init__(self, rows: np.ndarray, scores: np.ndarray, coverage: np.ndarray):
+        self.rows = rows
+        self.scores = scores
+        self.coverage = coverage
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+class BM25Index:
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray, rows: np.ndarray, weights: np.ndarray, num_docs: int):
+        self._term_ids: Dict[str, int] = {str(term): term_id for term_id, term in enumerate(terms)}
+        self.offsets = offsets
+        self.rows = rows
+        self.weights = weights
+        self.num_docs = num_docs
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def search(self, query: str, k: int) -> LexicalHits:
+        query_terms = list(dict.fromkeys(analyze(query)))
+        term_ids = [self._term_ids[term] for term in query_terms if term in self._term_ids]
+        if not term_ids:
+            empty = np.empty(0, dtype=np.int64)
+            return LexicalHits(empty, np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32))
+
+        rows = np.concatenate([self.rows[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        weights = np.concatenate([self.weights[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        matched_terms = np.bincount(inverse)
+
+        top = np.argsort(-scores, kind="stable")[:k]
+        return LexicalHits(
+            unique_rows[top].astype(np.int64),
+            scores[top],
+            (matched_terms[top] / len(query_terms)).astype(np.float32),
+        )
+
+    def save(self, path: str) -> None:
+        np.savez(path, terms=np.array(list(self._term_ids), dtype=str), offsets=self.offsets,
+                 rows=self.rows, weights=self.weights, num_docs=np.int64(self.num_docs))
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            return cls(data["terms"], data["offsets"], data["rows"], data["weights"], int(data["num_docs"]))
+
+
+class BM25Builder:
+    """
+    بناء الفهرس المعكوس مستندًا بعد آخر بترتيب الصفوف. مع spill_path تُفرَّغ القوائم المعكوسة
+    إلى ملف كلما امتلأ المخزن المؤقت، ويكتب save الفهرس على أجزاء من ملفات مربوطة بالذاكرة،
+    فلا يبقى في الذاكرة إلا المفردات وطول كل مستند (4 بايت لكل صف).
+    """
+
+    def __init__(self, spill_path: Optional[str] = None, buffer_size: int = POSTINGS_BUFFER_SIZE):
+        self._term_ids: Dict[str, int] = {}
+        self._posting_terms = array("i")
+        self._posting_rows = array("q")
+        self._posting_tfs = array("f")
+        self._doc_lengths = array("i")
+        self._spill_path = spill_path
+        self._buffer_size = buffer_size
+        self._spill_file = open(spill_path, 'w+b') if spill_path else None
+
+    def add(self, text: str) -> None:
+        row = len(self._doc_lengths)
+        terms = analyze(text)
+        for term, frequency in Counter(terms).items():
+            self._posting_terms.append(self._term_ids.setdefault(term, len(self._term_ids)))
+            self._posting_rows.append(row)
+            self._posting_tfs.append(frequency)
+        self._doc_lengths.append(len(terms))
+        if self._spill_file is not None and len(self._posting_terms) >= self._buffer_size:
+            self._spill()
+
+    def build(self) -> BM25Index:
+        rows = np.empty(self._num_postings(), dtype=np.int64)
+        weights = np.empty(self._num_postings(), dtype=np.float32)
+        offsets = self._fill(rows, weights)
+        return BM25Index(self._vocabulary(), offsets, rows, weights, len(self._doc_lengths))
+
+    def save(self, path: str) -> None:
+        """كتابة الفهرس إلى path؛ مع spill_path تُبنى المصفوفات في ملفات مؤقتة بدل الذاكرة."""
+        if self._spill_file is None:
+            self.build().save(path)
+            return
+        self._spill()
+        size = max(1, self._num_postings())
+        rows = np.memmap(f"{self._spill_path}.rows", dtype=np.int64, mode='w+', shape=(size,))
+        weights = np.memmap(f"{self._spill_path}.weights", dtype=np.float32, mode='w+', shape=(size,))
+        try:
+            offsets = self._fill(rows, weights)
+            count = self._num_postings()
+            np.savez(path, terms=self._vocabulary(), offsets=offsets, rows=rows[:count],
+                     weights=weights[:count], num_docs=np.int64(len(self._doc_lengths)))
+        finally:
+            del rows, weights
+            os.remove(f"{self._spill_path}.rows")
+            os.remove(f"{self._spill_path}.weights")
+
+    def close(self) -> None:
+        """إغلاق ملف التفريغ وحذفه."""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+            os.remove(self._spill_path)
+
+    # --- دوال داخلية ---
+
+    def _spill(self) -> None:
+        postings = np.empty(len(self._posting_terms), dtype=_POSTING_DTYPE)
+        postings["term"] = np.frombuffer(self._posting_terms, dtype=np.int32)
+        postings["row"] = np.frombuffer(self._posting_rows, dtype=np.int64)
+        postings["tf"] = np.frombuffer(self._posting_tfs, dtype=np.float32)
+        self._spill_file.write(postings.tobytes())
+        self._posting_terms, self._posting_rows, self._posting_tfs = array("i"), array("q"), array("f")
+
+    def _num_postings(self) -> int:
+        if self._spill_file is None:
+            return len(self._posting_terms)
+        return self._spill_file.tell() // _POSTING_DTYPE.itemsize + len(self._posting_terms)
+
+    def _postings(self):
+        """القوائم المعكوسة (المصطلح، الصف، التكرار) على أجزاء من POSTINGS_BUFFER_SIZE."""
+        if self._spill_file is None:
+            terms = np.frombuffer(self._posting_terms, dtype=np.int32)
+            rows = np.frombuffer(self._posting_rows, dtype=np.int64)
+            tfs = np.frombuffer(self._posting_tfs, dtype=np.float32)
+            for start in range(0, len(terms), self._buffer_size):
+                end = start + self._buffer_size
+                yield terms[start:end], rows[start:end], tfs[start:end]
+            return
+        self._spill_file.flush()
+        if self._spill_file.tell() == 0:
+            return
+        postings = np.memmap(self._spill_path, dtype=_POSTING_DTYPE, mode='r')
+        for start in range(0, len(postings), self._buffer_size):
+            chunk = np.array(postings[start:start + self._buffer_size])
+            yield chunk["term"], chunk["row"], chunk["tf"]
+
+    def _vocabulary(self) -> np.ndarray:
+        return np.array(sorted(self._term_ids, key=self._term_ids.__getitem__), dtype=str)
+
+    def _fill(self, out_rows: np.ndarray, out_weights: np.ndarray) -> np.ndarray:
+        """
+        ملء out_rows/out_weights بصيغة CSR في مرورين على القوائم المعكوسة: الأول لتكرار المستندات
+        والإزاحات، والثاني لحساب الأوزان ووضع كل جزء في موضعه (مع الحفاظ على ترتيب الصفوف داخل المصطلح).
+        تُرجع الإزاحات.
+        """
+        num_terms = len(self._term_ids)
+        num_docs = len(self._doc_lengths)
+        doc_lengths = np.frombuffer(self._doc_lengths, dtype=np.int32).astype(np.float32)
+        average_length = float(doc_lengths.mean()) if num_docs and doc_lengths.mean() > 0 else 1.0
+
+        document_frequency = np.zeros(num_terms, dtype=np.int64)
+        for terms, _, _ in self._postings():
+            document_frequency += np.bincount(terms, minlength=num_terms)
+        offsets = np.zeros(num_terms + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(document_frequency)
+        idf = np.log1p((num_docs - document_frequency.astype(np.float32) + 0.5)
+                       / (document_frequency.astype(np.float32) + 0.5)).astype(np.float32)
+
+        cursor = offsets[:-1].copy()
+        for terms, rows, tfs in self._postings():
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[rows] / average_length)
+            weights = (idf[terms] * tfs * (BM25_K1 + 1) / (tfs + norm)).astype(np.float32)
+            order = np.argsort(terms, kind="stable")
+            sorted_terms = terms[order]
+            counts = np.bincount(sorted_terms, minlength=num_terms)
+            group_starts = np.cumsum(counts) - counts
+            positions = cursor[sorted_terms] + np.arange(len(order)) - group_starts[sorted_terms]
+            out_rows[positions] = rows[order]
+            out_weights[positions] = weights[order]
+            cursor += counts
+        return offsets
+
+
+def build_lexical_index(index_path: str, texts) -> BM25Index:
+    builder = BM25Builder()
+    for text in texts:
+        builder.add(text)
+    index = builder.build()
+    index.save(lexical_index_path(index_path))
+    return index
+
+
+def load_lexical_index(index_path: str) -> Optional[BM25Index]:
+    path = lexical_index_path(index_path)
+    if not os.path.exists(path):
+        logging.warning(f"لم يُعثر على الفهرس المعجمي ({path})؛ سيُستخدم البحث الدلالي فقط.")
+        return None
+    return BM25Index.load(path)
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int, rrf_k: int = 60) -> List[tuple]:
+    """
+    دمج عدة ترتيبات لأرقام الصفوف: درجة كل صف هي مجموع 1 / (rrf_k + الرتبة) عبر الترتيبات.
+    تُرجع [(الصف، الدرجة)] تنازليًا.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
@@ -0,0 +1,276 @@
+# app/core/llm_resilience.py
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import numpy as np
+
+from .metrics import LLM_ATTEMPTS, LLM_CIRCUIT_OPEN, LLM_HEDGES
+
+# طبقة حماية حول استدعاءات Gemini: مهلة لكل محاولة وموعد نهائي للطلب كله، إعادة المحاولة مع
+# تراجع أسي عشوائي (full jitter) للأخطاء المؤقتة فقط، طلب تحوّط (hedge) ثانٍ عندما يتجاوز الأول
+# نسبة مئوية من الأزمنة الأخيرة، وقاطع دائرة يرفض الاستدعاءات فورًا عندما يتعثر الخادم البعيد.
+# كل ذلك يعمل داخل حلقة الأحداث (دون أقفال)؛ لكل عامل uvicorn حالته الخاصة.
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+# أسماء استثناءات google.api_core المقابلة (مكتبة Gemini عبر gRPC)، دون استيراد المكتبة هنا
+RETRYABLE_GOOGLE_ERRORS = frozenset({
+    "ServiceUnavailable", "ResourceExhausted", "TooManyRequests", "DeadlineExceeded",
+    "InternalServerError", "BadGateway", "GatewayTimeout", "Aborted", "Unknown",
+})
+
+
+class CircuitOpenError(RuntimeError):
+    """القاطع مفتوح: الخادم البعيد متعثر والاستدعاء مرفوض دون محاولة."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """الأخطاء المؤقتة فقط (انتهاء المهلة، أخطاء الشبكة، 429 و5xx) تستحق إعادة المحاولة."""
+    # يُستورد هنا لأن httpx لازم فقط لعميل REST (GEMINI_API_ENDPOINT) ولا نريد كلفته عند بدء التشغيل
+    import httpx
+
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in RETRYABLE_GOOGLE_ERRORS
+
+
+class CircuitBreaker:
+    """
+    قاطع دائرة بثلاث حالات: مغلق (الوضع الطبيعي)، مفتوح بعد failure_threshold إخفاقًا متتاليًا
+    (تُرفض الاستدعاءات فورًا)، ونصف مفتوح بعد reset_seconds (يُسمح باستدعاء تجريبي واحد كل
+    reset_seconds؛ نجاحه يغلق القاطع وفشله يعيد فتحه).
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self._retry_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = self._clock()
+        if now < self._retry_at:
+            return False
+        # فتحة لاستدعاء تجريبي واحد؛ التالي بعد reset_seconds أخرى إن لم يُحسم هذا
+        self.state = "half_open"
+        self._retry_at = now + self.reset_seconds
+        return True
+
+    def is_open(self) -> bool:
+        return self.state != "closed" and self._clock() < self._retry_at
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logging.info("تم إغلاق قاطع الدائرة لاستدعاءات Gemini بعد نجاح الاستدعاء التجريبي.")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        LLM_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == "closed" and self.consecutive_failures < self.failure_threshold:
+            return
+        if self.state == "closed":
+            self.times_opened += 1
+            logging.warning(
+                f"فتح قاطع الدائرة لاستدعاءات Gemini بعد {self.consecutive_failures} إخفاق متتالٍ "
+                f"(لمدة {self.reset_seconds:.0f} ثانية)."
+            )
+        self.state = "open"
+        self._retry_at = self._clock() + self.reset_seconds
+        LLM_CIRCUIT_OPEN.set(1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": "open" if self.is_open() else self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+        }
+
+
+class LatencyTracker:
+    """نافذة منزلقة لأزمنة الاستدعاءات الناجحة الأخيرة لحساب مهلة التحوّط."""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        return float(np.percentile(np.fromiter(self._samples, dtype=np.float64), q))
+
+
+class ResilientCaller:
+    """
+    تنفيذ عملية غير متزامنة (تُنشأ من جديد في كل محاولة عبر operation()) بموعد نهائي كلي،
+    ومهلة لكل محاولة، وإعادة محاولة مع تراجع عشوائي، وطلب تحوّط اختياري، عبر قاطع الدائرة.
+    """
+
+    def __init__(
+        self,
+        deadline_seconds: float = 20.0,
+        attempt_timeout_seconds: float = 10.0,
+        max_retries: int = 2,
+        retry_base_delay_ms: float = 100.0,
+        retry_max_delay_ms: float = 2000.0,
+        hedge_enabled: bool = True,
+        hedge_percentile: float = 95.0,
+        hedge_min_delay_ms: float = 250.0,
+        hedge_min_samples: int = 20,
+        breaker: Optional[CircuitBreaker] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        self.deadline_seconds = deadline_seconds
+        self.attempt_timeout_seconds = attempt_timeout_seconds
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay_ms / 1000
+        self.retry_max_delay = retry_max_delay_ms / 1000
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay_ms / 1000
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self._rng = rng or random.Random()
+
+    @classmethod
+    def from_settings(cls, settings) -> "ResilientCaller":
+        return cls(
+            deadline_seconds=settings.LLM_DEADLINE_SECONDS,
+            attempt_timeout_seconds=settings.LLM_ATTEMPT_TIMEOUT_SECONDS,
+            max_retries=settings.LLM_MAX_RETRIES,
+            retry_base_delay_ms=settings.LLM_RETRY_BASE_DELAY_MS,
+            retry_max_delay_ms=settings.LLM_RETRY_MAX_DELAY_MS,
+            hedge_enabled=settings.LLM_HEDGE_ENABLED,
+            hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+            hedge_min_delay_ms=settings.LLM_HEDGE_MIN_DELAY_MS,
+            hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+            breaker=CircuitBreaker(settings.LLM_BREAKER_FAILURE_THRESHOLD, settings.LLM_BREAKER_RESET_SECONDS),
+        )
+
+    def hedge_delay(self) -> Optional[float]:
+        """مهلة إرسال طلب التحوّط: النسبة المئوية المحددة من الأزمنة الأخيرة (بحد أدنى)، أو None."""
+        if not self.hedge_enabled or len(self.latency) < self.hedge_min_samples:
+            return None
+        return max(self.latency.percentile(self.hedge_percentile), self.hedge_min_delay)
+
+    async def call(self, operation: Callable[[], Awaitable[T]], hedge: bool = True,
+                   limiter: Optional[asyncio.Semaphore] = None, keep_slot: bool = False) -> T:
+        """
+        limiter: سيمافور الاستدعاءات الجارية (LLM_MAX_CONCURRENCY). يُحجز مقعد لكل محاولة ويُحرَّر
+        قبل انتظار التراجع، ولا يُرسل طلب التحوّط إلا إذا وُجد مقعد شاغر (ويحجزه حتى ينتهي).
+        keep_slot: إبقاء مقعد المحاولة الناجحة محجوزًا بعد العودة (للتدفق)؛ على المستدعي تحريره.
+        """
+        if not self.breaker.allow():
+            LLM_ATTEMPTS.labels("circuit_open").inc()
+            raise CircuitOpenError("Gemini circuit breaker is open")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_seconds
+        retries = 0
+        while True:
+            if limiter is not None:
+                # انتظار المقعد خارج مهلة المحاولة: الازدحام المحلي ليس فشلًا في الخادم البعيد
+                await asyncio.wait_for(limiter.acquire(), max(deadline - loop.time(), 0.0))
+            timeout = min(self.attempt_timeout_seconds, deadline - loop.time())
+            try:
+                result = await asyncio.wait_for(self._attempt(operation, hedge, limiter), timeout)
+            except asyncio.CancelledError:
+                if limiter is not None:
+                    limiter.release()
+                raise
+            except Exception as e:
+                if limiter is not None:
+                    limiter.release()
+                if not is_retryable(e):
+                    # الخطأ في الطلب (مثل 400) لا في توفر الخدمة، لكن الاستدعاء لم ينجح أيضًا:
+                    # لا نغيّر حالة القاطع (لا يُغلق القاطع نصف المفتوح بسببه)
+                    LLM_ATTEMPTS.labels("error").inc()
+                    raise
+                LLM_ATTEMPTS.labels("timeout" if isinstance(e, asyncio.TimeoutError) else "retryable_error").inc()
+                self.breaker.record_failure()
+                # تراجع أسي بعشوائية كاملة حتى لا تتزامن إعادة المحاولات بين الطلبات
+                delay = self._rng.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** retries))
+                retries += 1
+                # is_open يقرأ الحالة دون أن يحجز الاستدعاء التجريبي للقاطع نصف المفتوح
+                if (
+                    retries > self.max_retries
+                    or loop.time() + delay >= deadline
+                    or self.breaker.is_open()
+                ):
+                    raise
+                logging.warning(f"إعادة محاولة استدعاء Gemini ({retries}/{self.max_retries}) بعد {delay * 1000:.0f}ms: {e!r}")
+                await asyncio.sleep(delay)
+                continue
+            if limiter is not None and not keep_slot:
+                limiter.release()
+            LLM_ATTEMPTS.labels("success").inc()
+            self.breaker.record_success()
+            return result
+
+    async def _attempt(self, operation: Callable[[], Awaitable[T]], hedge: bool,
+                       limiter: Optional[asyncio.Semaphore] = None) -> T:
+        """محاولة واحدة، مع طلب تحوّط ثانٍ إن تأخر الأول؛ تُعاد أول نتيجة ناجحة ويُلغى الآخر."""
+        async def timed():
+            start = time.perf_counter()
+            result = await operation()
+            self.latency.record(time.perf_counter() - start)
+            return result
+
+        pending = {asyncio.ensure_future(timed())}
+        try:
+            hedge_delay = self.hedge_delay() if hedge else None
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                # لا تحوّط دون مقعد شاغر، حتى لا يتجاوز عدد الاستدعاءات الجارية LLM_MAX_CONCURRENCY
+                if not done and self.breaker.state == "closed" and (limiter is None or not limiter.locked()):
+                    LLM_HEDGES.inc()
+                    if limiter is not None:
+                        await limiter.acquire()  # فوري لأن السيمافور غير مقفل
+                    hedge_task = asyncio.ensure_future(timed())
+                    if limiter is not None:
+                        hedge_task.add_done_callback(lambda _task: limiter.release())
+                    pending.add(hedge_task)
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for task in done:
+                    # قراءة استثناء كل مهمة منتهية (حتى لا يُسجَّل تحذير "never retrieved")
+                    if task.exception() is None:
+                        winner = winner or task
+                    else:
+                        error = task.exception()
+                if winner is not None:
+                    return winner.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        delay = self.hedge_delay()
+        return {
+            **self.breaker.stats(),
+            "hedge_delay_ms": delay * 1000 if delay is not None else None,
+            "latency_samples": len(self.latency),
+        }
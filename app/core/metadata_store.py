@@ -0,0 +1,204 @@
+# app/core/metadata_store.py
+import json
+import logging
+import mmap
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# صيغة التخزين العمودي: مجلد يحتوي لكل حقل على مصفوفة إزاحات (int64) وملف نصي متصل (UTF-8)،
+# بالإضافة إلى فهرس مرتب للمعرّفات يسمح بإيجاد رقم الصف لأي معرّف بالبحث الثنائي.
+STORE_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+ID_INDEX_FILE = "id_index.npy"
+
+
+def metadata_store_path(metadata_path: str) -> str:
+    """مسار المجلد العمودي المرافق لملف JSON (metadata_v1.json -> metadata_v1.store)."""
+    base, _ = os.path.splitext(metadata_path)
+    return f"{base}.store"
+
+
+class ColumnarMetadataWriter:
+    """
+    كاتب متدفق للبيانات الوصفية بالصيغة العمودية. يُضاف كل سجل بترتيب صفوف الفهرس،
+    ولا يحتفظ في الذاكرة إلا بالإزاحات والمعرّفات.
+    """
+
+    def __init__(self, path: str, fields: Optional[List[str]] = None):
+        self.path = path
+        self.fields = list(fields) if fields else None
+        self._blobs = {}
+        self._offsets: Dict[str, List[int]] = {}
+        self._ids: List[str] = []
+        os.makedirs(path, exist_ok=True)
+        if self.fields:
+            self._open_fields()
+
+    def _open_fields(self) -> None:
+        if "id" not in self.fields:
+            raise ValueError("يجب أن تحتوي البيانات الوصفية على الحقل 'id'.")
+        for field in self.fields:
+            self._blobs[field] = open(os.path.join(self.path, f"{field}.data"), 'wb')
+            self._offsets[field] = [0]
+
+    def append(self, record: Dict) -> None:
+        if self.fields is None:
+            self.fields = list(record.keys())
+            self._open_fields()
+
+        for field in self.fields:
+            value = record.get(field)
+            encoded = b"" if value is None else str(value).encode("utf-8")
+            self._blobs[field].write(encoded)
+            self._offsets[field].append(self._offsets[field][-1] + len(encoded))
+        self._ids.append(str(record["id"]))
+
+    def extend(self, records: Iterable[Dict]) -> None:
+        for record in records:
+            self.append(record)
+
+    def close(self) -> None:
+        if self.fields is None:
+            raise ValueError("لا يمكن إنشاء مخزن بيانات وصفية فارغ بدون تحديد الحقول.")
+        for field in self.fields:
+            self._blobs[field].close()
+            np.save(os.path.join(self.path, f"{field}.offsets.npy"), np.asarray(self._offsets[field], dtype=np.int64))
+
+        # فهرس المعرّفات: ترتيب الصفوف حسب المعرّف للبحث الثنائي
+        id_order = np.asarray(sorted(range(len(self._ids)), key=self._ids.__getitem__), dtype=np.int64)
+        np.save(os.path.join(self.path, ID_INDEX_FILE), id_order)
+
+        with open(os.path.join(self.path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                "format_version": STORE_FORMAT_VERSION,
+                "num_rows": len(self._ids),
+                "fields": self.fields,
+            }, f, ensure_ascii=False, indent=4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            for blob in self._blobs.values():
+                blob.close()
+
+
+class ColumnarMetadataStore:
+    """
+    قارئ للبيانات الوصفية العمودية عبر الذاكرة المُعيَّنة (mmap). لا تُحمَّل النصوص في الذاكرة
+    إلا عند طلب صف معين، وكل استدعاء لـ record يُنشئ قاموسًا جديدًا خاصًا بالطلب.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"إصدار صيغة مخزن البيانات الوصفية غير مدعوم: {manifest.get('format_version')}")
+
+        self.path = path
+        self.fields: List[str] = manifest["fields"]
+        self.num_rows: int = manifest["num_rows"]
+        self._files = []
+        self._blobs = {}
+        self._offsets = {}
+        for field in self.fields:
+            self._offsets[field] = np.load(os.path.join(path, f"{field}.offsets.npy"), mmap_mode='r')
+            self._blobs[field] = self._map_blob(os.path.join(path, f"{field}.data"))
+        self._id_order = np.load(os.path.join(path, ID_INDEX_FILE), mmap_mode='r')
+
+    def _map_blob(self, blob_path: str):
+        if os.path.getsize(blob_path) == 0:
+            return b""
+        f = open(blob_path, 'rb')
+        self._files.append(f)
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def get_field(self, row: int, field: str) -> str:
+        offsets = self._offsets[field]
+        start, end = int(offsets[row]), int(offsets[row + 1])
+        return self._blobs[field][start:end].decode("utf-8")
+
+    def record(self, row: int) -> Dict:
+        if row < 0 or row >= self.num_rows:
+            raise IndexError(f"رقم الصف خارج النطاق: {row}")
+        return {field: self.get_field(row, field) for field in self.fields}
+
+    def row_for_id(self, record_id: str) -> Optional[int]:
+        # بحث ثنائي في ترتيب الصفوف حسب المعرّف
+        low, high = 0, self.num_rows
+        while low < high:
+            middle = (low + high) // 2
+            middle_id = self.get_field(int(self._id_order[middle]), "id")
+            if middle_id < record_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.num_rows:
+            row = int(self._id_order[low])
+            if self.get_field(row, "id") == record_id:
+                return row
+        return None
+
+    def close(self) -> None:
+        for blob in self._blobs.values():
+            if isinstance(blob, mmap.mmap):
+                blob.close()
+        for f in self._files:
+            f.close()
+        # مصفوفات الإزاحات مربوطة بالذاكرة أيضًا (np.load بـ mmap_mode)؛ يُحرَّر ربطها بإسقاط مراجعها
+        self._blobs, self._offsets, self._files = {}, {}, []
+        self._id_order = None
+
+
+class InMemoryMetadataStore:
+    """
+    مخزن متوافق بنفس الواجهة للبيانات الوصفية القديمة بصيغة JSON (قائمة قواميس).
+    """
+
+    def __init__(self, records: List[Dict]):
+        self._records = records
+        self.fields: List[str] = list(records[0].keys()) if records else []
+        self._rows_by_id = {str(record["id"]): row for row, record in enumerate(records)}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get_field(self, row: int, field: str):
+        return self._records[row].get(field)
+
+    def record(self, row: int) -> Dict:
+        # نسخة جديدة لكل طلب حتى لا تتشارك الطلبات المتزامنة نفس القاموس
+        return dict(self._records[row])
+
+    def row_for_id(self, record_id: str) -> Optional[int]:
+        return self._rows_by_id.get(record_id)
+
+    def close(self) -> None:
+        pass
+
+
+def write_metadata_store(path: str, records: Iterable[Dict], fields: Optional[List[str]] = None) -> None:
+    with ColumnarMetadataWriter(path, fields=fields) as writer:
+        writer.extend(records)
+
+
+def load_metadata_store(metadata_path: str):
+    """
+    تحميل البيانات الوصفية: الصيغة العمودية إن وُجدت بجانب ملف JSON، وإلا ملف JSON نفسه.
+    """
+    store_path = metadata_store_path(metadata_path)
+    if os.path.isdir(store_path):
+        logging.info(f"تحميل البيانات الوصفية العمودية من: {store_path}")
+        return ColumnarMetadataStore(store_path)
+
+    logging.info(f"لم يُعثر على مخزن عمودي؛ تحميل البيانات الوصفية من JSON: {metadata_path}")
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        return InMemoryMetadataStore(json.load(f))
@@ -0,0 +1,129 @@
+# app/core/metrics.py
+from typing import Callable, Dict, Iterator, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+# مقاييس Prometheus للخدمة. المقاييس المسجلة على المسار الساخن هي الهيستوغرامات والعدادات أدناه
+# (أبناء تسميات مُنشأة مسبقًا لتجنب البحث عن التسمية في كل طلب)، أما إحصائيات الذاكرات المؤقتة
+# والمُجمِّع والفهرس فتُقرأ من كائناتها عند طلب /metrics فقط عبر ServiceCollector.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGES = ("retrieval", "embedding", "index_search", "lexical_search", "generation", "direct_answer", "total")
+
+_stage_latency = Histogram(
+    "rag_stage_duration_seconds", "زمن كل مرحلة من مراحل معالجة الطلب.", ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGE_LATENCY: Dict[str, Histogram] = {stage: _stage_latency.labels(stage) for stage in STAGES}
+
+ANSWERS = Counter("rag_answers_total", "عدد الإجابات حسب مصدرها (llm أو cache أو direct أو fallback).", ["source"])
+GENERATION_FINISH = Counter(
+    "rag_generation_finish_total", "نتائج استدعاءات Gemini حسب سبب الإنهاء (STOP، SAFETY، ERROR...).", ["reason"]
+)
+LLM_ATTEMPTS = Counter(
+    "rag_llm_attempts_total",
+    "محاولات استدعاء Gemini حسب النتيجة (success، timeout، retryable_error، error، circuit_open).",
+    ["outcome"],
+)
+_llm_tokens = Counter("rag_llm_tokens_total", "عدد رموز Gemini المستهلكة حسب النوع (prompt أو output).", ["kind"])
+LLM_TOKENS: Dict[str, Counter] = {kind: _llm_tokens.labels(kind) for kind in ("prompt", "output")}
+LLM_HEDGES = Counter("rag_llm_hedged_requests_total", "عدد طلبات التحوّط المرسلة إلى Gemini.")
+LLM_CIRCUIT_OPEN = Gauge("rag_llm_circuit_open", "حالة قاطع الدائرة لاستدعاءات Gemini (1 = مفتوح).")
+HTTP_RESPONSES = Counter("rag_http_responses_total", "عدد الاستجابات حسب المسار ورمز الحالة.", ["path", "status"])
+IN_FLIGHT = Gauge("rag_requests_in_flight", "عدد الطلبات قيد المعالجة حاليًا.")
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_LATENCY[stage].observe(seconds)
+
+
+def observe_timings(timings: Dict[str, float]) -> None:
+    """تسجيل قاموس التوقيتات المُعاد للعميل (بالمللي ثانية) في هيستوغرامات المراحل."""
+    for key, milliseconds in timings.items():
+        stage = key[:-3] if key.endswith("_ms") else key
+        if stage in STAGE_LATENCY:
+            STAGE_LATENCY[stage].observe(milliseconds / 1000)
+
+
+class ServiceCollector(Collector):
+    """
+    مقاييس تُحسب لحظة الجمع من حالة الخدمة الحالية: ذاكرة المتجهات، ذاكرة الإجابات، الإجابات المباشرة،
+    مسارات البحث (دلالي/هجين/معجمي)، المُجمِّع، دمج الطلبات المتطابقة، والفهارس المحمَّلة.
+    """
+
+    def __init__(self, state: Callable[[], Dict[str, Optional[object]]]):
+        self._state = state
+
+    def collect(self) -> Iterator:
+        state = self._state()
+        retriever = state.get("retriever")
+
+        cache_events = CounterMetricFamily(
+            "rag_cache_events", "أحداث الذاكرات المؤقتة (إصابة/إخفاق).", labels=["cache", "result"]
+        )
+        for cache_name, cache in (("embedding", getattr(retriever, "query_cache", None)),
+                                  ("answer", state.get("answer_cache"))):
+            if cache is not None:
+                stats = cache.stats()
+                cache_events.add_metric([cache_name, "hit"], stats["hits"])
+                cache_events.add_metric([cache_name, "miss"], stats["misses"])
+        direct_answerer = state.get("direct_answerer")
+        if direct_answerer is not None:
+            stats = direct_answerer.stats()
+            cache_events.add_metric(["direct_answer", "hit"], stats["hits"])
+            cache_events.add_metric(["direct_answer", "miss"], stats["misses"])
+        yield cache_events
+
+        retrieval_stats = getattr(retriever, "retrieval_stats", None)
+        if isinstance(retrieval_stats, dict):
+            paths = CounterMetricFamily(
+                "rag_retrieval_queries", "عدد الاستعلامات حسب مسار البحث (dense، hybrid، lexical).", labels=["path"]
+            )
+            for path, count in retrieval_stats.items():
+                paths.add_metric([path], count)
+            yield paths
+
+        batcher = state.get("batcher")
+        if batcher is not None:
+            stats = batcher.stats()
+            yield CounterMetricFamily("rag_retrieval_batches", "عدد دفعات الاسترجاع المنفذة.", value=stats["batches"])
+            yield CounterMetricFamily("rag_retrieval_batch_items", "عدد الاستعلامات المنفذة في دفعات.", value=stats["items"])
+
+        coalescer = state.get("coalescer")
+        if coalescer is not None:
+            stats = coalescer.stats()
+            coalesced = CounterMetricFamily(
+                "rag_coalesced_requests", "طلبات /api/v1/ask حسب دورها في الدمج (leader أو follower).", labels=["role"]
+            )
+            coalesced.add_metric(["leader"], stats["leaders"])
+            coalesced.add_metric(["follower"], stats["followers"])
+            yield coalesced
+            yield GaugeMetricFamily("rag_coalesced_in_flight", "عدد الحسابات المدمجة الجارية.", value=stats["in_flight"])
+
+        registry = state.get("index_registry")
+        resident = [entry.retriever for entry in registry.resident().values()] if registry is not None else []
+        index = getattr(retriever, "index", None)
+        if (index is not None and getattr(retriever, "is_ready", False)) or resident:
+            index_size = GaugeMetricFamily(
+                "rag_index_vectors", "عدد المتجهات في كل فهرس محمَّل (index.ntotal).", labels=["index_version"]
+            )
+            versions = {}
+            if index is not None and getattr(retriever, "is_ready", False):
+                versions[str(retriever.index_version)] = index.ntotal
+            for named in resident:
+                versions.setdefault(str(named.index_version), named.index.ntotal)
+            for version, size in versions.items():
+                index_size.add_metric([version], size)
+            yield index_size
+        if registry is not None:
+            stats = registry.stats()
+            lookups = CounterMetricFamily(
+                "rag_named_index_lookups", "طلبات الفهارس المسماة حسب توفرها في الذاكرة (hit أو miss).", labels=["result"]
+            )
+            lookups.add_metric(["hit"], stats["hits"])
+            lookups.add_metric(["miss"], stats["misses"])
+            yield lookups
+            yield CounterMetricFamily("rag_named_index_evictions", "عدد الفهارس المسماة المُخرجة من الذاكرة.",
+                                      value=stats["evictions"])
+            yield GaugeMetricFamily("rag_named_index_resident_bytes", "الذاكرة التقديرية للفهارس المسماة المحمَّلة.",
+                                    value=registry.resident_bytes())
@@ -0,0 +1,178 @@
+# app/core/onnx_encoder.py
+import argparse
+import json
+import logging
+import os
+from typing import List, Optional, Union
+
+import numpy as np
+
+from .tracing import span
+
+# واجهة ترميز بديلة لـ SentenceTransformer تعمل عبر ONNX Runtime على المعالج دون PyTorch.
+# يُصدَّر النموذج مرة واحدة (مع تكميم ديناميكي int8 اختياري) إلى مجلد يحتوي على:
+#   model.onnx أو model.int8.onnx   المحوِّل نفسه (مخرجاته last_hidden_state)
+#   tokenizer.json                  المُقسِّم السريع (مكتبة tokenizers)
+#   encoder_config.json             طول التسلسل الأقصى، نوع التجميع، رمز الحشو وأسماء المدخلات
+ENCODER_CONFIG_FILE = "encoder_config.json"
+TOKENIZER_FILE = "tokenizer.json"
+DEFAULT_BATCH_SIZE = 32
+
+
+class OnnxEncoder:
+    """
+    ترميز النصوص عبر جلسة ONNX Runtime بنفس واجهة SentenceTransformer.encode المستخدمة في Retriever:
+    تقسيم، تشغيل المحوِّل، تجميع (متوسط الرموز أو رمز CLS) ثم تطبيع اختياري.
+    """
+
+    def __init__(self, session, tokenizer, config: dict, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.session = session
+        self.tokenizer = tokenizer
+        self.config = config
+        self.batch_size = batch_size
+        self.input_names = config["input_names"]
+        self.tokenizer.enable_truncation(max_length=config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=config["pad_token_id"], pad_token=config["pad_token"])
+
+    @classmethod
+    def load(cls, model_dir: str, num_threads: int = 0, batch_size: int = DEFAULT_BATCH_SIZE) -> "OnnxEncoder":
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, ENCODER_CONFIG_FILE), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        session = ort.InferenceSession(
+            os.path.join(model_dir, config["model_file"]),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        logging.info(
+            f"تم تحميل نموذج ONNX من: {model_dir} (ملف: {config['model_file']}، خيوط: {num_threads or 'افتراضي'})"
+        )
+        return cls(session, tokenizer, config, batch_size=batch_size)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        with span("onnx.tokenize", texts=len(texts)):
+            encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.asarray([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": np.asarray([encoding.ids for encoding in encodings], dtype=np.int64)}
+        if "attention_mask" in self.input_names:
+            feeds["attention_mask"] = attention_mask
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([encoding.type_ids for encoding in encodings], dtype=np.int64)
+
+        with span("onnx.forward", shape=list(feeds["input_ids"].shape)):
+            hidden_states = self.session.run(None, feeds)[0]
+        if self.config.get("pooling", "mean") == "cls":
+            return hidden_states[:, 0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (hidden_states * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences: Union[str, List[str]], convert_to_tensor: bool = False,
+               normalize_embeddings: bool = False, batch_size: Optional[int] = None, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        batch_size = batch_size or self.batch_size
+
+        # ترتيب النصوص حسب الطول يقلل الحشو داخل كل دفعة
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        vectors = np.empty((len(texts), self.config["dimension"]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            positions = order[start:start + batch_size]
+            vectors[positions] = self._encode_batch([texts[position] for position in positions])
+
+        if normalize_embeddings:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors[0] if single else vectors
+
+
+def export_onnx_model(model_name: str, output_dir: str, quantize: bool = True, opset: int = 17) -> str:
+    """
+    تصدير نموذج SentenceTransformer إلى ONNX (مع تكميم ديناميكي int8 للأوزان عند quantize=True).
+    يحتاج إلى torch وsentence-transformers وonnx، ولا تحتاجها الخدمة عند التشغيل.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    pooling = "mean"
+    if len(model) > 1 and getattr(model[1], "pooling_mode_cls_token", False):
+        pooling = "cls"
+
+    sample = tokenizer(["نص تجريبي للتصدير", "sample"], return_tensors="pt", padding=True)
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class HiddenStates(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            return self.inner(**dict(zip(input_names, inputs))).last_hidden_state
+
+    model_path = os.path.join(output_dir, "model.onnx")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    logging.info(f"تصدير {model_name} إلى: {model_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            HiddenStates(transformer),
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            dynamo=False,
+        )
+
+    model_file = "model.onnx"
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        model_file = "model.int8.onnx"
+        logging.info("تكميم ديناميكي للأوزان إلى int8...")
+        quantize_dynamic(model_path, os.path.join(output_dir, model_file), weight_type=QuantType.QInt8)
+
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILE))
+    with open(os.path.join(output_dir, ENCODER_CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            "model_name": model_name,
+            "model_file": model_file,
+            "quantized": quantize,
+            "input_names": input_names,
+            "max_seq_length": model.max_seq_length,
+            "pooling": pooling,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+            "dimension": model.get_sentence_embedding_dimension(),
+        }, f, ensure_ascii=False, indent=4)
+    logging.info(f"اكتمل التصدير: {os.path.join(output_dir, model_file)}")
+    return output_dir
+
+
+def main():
+    from ..config import settings
+
+    parser = argparse.ArgumentParser(description="تصدير نموذج التضمين إلى ONNX لتشغيله عبر ONNX Runtime.")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME)
+    parser.add_argument("--output", default=settings.ONNX_MODEL_DIR)
+    parser.add_argument("--no-quantize", action="store_true", help="تصدير بأوزان float32 دون تكميم int8.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    export_onnx_model(args.model, args.output, quantize=not args.no_quantize)
+
+
+if __name__ == "__main__":
+    main()
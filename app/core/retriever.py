@@ -1,89 +1,435 @@
 # app/core/retriever.py
-import json
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import logging
-from typing import List, Dict
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 
 # استيراد إعداداتنا لضمان استخدام المسارات الصحيحة
 from ..config import settings
+from .disk_embedding_cache import DiskEmbeddingCache
+from .embedding_backends import embedding_cache_name, load_embedding_model
+from .embedding_cache import QueryEmbeddingCache
+from .embedding_server import RemoteEncoder, require_authkey
+from .indexing import (
+    IndexConfig,
+    VectorIdMap,
+    apply_search_params,
+    distances_to_scores,
+    load_index_config,
+    load_vector_ids,
+    vector_ids_path,
+)
+from .lexical_index import BM25Index, LexicalHits, lexical_index_path, load_lexical_index, reciprocal_rank_fusion
+from .metadata_store import load_metadata_store, metadata_store_path
+from .metrics import observe_stage
+from .tracing import span
+from .text_normalization import normalize_query
 
 class Retriever:
-    def __init__(self):
-        self.model = None
+    def __init__(self, index_version: Optional[str] = None, model=None):
+        # يمكن تمرير نموذج تضمين محمَّل مسبقًا (مثلًا عند إعادة تحميل الفهرس) لتجنب تحميله مرة أخرى
+        self.model = model
         self.index = None
+        self.index_config: Optional[IndexConfig] = None
+        self.vector_ids: Optional[VectorIdMap] = None
+        # الفهرس المعجمي (BM25) للبحث الهجين؛ None = بحث دلالي فقط
+        self.lexical_index: Optional[BM25Index] = None
         self.metadata = None
+        self.index_version = index_version or settings.INDEX_VERSION
         self.is_ready = False
+        self.query_cache: Optional[QueryEmbeddingCache] = (
+            QueryEmbeddingCache(settings.EMBEDDING_CACHE_SIZE)
+            if settings.EMBEDDING_CACHE_ENABLED else None
+        )
+        # عدد الاستعلامات حسب مسار البحث: دلالي، هجين، أو معجمي فقط (دون ترميز)
+        self.retrieval_stats: Dict[str, int] = {"dense": 0, "hybrid": 0, "lexical": 0}
+        self._stats_lock = threading.Lock()
+        # زمن كل مرحلة من مراحل load() بالمللي ثانية
+        self.load_timings: Dict[str, float] = {}
         logging.info("تم إنشاء كائن Retriever. يرجى استدعاء .load() للتحميل.")
 
     def load(self):
         """
         تحميل نموذج التضمين، فهرس FAISS، والبيانات الوصفية.
-        هذه عملية ثقيلة يجب أن تتم مرة واحدة عند بدء التشغيل.
+        هذه عملية ثقيلة يجب أن تتم مرة واحدة عند بدء التشغيل. مع PARALLEL_LOADING تُحمَّل
+        المكونات الأربعة (النموذج، الفهرس، البيانات الوصفية، الفهرس المعجمي) في خيوط متوازية،
+        فمعظم زمنها قراءة ملفات وتهيئة مكتبات أصلية تحرر قفل GIL.
         """
+        index_path = self.index_path
+        metadata_path = self.metadata_path
+        phases = {
+            "model": self._load_model,
+            "index": lambda: self._load_index(index_path),
+            "metadata": lambda: self._load_metadata(metadata_path),
+            "lexical_index": lambda: self._load_lexical_index(index_path),
+        }
         try:
-            # --- 1. تحميل نموذج التضمين ---
-            model_name = 'paraphrase-multilingual-MiniLM-L12-v2' 
-            logging.info(f"بدء تحميل نموذج التضمين: {model_name}")
-            self.model = SentenceTransformer(model_name)
-            logging.info("تم تحميل نموذج التضمين بنجاح.")
-
-            # --- 2. تحميل فهرس FAISS والبيانات الوصفية ---
-            index_path = f"data/index_{settings.INDEX_VERSION}.faiss"
-            metadata_path = f"data/metadata_{settings.INDEX_VERSION}.json"
-            
-            logging.info(f"بدء تحميل فهرس FAISS من: {index_path}")
-            self.index = faiss.read_index(index_path)
-            logging.info(f"تم تحميل الفهرس بنجاح. عدد المتجهات: {self.index.ntotal}")
-
-            logging.info(f"بدء تحميل البيانات الوصفية من: {metadata_path}")
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                self.metadata = json.load(f)
-            logging.info("تم تحميل البيانات الوصفية بنجاح.")
+            if settings.RETRIEVAL_MODE not in ("hybrid", "dense"):
+                raise ValueError(f"وضع استرجاع غير مدعوم: {settings.RETRIEVAL_MODE}")
+            if settings.PARALLEL_LOADING:
+                with ThreadPoolExecutor(max_workers=len(phases), thread_name_prefix="retriever-load") as executor:
+                    futures = [executor.submit(self._timed_phase, name, load) for name, load in phases.items()]
+                    for future in futures:
+                        future.result()
+            else:
+                for name, load in phases.items():
+                    self._timed_phase(name, load)
 
             # التأكد من تطابق عدد السجلات
             if self.index.ntotal != len(self.metadata):
                 raise ValueError("عدم تطابق بين عدد المتجهات في الفهرس وعدد السجلات في البيانات الوصفية!")
+            if self.vector_ids is not None and len(self.vector_ids) != len(self.metadata):
+                raise ValueError("عدم تطابق بين عدد معرّفات المتجهات وعدد السجلات في البيانات الوصفية!")
+            if self.lexical_index is not None and len(self.lexical_index) != len(self.metadata):
+                raise ValueError("عدم تطابق بين عدد مستندات الفهرس المعجمي وعدد السجلات في البيانات الوصفية!")
 
             self.is_ready = True
-            logging.info("--- Retriever جاهز للعمل ---")
+            logging.info(f"--- Retriever جاهز للعمل --- أزمنة التحميل (ms): {self.load_timings}")
 
         except Exception as e:
             self.is_ready = False
             logging.error(f"فشل في تحميل Retriever: {e}", exc_info=True)
             raise
 
-    def search(self, query: str, k: int = 3) -> List[Dict]:
+    @property
+    def index_path(self) -> str:
+        return f"data/index_{self.index_version}.faiss"
+
+    @property
+    def metadata_path(self) -> str:
+        return f"data/metadata_{self.index_version}.json"
+
+    def footprint_bytes(self) -> int:
+        """
+        تقدير الذاكرة التي يشغلها هذا الفهرس: مجموع أحجام ملفاته على القرص (FAISS، معرّفات المتجهات،
+        BM25، والبيانات الوصفية). لا يشمل نموذج التضمين لأنه مشترك بين الفهارس.
+        """
+        paths = [self.index_path, vector_ids_path(self.index_path), lexical_index_path(self.index_path)]
+        store_path = metadata_store_path(self.metadata_path)
+        if os.path.isdir(store_path):
+            paths.extend(os.path.join(root, name) for root, _, names in os.walk(store_path) for name in names)
+        else:
+            paths.append(self.metadata_path)
+        return sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+
+    def close(self) -> None:
+        """
+        تحرير موارد الفهرس بعد إخراجه من الذاكرة: mmap البيانات الوصفية وملفاتها، فهرس FAISS،
+        والفهرس المعجمي. نموذج التضمين وذاكرة المتجهات مشتركان مع فهارس أخرى فلا يُمسّان.
+        """
+        self.is_ready = False
+        if self.metadata is not None:
+            self.metadata.close()
+        self.metadata = None
+        self.index = None
+        self.vector_ids = None
+        self.lexical_index = None
+
+    def _timed_phase(self, name: str, load) -> None:
+        start = time.perf_counter()
+        load()
+        self.load_timings[f"{name}_ms"] = (time.perf_counter() - start) * 1000
+
+    def _load_model(self) -> None:
+        # --- تحميل نموذج التضمين (محليًا أو عبر خادم التضمين المشترك) ---
+        if self.model is not None:
+            logging.info("استخدام نموذج التضمين المحمَّل مسبقًا.")
+        elif settings.EMBEDDING_SERVER_ADDRESS:
+            logging.info(f"استخدام خادم التضمين المشترك على: {settings.EMBEDDING_SERVER_ADDRESS}")
+            self.model = RemoteEncoder(
+                settings.EMBEDDING_SERVER_ADDRESS,
+                authkey=require_authkey(settings.EMBEDDING_SERVER_AUTHKEY),
+            )
+        else:
+            self.model = load_embedding_model(
+                settings.EMBEDDING_MODEL_NAME,
+                backend=settings.EMBEDDING_BACKEND,
+                onnx_model_dir=settings.ONNX_MODEL_DIR,
+                num_threads=settings.ONNX_NUM_THREADS,
+            )
+            logging.info(f"تم تحميل نموذج التضمين بنجاح (الواجهة: {settings.EMBEDDING_BACKEND}).")
+
+    def _load_index(self, index_path: str) -> None:
+        logging.info(f"بدء تحميل فهرس FAISS من: {index_path}")
+        # مع IO_FLAG_MMAP تُقرأ بيانات الفهرس من ذاكرة الصفحات المشتركة لنظام التشغيل
+        # بدلًا من نسخة خاصة بكل عامل (القوائم المعكوسة لفهارس IVF في faiss 1.7.x)
+        io_flags = faiss.IO_FLAG_MMAP if settings.INDEX_MMAP else 0
+        self.index = faiss.read_index(index_path, io_flags)
+        logging.info(f"تم تحميل الفهرس بنجاح (mmap={settings.INDEX_MMAP}). عدد المتجهات: {self.index.ntotal}")
+
+        # تطبيق معاملات البحث المسجلة مع الفهرس (مع إمكانية تجاوزها من الإعدادات)
+        self.index_config = load_index_config(index_path)
+        if settings.INDEX_NPROBE is not None:
+            self.index_config.nprobe = settings.INDEX_NPROBE
+        if settings.INDEX_EF_SEARCH is not None:
+            self.index_config.ef_search = settings.INDEX_EF_SEARCH
+        apply_search_params(self.index, self.index_config)
+        logging.info(f"نوع الفهرس: {self.index_config.index_type}، المقياس: {self.index_config.metric}")
+
+        # الفهارس المبنية بمعرّفات صريحة (الاستيعاب التزايدي) تُرجع معرّفات متجهات لا أرقام صفوف
+        self.vector_ids = load_vector_ids(index_path)
+
+    def _load_metadata(self, metadata_path: str) -> None:
+        logging.info(f"بدء تحميل البيانات الوصفية من: {metadata_path}")
+        self.metadata = load_metadata_store(metadata_path)
+        logging.info(f"تم تحميل البيانات الوصفية بنجاح. عدد السجلات: {len(self.metadata)}")
+
+    def _load_lexical_index(self, index_path: str) -> None:
+        if settings.RETRIEVAL_MODE == "hybrid":
+            self.lexical_index = load_lexical_index(index_path)
+
+    def prime_query_cache(self, queries: List[str], disk_cache_dir: Optional[str] = None) -> None:
+        """
+        تعبئة ذاكرة المتجهات المؤقتة بمتجهات الاستعلامات من ذاكرة المتجهات الدائمة على القرص،
+        مع ترميز غير المخزن منها دفعة واحدة وحفظه للتشغيلات التالية.
+        """
+        disk_cache_dir = disk_cache_dir or settings.EMBEDDING_DISK_CACHE_DIR
+        if self.query_cache is None or not disk_cache_dir or not queries:
+            return
+        disk_cache = DiskEmbeddingCache(
+            disk_cache_dir,
+            embedding_cache_name(settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_BACKEND, settings.ONNX_MODEL_DIR),
+            normalize=True,
+        )
+        vectors = disk_cache.encode(queries, lambda texts: self.model.encode(
+            texts, convert_to_tensor=False, normalize_embeddings=True
+        ))
+        for row, query in enumerate(queries):
+            self.query_cache.put(normalize_query(query), vectors[row:row + 1])
+        logging.info(f"تمت تعبئة ذاكرة المتجهات المؤقتة بـ {len(queries)} استعلام ({disk_cache.stats()}).")
+
+    def warmup(self, queries: List[str], k: int = 3) -> None:
+        """
+        تشغيل استعلامات تمهيدية لتسخين النموذج والفهرس قبل استقبال الطلبات الفعلية.
+        """
+        start = time.perf_counter()
+        try:
+            self.prime_query_cache(queries)
+        except OSError as e:
+            # ذاكرة المتجهات الدائمة اختيارية؛ نظام ملفات للقراءة فقط لا يمنع التسخين
+            logging.warning(f"تعذر استخدام ذاكرة المتجهات الدائمة أثناء التسخين: {e}")
+        if queries:
+            # استدعاء مباشر للنموذج خارج ذاكرة المتجهات (التي قد تكون عُبئت من القرص للتو) حتى
+            # يدفع التسخين كلفة الاستدعاء الأول للنموذج (تهيئة الرسم الحسابي والذاكرة) لا أول طلب فعلي
+            self.model.encode(queries[:1], convert_to_tensor=False, normalize_embeddings=True)
+        for query in queries:
+            self.search(query, k=k)
+        self.load_timings["warmup_ms"] = (time.perf_counter() - start) * 1000
+        logging.info(f"اكتمل تسخين Retriever ({self.index_version}) بـ {len(queries)} استعلام.")
+
+    def chunk_vectors(self, chunks: List[Dict]) -> Optional[np.ndarray]:
+        """
+        متجهات المقاطع المسترجعة كما خُزنت في الفهرس (دون إعادة ترميز)، لإزالة المقاطع شبه المكررة.
+        تُرجع None إن كان الفهرس لا يدعم استرجاع المتجهات (مثل IVF دون خريطة مباشرة) أو غاب أحد المعرّفات.
+        """
+        rows = [self.metadata.row_for_id(str(chunk.get("id"))) for chunk in chunks]
+        if not rows or any(row is None for row in rows):
+            return None
+        rows = np.asarray(rows, dtype=np.int64)
+        vector_ids = self.vector_ids.ids_for_rows(rows) if self.vector_ids is not None else rows
+        try:
+            return self.index.reconstruct_batch(vector_ids)
+        except RuntimeError:
+            return None
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """
+        تحويل الاستعلام إلى متجه مُطبَّع بالشكل (1, d)، مع استخدام ذاكرة التخزين المؤقت إن كانت مفعّلة.
+        """
+        return self.encode_queries([query])
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        تحويل مجموعة استعلامات إلى مصفوفة متجهات بالشكل (n, d) باستدعاء واحد للنموذج.
+        الاستعلامات الموجودة في ذاكرة التخزين المؤقت لا يُعاد ترميزها.
+        """
+        cache_keys = [normalize_query(query) for query in queries]
+        vectors: Dict[str, np.ndarray] = {}
+
+        if self.query_cache is not None:
+            for cache_key in cache_keys:
+                if cache_key not in vectors:
+                    cached_vector = self.query_cache.get(cache_key)
+                    if cached_vector is not None:
+                        vectors[cache_key] = cached_vector
+
+        # ترميز الاستعلامات غير المخزنة دفعة واحدة (مع إزالة التكرار)
+        pending: Dict[str, str] = {}
+        for query, cache_key in zip(queries, cache_keys):
+            if cache_key not in vectors and cache_key not in pending:
+                pending[cache_key] = query
+
+        if pending:
+            with span("embedding.model", texts=len(pending)):
+                encoded = self.model.encode(list(pending.values()), convert_to_tensor=False, normalize_embeddings=True)
+            encoded = np.array(encoded, dtype='float32')
+            for row, cache_key in enumerate(pending):
+                query_vector = encoded[row:row + 1]
+                vectors[cache_key] = query_vector
+                if self.query_cache is not None:
+                    self.query_cache.put(cache_key, query_vector)
+
+        if len(cache_keys) == 1:
+            return vectors[cache_keys[0]]
+        return np.vstack([vectors[cache_key] for cache_key in cache_keys])
+
+    def search(self, query: str, k: int = 3, return_vector: bool = False):
         """
         البحث عن أكثر k من المستندات صلة باستعلام معين.
+        مع return_vector تُرجع (النتائج، متجه الاستعلام أو None) كما في search_batch.
         """
         if not self.is_ready:
             raise RuntimeError("Retriever ليس جاهزًا. هل تم استدعاء .load() بنجاح؟")
         
         logging.info(f"بدء البحث عن الاستعلام: '{query}'")
-        
-        # 1. تحويل الاستعلام إلى متجه
-        query_vector = self.model.encode([query], convert_to_tensor=False, normalize_embeddings=True)
-        query_vector = np.array(query_vector, dtype='float32')
+        results, vectors = self._search_batch([query], [k])
+        logging.info(f"تم العثور على {len(results[0])} نتيجة.")
+        return (results[0], vectors[0]) if return_vector else results[0]
 
-        # 2. البحث في فهرس FAISS
-        # D: distances, I: indices
-        distances, indices = self.index.search(query_vector, k)
-        
-        # 3. تجميع النتائج مع البيانات الوصفية
+    def search_batch(self, queries: List[str], ks: List[int], return_vectors: bool = False):
+        """
+        البحث عن مجموعة استعلامات دفعة واحدة: ترميز واحد للمصفوفة كاملة واستدعاء واحد لـ index.search
+        بأكبر قيمة k، ثم اقتطاع نتائج كل استعلام حسب k الخاصة به.
+        مع return_vectors تُرجع (النتائج، المتجهات) حيث متجه كل استعلام بالشكل (1, d) كما رُمِّز للبحث،
+        أو None لاستعلام أُجيب من المسار المعجمي دون ترميز، حتى لا يُعاد ترميزه لذاكرة الإجابات.
+        """
+        results, vectors = self._search_batch(queries, ks)
+        return (results, vectors) if return_vectors else results
+
+    def _search_batch(self, queries: List[str], ks: List[int]) -> Tuple[List[List[Dict]], List[Optional[np.ndarray]]]:
+        if not self.is_ready:
+            raise RuntimeError("Retriever ليس جاهزًا. هل تم استدعاء .load() بنجاح؟")
+        if len(queries) != len(ks):
+            raise ValueError("يجب أن يتطابق عدد الاستعلامات مع عدد قيم k.")
+        if not queries:
+            return [], []
+
+        vectors: List[Optional[np.ndarray]] = [None] * len(queries)
+        if self.lexical_index is None:
+            self._count("dense", len(queries))
+            query_vectors = self._timed_encode(queries)
+            distances, indices = self._timed_index_search(query_vectors, max(ks))
+            with span("metadata.assemble"):
+                results = [
+                    self._collect_results(distances[row][:k], indices[row][:k])
+                    for row, k in enumerate(ks)
+                ]
+            return results, [query_vectors[row:row + 1] for row in range(len(queries))]
+
+        # البحث المعجمي أولًا: الاستعلامات ذات المطابقة المهيمنة لا تحتاج إلى ترميز ولا إلى FAISS
+        candidates = max(max(ks), settings.HYBRID_CANDIDATES)
+        lexical_start = time.perf_counter()
+        with span("bm25.search", queries=len(queries)):
+            lexical_hits = [self.lexical_index.search(query, candidates) for query in queries]
+        observe_stage("lexical_search", time.perf_counter() - lexical_start)
+        results: List[Optional[List[Dict]]] = [None] * len(queries)
+        dense_positions = []
+        for position, (hits, k) in enumerate(zip(lexical_hits, ks)):
+            if settings.LEXICAL_FAST_PATH_ENABLED and self._is_dominant(hits):
+                results[position] = self._collect_lexical_results(hits, k)
+            else:
+                dense_positions.append(position)
+        self._count("lexical", len(queries) - len(dense_positions))
+        if not dense_positions:
+            return results, vectors
+
+        self._count("hybrid", len(dense_positions))
+        query_vectors = self._timed_encode([queries[position] for position in dense_positions])
+        distances, indices = self._timed_index_search(query_vectors, candidates)
+        with span("fusion.assemble"):
+            for row, position in enumerate(dense_positions):
+                results[position] = self._fuse_results(
+                    distances[row], indices[row], lexical_hits[position], ks[position]
+                )
+                vectors[position] = query_vectors[row:row + 1]
+        return results, vectors
+
+    def _timed_encode(self, queries: List[str]) -> np.ndarray:
+        start = time.perf_counter()
+        with span("embedding.encode", queries=len(queries)):
+            query_vectors = self.encode_queries(queries)
+        observe_stage("embedding", time.perf_counter() - start)
+        return query_vectors
+
+    def _timed_index_search(self, query_vectors: np.ndarray, k: int):
+        start = time.perf_counter()
+        with span("faiss.search", queries=len(query_vectors), k=k):
+            result = self.index.search(query_vectors, k)
+        observe_stage("index_search", time.perf_counter() - start)
+        return result
+
+    def _count(self, path: str, count: int) -> None:
+        if count:
+            with self._stats_lock:
+                self.retrieval_stats[path] += count
+
+    @staticmethod
+    def _is_dominant(hits: LexicalHits) -> bool:
+        """
+        المطابقة المعجمية مهيمنة إذا غطّى المستند الأول كل مصطلحات الاستعلام
+        وتجاوزت درجته درجة الثاني بنسبة LEXICAL_FAST_PATH_MIN_RATIO على الأقل.
+        """
+        if not len(hits) or hits.coverage[0] < 1.0:
+            return False
+        return len(hits) == 1 or hits.scores[0] >= settings.LEXICAL_FAST_PATH_MIN_RATIO * hits.scores[1]
+
+    def _collect_lexical_results(self, hits: LexicalHits, k: int) -> List[Dict]:
+        """
+        نتائج المسار المعجمي السريع. لا يوجد تشابه دلالي دون ترميز، لذا تكون retrieval_score درجة
+        BM25 نسبةً إلى المطابقة المهيمنة مضروبة في تغطية مصطلحات الاستعلام: 1.0 للأولى (تغطي كل
+        المصطلحات) و1/LEXICAL_FAST_PATH_MIN_RATIO على الأكثر لما بعدها، فتبقى الإجابة المباشرة
+        والاحتياطية متاحتين لهذه المطابقات الواثقة.
+        """
+        results = []
+        top_score = float(hits.scores[0])
+        for row, score, coverage in zip(hits.rows[:k], hits.scores[:k], hits.coverage[:k]):
+            result = self.metadata.record(int(row))
+            result['retrieval_score'] = float(coverage) * float(score) / top_score if top_score > 0 else 0.0
+            result['lexical_score'] = float(score)
+            result['retrieval_method'] = "lexical"
+            results.append(result)
+        return results
+
+    def _fuse_results(self, distances: np.ndarray, indices: np.ndarray, hits: LexicalHits, k: int) -> List[Dict]:
+        """
+        دمج الترتيبين الدلالي والمعجمي بـ Reciprocal Rank Fusion. تبقى retrieval_score هي درجة
+        التشابه الدلالي (0 للمستندات التي وجدها البحث المعجمي وحده).
+        """
+        scores = distances_to_scores(distances, self.index_config)
+        if self.vector_ids is not None:
+            indices = self.vector_ids.rows(indices)
+        found = indices != -1
+        dense_rows, dense_scores = indices[found], scores[found]
+
+        dense_by_row = {int(row): float(score) for row, score in zip(dense_rows, dense_scores)}
+        lexical_by_row = {int(row): float(score) for row, score in zip(hits.rows, hits.scores)}
         results = []
-        for i in range(len(indices[0])):
-            idx = indices[0][i]
+        for row, fusion_score in reciprocal_rank_fusion([dense_rows, hits.rows], k, settings.RRF_K):
+            result = self.metadata.record(row)
+            result['retrieval_score'] = dense_by_row.get(row, 0.0)
+            result['lexical_score'] = lexical_by_row.get(row, 0.0)
+            result['fusion_score'] = fusion_score
+            result['retrieval_method'] = "hybrid"
+            results.append(result)
+        return results
+
+    def _collect_results(self, distances: np.ndarray, indices: np.ndarray) -> List[Dict]:
+        scores = distances_to_scores(distances, self.index_config)
+        if self.vector_ids is not None:
+            indices = self.vector_ids.rows(indices)
+        results = []
+        for i in range(len(indices)):
+            idx = indices[i]
             # تجاهل النتائج غير الصحيحة إذا كانت k أكبر من عدد المستندات
             if idx == -1:
                 continue
             
-            result = self.metadata[idx]
-            result['retrieval_score'] = 1 - distances[0][i] # تحويل المسافة إلى درجة تشابه
+            # سجل جديد لكل طلب؛ لا تُعدَّل البيانات الوصفية المشتركة أبدًا
+            result = self.metadata.record(int(idx))
+            result['retrieval_score'] = float(scores[i])
             results.append(result)
-            
-        logging.info(f"تم العثور على {len(results)} نتيجة.")
         return results
-    
-    
\ No newline at end of file
@@ -0,0 +1,94 @@
+# app/core/singleflight.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from .text_normalization import normalize_query
+
+# دمج الطلبات المتطابقة الجارية (singleflight): أول طلب لمفتاح ما ينفذ الحساب في مهمة مستقلة،
+# ومن يصل بالمفتاح نفسه قبل انتهائه ينتظر النتيجة ذاتها بدل استرجاع وتوليد جديدين.
+# الحساب لا يتبع عمر أي مستدعٍ بعينه: انتهاء مهلة أحدهم أو انقطاعه لا يلغيه للآخرين، ويُلغى فقط
+# عندما يتخلى عنه جميع المنتظرين. الأخطاء تصل إلى كل المنتظرين كما هي، ولا تُخزَّن النتيجة بعد
+# انتهاء الحساب (الطلب اللاحق يبدأ حسابًا جديدًا؛ التخزين مسؤولية ذاكرة الإجابات).
+# يعمل داخل حلقة الأحداث دون أقفال؛ لكل عامل uvicorn طلباته الجارية الخاصة.
+T = TypeVar("T")
+
+
+class WaitTimeoutError(asyncio.TimeoutError):
+    """انتهت مهلة هذا المستدعي قبل انتهاء الحساب المشترك (الذي يستمر لبقية المنتظرين)."""
+
+
+def coalescing_key(query: str, k: int, index_version: str) -> Tuple[str, int, str]:
+    return normalize_query(query), k, index_version
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """مجموعة الحسابات الجارية مفهرسة بالمفتاح، مع عدادات للمنفذين والمنتظرين ومن تجاوز مهلته."""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, operation: Callable[[], Awaitable[T]],
+                 timeout: Optional[float] = None) -> Tuple[T, bool]:
+        """
+        تنفيذ operation() أو انتظار الحساب الجاري بالمفتاح نفسه، لمدة لا تتجاوز timeout ثانية
+        لهذا المستدعي. تُرجع (النتيجة، shared) حيث shared صحيحة إن كانت النتيجة من حساب بدأه غيره.
+        تثير WaitTimeoutError عند تجاوز المهلة، أو استثناء الحساب نفسه إن فشل.
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(operation()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task: self._forget(key, flight))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        flight.waiters += 1
+        try:
+            # shield: إلغاء انتظار هذا المستدعي (مهلة أو انقطاع) لا يلغي الحساب المشترك
+            return await asyncio.wait_for(asyncio.shield(flight.task), timeout), shared
+        except asyncio.TimeoutError as e:
+            if flight.task.done():
+                raise  # مهلة داخل الحساب نفسه، لا مهلة الانتظار
+            self.timeouts += 1
+            raise WaitTimeoutError(f"coalesced request did not finish within {timeout}s") from e
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                logging.debug(f"إلغاء حساب مدمج لم يعد له منتظرون: {key!r}")
+                # يُزال فورًا (لا عند تنفيذ done callback) حتى لا ينضم طلب جديد إلى مهمة ملغاة
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # قراءة الاستثناء حتى لا يُسجَّل تحذير "never retrieved" عندما لا يبقى منتظر
+        if flight.task.done() and not flight.task.cancelled():
+            flight.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "timeouts": self.timeouts,
+            "coalesced_ratio": self.followers / requests if requests else 0.0,
+        }
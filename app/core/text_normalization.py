@@ -0,0 +1,27 @@
+# app/core/text_normalization.py
+import re
+
+# --- أنماط التطبيع ---
+# التشكيل (الحركات، التنوين، الشدة، السكون، الألف الخنجرية) والتطويل
+_DIACRITICS_PATTERN = re.compile(r"[\u064B-\u0652\u0670\u0640]")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# توحيد أشكال الألف والياء
+_CHAR_MAP = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ى": "ي",
+})
+
+
+def normalize_query(text: str) -> str:
+    """
+    تطبيع نص الاستعلام لاستخدامه كمفتاح ثابت: إزالة التشكيل والتطويل،
+    توحيد أشكال الألف والياء، تحويل الأحرف اللاتينية إلى أحرف صغيرة وضغط المسافات.
+    """
+    text = _DIACRITICS_PATTERN.sub("", text)
+    text = text.translate(_CHAR_MAP)
+    text = _WHITESPACE_PATTERN.sub(" ", text)
+    return text.strip().lower()
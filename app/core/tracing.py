@@ -0,0 +1,195 @@
+# app/core/tracing.py
+import cProfile
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# تتبع اختياري لكل طلب: يُفعَّل لعينة عشوائية من الطلبات أو بطلب صريح عبر ترويسة X-Trace،
+# ويسجل مقاطع زمنية متداخلة (spans) لمراحل الاسترجاع والتوليد في ملف JSONL دوّار.
+# خارج الطلبات المتتبَّعة تكلّف span() قراءة ContextVar واحدة فقط.
+TRACE_HEADER = "X-Trace"
+PROFILE_TOP_FUNCTIONS = 25
+# أقصى عدد سجلات تنتظر الكتابة؛ عند امتلائه تُسقط السجلات الجديدة بدل إبطاء الطلبات
+TRACE_QUEUE_SIZE = 1000
+_WRITER_STOP = object()
+
+_active_trace: ContextVar[Optional["Trace"]] = ContextVar("rag_trace", default=None)
+_parent_span: ContextVar[Optional[int]] = ContextVar("rag_trace_parent_span", default=None)
+
+
+class Trace:
+    def __init__(self, request_id: str, name: str, reason: str, profile: bool = False):
+        self.request_id = request_id
+        self.name = name
+        self.reason = reason
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._span_ids = itertools.count(1)
+        self.spans: List[Dict[str, Any]] = []
+        # ملف تعريف CPU للعمل المتزامن داخل خيوط الاسترجاع (حيث يتركز استهلاك المعالج)
+        self.profiler: Optional[cProfile.Profile] = cProfile.Profile() if profile else None
+        self._profiler_lock = threading.Lock()
+
+    def elapsed_ms(self, moment: Optional[float] = None) -> float:
+        return ((moment or time.perf_counter()) - self._start) * 1000
+
+    def to_record(self, **extra) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration_ms": self.elapsed_ms(),
+            **extra,
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _active_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[None]:
+    """مقطع زمني متداخل ضمن التتبع النشط؛ لا يفعل شيئًا إذا لم يكن الطلب متتبَّعًا."""
+    trace = _active_trace.get()
+    if trace is None:
+        yield
+        return
+    span_id = next(trace._span_ids)
+    token = _parent_span.set(span_id)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _parent_span.reset(token)
+        trace.spans.append({
+            "id": span_id,
+            "parent": _parent_span.get(),
+            "name": name,
+            "start_ms": trace.elapsed_ms(start),
+            "duration_ms": (end - start) * 1000,
+            "thread": threading.current_thread().name,
+            **attributes,
+        })
+
+
+def profiled(func: Callable) -> Callable:
+    """تغليف دالة متزامنة بحيث تُضاف إلى ملف تعريف CPU للتتبع النشط إن كان مطلوبًا."""
+    def run(*args, **kwargs):
+        trace = _active_trace.get()
+        if trace is None or trace.profiler is None:
+            return func(*args, **kwargs)
+        # كائن cProfile لا يعمل في خيطين معًا، لذا تُسلسَل الأجزاء المُعرَّفة للطلب الواحد
+        with trace._profiler_lock:
+            trace.profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                trace.profiler.disable()
+    return run
+
+
+def trace_reason(header_value: Optional[str], sample_rate: float, header_enabled: bool) -> Optional[str]:
+    """سبب تتبع الطلب: "header" عند طلبه صراحة، "sampled" ضمن العينة العشوائية، أو None."""
+    if header_enabled and header_value and header_value.lower() in ("1", "true", "profile"):
+        return "header"
+    if sample_rate > 0 and random.random() < sample_rate:
+        return "sampled"
+    return None
+
+
+def start_trace(request_id: str, name: str, reason: str, profile: bool = False) -> Tuple[Trace, Token]:
+    trace = Trace(request_id, name, reason, profile=profile)
+    return trace, _active_trace.set(trace)
+
+
+class TraceWriter:
+    """
+    كتابة سجلات التتبع سطرًا بسطر (JSONL) في ملف دوّار، وملفات تعريف CPU بجانبه.
+    write تضع التتبع في طابور فقط؛ بناء السجل والكتابة وحفظ ملف التعريف تتم في خيط واحد في الخلفية،
+    فلا يُحجب حلقة الأحداث بإدخال/إخراج الملفات.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        self.path = path
+        self.profile_dir = os.path.join(os.path.dirname(path) or ".", "profiles")
+        self._logger = logging.getLogger(f"rag_trace.{path}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        if not self._logger.handlers:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+        self.dropped = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._worker = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._worker.start()
+
+    def write(self, trace: Trace, **extra) -> None:
+        try:
+            self._queue.put_nowait((trace, extra))
+        except queue.Full:
+            self.dropped += 1
+            logging.warning(f"طابور التتبع ممتلئ؛ لم يُحفظ التتبع للطلب {trace.request_id}.")
+
+    def flush(self) -> None:
+        """انتظار كتابة كل السجلات الموجودة في الطابور."""
+        self._queue.join()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """كتابة ما تبقى في الطابور ثم إيقاف خيط الكتابة."""
+        if not self._worker.is_alive():
+            return
+        self._queue.put(_WRITER_STOP)
+        self._worker.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _WRITER_STOP:
+                    return
+                trace, extra = item
+                self._write_record(trace, **extra)
+            except Exception as e:
+                logging.warning(f"تعذر حفظ التتبع للطلب {item[0].request_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write_record(self, trace: Trace, **extra) -> None:
+        record = trace.to_record(**extra)
+        if trace.profiler is not None and trace.profiler.getstats():
+            record.update(self._dump_profile(trace))
+        self._logger.info(json.dumps(record, ensure_ascii=False))
+
+    def _dump_profile(self, trace: Trace) -> Dict[str, Any]:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profile_path = os.path.join(self.profile_dir, f"{trace.request_id}.prof")
+        trace.profiler.dump_stats(profile_path)
+        summary = io.StringIO()
+        pstats.Stats(trace.profiler, stream=summary).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        return {"profile_path": profile_path, "profile_top": summary.getvalue().splitlines()}
+
+
+def finish_trace(trace: Trace, token: Token, writer: TraceWriter, **extra) -> None:
+    try:
+        _active_trace.reset(token)
+    except ValueError:
+        # الاستجابة المتدفقة قد تكتمل في سياق مختلف عن سياق بدء التتبع
+        pass
+    # لا يحجب: الكتابة وملف التعريف في خيط TraceWriter
+    writer.write(trace, **extra)
@@ -1,18 +1,59 @@
 # app/main.py (النسخة النهائية والمُدققة - جاهزة للنشر)
 
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
+from functools import partial
+import json
 import logging
+import os
+import secrets
 import time
 import uuid
-from typing import Optional, List, Any, Dict
+from typing import Optional, List, Any, Dict, AsyncIterator, Tuple
 
-from fastapi import FastAPI, Request, Query, HTTPException
-from fastapi.responses import JSONResponse  # <-- تمت إعادته
+import numpy as np
+from fastapi import FastAPI, Request, Query, Header, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 from pydantic import BaseModel, Field
 
 from .config import settings
 from .core.retriever import Retriever
-from .core.generator import generate_answer
+from .core.generator import (
+    UPSTREAM_FAILURE_REASONS,
+    build_prompt,
+    configure_client,
+    generate_answer,
+    generate_answer_stream,
+    get_llm_caller,
+    llm_available,
+)
+from .core.answer_cache import SemanticAnswerCache
+from .core.direct_answer import DirectAnswerer
+from .core.batcher import RetrievalBatcher
+from .core.context_packing import ContextPacker, PackedContext
+from .core.index_registry import IndexRegistry
+from .core.singleflight import SingleFlight, WaitTimeoutError, coalescing_key
+from .core.metrics import (
+    ANSWERS,
+    HTTP_RESPONSES,
+    IN_FLIGHT,
+    ServiceCollector,
+    observe_stage,
+    observe_timings,
+)
+from .core.tracing import (
+    TRACE_HEADER,
+    TraceWriter,
+    current_trace,
+    finish_trace,
+    profiled,
+    span,
+    start_trace,
+    trace_reason,
+)
 
 # --- إعدادات التسجيل ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
@@ -20,20 +61,138 @@ logger = logging.getLogger("rag_service")
 
 # --- متغيرات عامة ---
 retriever_instance: Optional[Retriever] = None
+retrieval_batcher: Optional[RetrievalBatcher] = None
+retrieval_executor: Optional[ThreadPoolExecutor] = None
+# حالة إعادة تحميل الفهرس
+pending_index_version: Optional[str] = None
+last_reload_error: Optional[str] = None
+background_tasks: set = set()
+# زمن كل مرحلة من مراحل بدء التشغيل بالمللي ثانية (يُعرض في /healthz)
+startup_timings: Dict[str, float] = {}
+answer_cache: Optional[SemanticAnswerCache] = (
+    SemanticAnswerCache(
+        max_size=settings.ANSWER_CACHE_SIZE,
+        ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    )
+    if settings.ANSWER_CACHE_ENABLED else None
+)
+direct_answerer: Optional[DirectAnswerer] = (
+    DirectAnswerer(
+        min_score=settings.DIRECT_ANSWER_MIN_SCORE,
+        min_margin=settings.DIRECT_ANSWER_MIN_MARGIN,
+    )
+    if settings.DIRECT_ANSWER_ENABLED else None
+)
+# إجابة احتياطية عند تعذر الوصول إلى Gemini: الإجابة المخزنة لأعلى سجل بعتبة أخف من الإجابة المباشرة
+fallback_answerer: Optional[DirectAnswerer] = (
+    DirectAnswerer(min_score=settings.LLM_FALLBACK_MIN_SCORE, min_margin=0.0)
+    if settings.LLM_FALLBACK_ENABLED else None
+)
+# تعبئة مقاطع السياق في ميزانية رموز الموجه قبل إرسالها إلى Gemini (المصادر المعروضة لا تتغير)
+context_packer: Optional[ContextPacker] = (
+    ContextPacker(
+        max_input_tokens=settings.CONTEXT_MAX_INPUT_TOKENS,
+        dedup_threshold=settings.CONTEXT_DEDUP_THRESHOLD,
+        chars_per_token=settings.CONTEXT_CHARS_PER_TOKEN,
+    )
+    if settings.CONTEXT_PACKING_ENABLED else None
+)
+
+# فهارس مسماة إضافية بجانب الفهرس الافتراضي، تتشارك نموذج التضمين وتُحمَّل عند الطلب
+index_registry: Optional[IndexRegistry] = (
+    IndexRegistry(
+        settings.NAMED_INDEXES,
+        memory_budget_bytes=int(settings.INDEX_MEMORY_BUDGET_MB * 2**20),
+        shared_retriever=lambda: retriever_instance,
+        warmup_queries=settings.WARMUP_QUERIES if settings.STARTUP_WARMUP_ENABLED else None,
+        on_evict=lambda index_version: release_index_version(index_version),
+    )
+    if settings.NAMED_INDEXES else None
+)
+
+# دمج طلبات /api/v1/ask المتطابقة الجارية (singleflight)
+request_coalescer: Optional[SingleFlight] = SingleFlight() if settings.COALESCING_ENABLED else None
+
+trace_writer: Optional[TraceWriter] = None
+
+# إحصائيات الذاكرات المؤقتة والمُجمِّع وحجم الفهرس تُقرأ من الحالة الحالية عند طلب /metrics فقط
+REGISTRY.register(ServiceCollector(lambda: {
+    "retriever": retriever_instance,
+    "answer_cache": answer_cache,
+    "direct_answerer": direct_answerer,
+    "batcher": retrieval_batcher,
+    "coalescer": request_coalescer,
+    "index_registry": index_registry,
+}))
 
 # --- دورة حياة التطبيق ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global retriever_instance
+    global retriever_instance, retrieval_batcher, retrieval_executor, trace_writer
     logger.info("--- بدء تحميل الموارد عند بدء التشغيل ---")
-    try:
-        retriever_instance = Retriever()
-        retriever_instance.load()
+    # منفذ مخصص ومحدود لعمليات الاسترجاع كثيفة المعالجة، بمعزل عن حلقة الأحداث
+    retrieval_executor = ThreadPoolExecutor(
+        max_workers=settings.RETRIEVAL_WORKERS,
+        thread_name_prefix="retrieval",
+    )
+    # تحميل المسترجع (النموذج والفهرس والبيانات الوصفية بالتوازي داخله) وتهيئة عميل Gemini
+    # (استيراد google.generativeai) في خيطين متزامنين، ثم التسخين قبل استقبال أول طلب
+    startup_start = time.perf_counter()
+
+    async def timed(phase: str, func, *args):
+        phase_start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(func, *args)
+        finally:
+            startup_timings[f"{phase}_ms"] = (time.perf_counter() - phase_start) * 1000
+
+    retriever = Retriever()
+    retriever_loaded, _ = await asyncio.gather(
+        timed("retriever_load", retriever.load),
+        timed("llm_client", configure_client),
+        return_exceptions=True,
+    )
+    if isinstance(retriever_loaded, Exception):
+        logger.error("فشل فادح في تهيئة المسترجع عند بدء التشغيل: %s", retriever_loaded)
+    else:
+        if settings.STARTUP_WARMUP_ENABLED:
+            try:
+                await timed("warmup", retriever.warmup, settings.WARMUP_QUERIES)
+            except Exception as e:
+                logger.exception("فشل تسخين المسترجع عند بدء التشغيل: %s", e)
+        retriever_instance = retriever
         logger.info("تم تحميل المسترجع بنجاح.")
-    except Exception as e:
-        logger.exception("فشل فادح في تهيئة المسترجع عند بدء التشغيل: %s", e)
+    startup_timings.update({
+        f"retriever.{phase}": ms for phase, ms in retriever.load_timings.items() if phase != "warmup_ms"
+    })
+    startup_timings["total_ms"] = (time.perf_counter() - startup_start) * 1000
+    logger.info("اكتمل بدء التشغيل في %.0f ms. أزمنة المراحل: %s", startup_timings["total_ms"], startup_timings)
+
+    if settings.BATCHING_ENABLED:
+        retrieval_batcher = RetrievalBatcher(
+            max_batch_size=settings.BATCH_MAX_SIZE,
+            max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+        )
+        retrieval_batcher.start()
+
+    version_watcher = None
+    if settings.INDEX_VERSION_FILE:
+        version_watcher = asyncio.create_task(
+            watch_index_version_file(settings.INDEX_VERSION_FILE, settings.INDEX_VERSION_POLL_SECONDS)
+        )
     yield
     logger.info("--- إغلاق الموارد عند إيقاف التشغيل ---")
+    if version_watcher is not None:
+        version_watcher.cancel()
+    if retrieval_batcher is not None:
+        retrieval_batcher.stop()
+        retrieval_batcher = None
+    retrieval_executor.shutdown(wait=False)
+    retrieval_executor = None
+    if trace_writer is not None:
+        trace_writer.close()
+        trace_writer = None
 
 # --- تطبيق FastAPI ---
 app = FastAPI(
@@ -50,6 +209,17 @@ class HealthResponse(BaseModel):
     status: str = Field(default="ok")
     index_version: str
     retriever_ready: bool
+    pending_index_version: Optional[str] = None
+    last_reload_error: Optional[str] = None
+    embedding_cache: Optional[Dict[str, int]] = None
+    answer_cache: Optional[Dict[str, int]] = None
+    direct_answer: Optional[Dict[str, float]] = None
+    batcher: Optional[Dict[str, float]] = None
+    retrieval: Optional[Dict[str, int]] = None
+    llm: Optional[Dict[str, Any]] = None
+    coalescing: Optional[Dict[str, float]] = None
+    indexes: Optional[Dict[str, Any]] = None
+    startup: Optional[Dict[str, float]] = None
 
 class Source(BaseModel):
     id: str
@@ -62,12 +232,99 @@ class RAGResponse(BaseModel):
     confidence_score: float = Field(..., ge=0, le=1)
     sources: List[Source]
     timings: Dict[str, float]
+    answer_source: str = Field(default="llm", description="مصدر الإجابة: llm أو cache أو direct أو fallback")
+
+class ReloadResponse(BaseModel):
+    status: str
+    index_version: str
 
 class ErrorResponse(BaseModel):
     error: str
     detail: Optional[str] = None
 
+class BatchAskItem(BaseModel):
+    query: str = Field(..., min_length=3, max_length=512, description="السؤال المراد طرحه")
+    k: int = Field(3, ge=1, le=5, description="عدد المصادر المراد استرجاعها")
+
+class BatchAskRequest(BaseModel):
+    items: List[BatchAskItem] = Field(..., min_length=1, max_length=settings.BATCH_ASK_MAX_ITEMS)
+
+class BatchAskResult(BaseModel):
+    index: int
+    response: Optional[RAGResponse] = None
+    error: Optional[ErrorResponse] = None
+
+class BatchAskResponse(BaseModel):
+    request_id: str
+    results: List[BatchAskResult]
+    timings: Dict[str, float]
+
 # --- Middleware ---
+# يُعرَّف قبل add_request_id ليكون داخله (آخر وسيط مُعرَّف هو الخارجي)، فيتوفر request_id عند بدء التتبع
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    global trace_writer
+    if not request.url.path.startswith("/api/v1/ask"):
+        return await call_next(request)
+    header_value = request.headers.get(TRACE_HEADER)
+    reason = trace_reason(header_value, settings.TRACE_SAMPLE_RATE, settings.TRACE_HEADER_ENABLED)
+    if reason is None:
+        return await call_next(request)
+
+    if trace_writer is None:
+        trace_writer = TraceWriter(settings.TRACE_FILE, settings.TRACE_FILE_MAX_BYTES, settings.TRACE_FILE_BACKUPS)
+    writer = trace_writer
+    profile = settings.TRACE_PROFILE_ENABLED and (header_value or "").lower() == "profile"
+    trace, token = start_trace(request.state.request_id, request.url.path, reason, profile=profile)
+    try:
+        response = await call_next(request)
+    except Exception:
+        finish_trace(trace, token, writer, method=request.method, status=500)
+        raise
+    response.headers["X-Trace-ID"] = trace.request_id
+
+    # الاستجابة (خصوصًا المتدفقة) تُكتب بعد عودة call_next، لذا يُغلق التتبع بعد آخر جزء منها
+    body_iterator = response.body_iterator
+
+    async def traced_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            finish_trace(trace, token, writer, method=request.method, status=response.status_code)
+
+    response.body_iterator = traced_body()
+    return response
+
+@app.middleware("http")
+async def release_index_leases(request: Request, call_next):
+    if index_registry is None or not request.url.path.startswith("/api/v1/ask"):
+        return await call_next(request)
+
+    def release() -> None:
+        for retriever in getattr(request.state, "index_leases", []):
+            index_registry.release(retriever)
+        request.state.index_leases = []
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        release()
+        raise
+
+    # الفهرس المسمى يبقى محجوزًا حتى يُكتب آخر جزء من الاستجابة (خصوصًا تدفقات SSE)، كما في trace_requests
+    body_iterator = response.body_iterator
+
+    async def released_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            release()
+
+    response.body_iterator = released_body()
+    return response
+
 @app.middleware("http")
 async def add_request_id(request: Request, call_next):
     request_id = str(uuid.uuid4())
@@ -76,6 +333,37 @@ async def add_request_id(request: Request, call_next):
     response.headers["X-Request-ID"] = request_id
     return response
 
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    if not settings.METRICS_ENABLED:
+        return await call_next(request)
+    IN_FLIGHT.inc()
+
+    def finish(status: int) -> None:
+        IN_FLIGHT.dec()
+        # قالب المسار (لا المسار الفعلي) لتبقى قيم التسمية محدودة
+        route = request.scope.get("route")
+        HTTP_RESPONSES.labels(route.path if route is not None else "unmatched", str(status)).inc()
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        finish(500)
+        raise
+
+    # الطلب يبقى جاريًا حتى يُكتب آخر جزء من الاستجابة (خصوصًا تدفقات SSE)، كما في trace_requests
+    body_iterator = response.body_iterator
+
+    async def counted_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            finish(response.status_code)
+
+    response.body_iterator = counted_body()
+    return response
+
 # ✨ --- تمت إعادته: معالج الأخطاء العام الحيوي --- ✨
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
@@ -89,55 +377,345 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
         ).model_dump()
     )
 
+# --- إعادة تحميل الفهرس دون توقف ---
+async def reload_index(index_version: str) -> None:
+    """
+    تحميل إصدار جديد من الفهرس والبيانات الوصفية في الخلفية، ثم تسخينه، ثم تبديله ذريًا
+    بالمسترجع النشط. الطلبات الجارية تحتفظ بمرجعها للمسترجع القديم وتكتمل عليه.
+    """
+    global retriever_instance, pending_index_version, last_reload_error
+    current = retriever_instance
+    pending_index_version = index_version
+    last_reload_error = None
+    logger.info("--- بدء إعادة تحميل الفهرس: %s ---", index_version)
+    try:
+        # إعادة استخدام نموذج التضمين المحمَّل بالفعل لتجنب كلفة تحميله من جديد
+        shared_model = current.model if current is not None and current.is_ready else None
+        candidate = Retriever(index_version=index_version, model=shared_model)
+        await asyncio.to_thread(candidate.load)
+        await asyncio.to_thread(candidate.warmup, settings.WARMUP_QUERIES)
+        retriever_instance = candidate
+        logger.info(
+            "تم تفعيل إصدار الفهرس %s (السابق: %s).",
+            index_version, current.index_version if current is not None else None
+        )
+        if current is not None:
+            release_index_version(current.index_version)
+    except Exception as e:
+        last_reload_error = f"{index_version}: {e}"
+        logger.exception("فشلت إعادة تحميل الفهرس %s؛ يستمر العمل على الإصدار الحالي: %s", index_version, e)
+    finally:
+        pending_index_version = None
+
+
+def release_index_version(index_version: str) -> None:
+    """
+    حذف إجابات إصدار فهرس من ذاكرة الإجابات بعد أن توقف خدمته (إعادة تحميل أو إخراج)،
+    ما لم يكن ما زال يُخدم من الفهرس الافتراضي أو من فهرس مسمى محمَّل.
+    """
+    if answer_cache is None:
+        return
+    if retriever_instance is not None and retriever_instance.index_version == index_version:
+        return
+    if index_registry is not None and any(
+        entry.retriever.index_version == index_version for entry in index_registry.resident().values()
+    ):
+        return
+    answer_cache.invalidate(index_version)
+
+
+def start_index_reload(index_version: str) -> None:
+    global pending_index_version
+    # يُضبط هنا مباشرة حتى يرفض أي طلب لاحق قبل أن تبدأ المهمة فعليًا
+    pending_index_version = index_version
+    task = asyncio.create_task(reload_index(index_version))
+    # الاحتفاظ بمرجع للمهمة حتى لا يجمعها جامع القمامة قبل انتهائها
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def watch_index_version_file(path: str, interval_seconds: float) -> None:
+    """
+    مراقبة ملف يحتوي على إصدار الفهرس المطلوب (مثلًا ConfigMap) وإعادة التحميل عند تغيّره.
+    """
+    failed_version = None
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                requested_version = f.read().strip()
+        except OSError as e:
+            logger.warning("تعذرت قراءة ملف إصدار الفهرس %s: %s", path, e)
+            continue
+
+        active_version = retriever_instance.index_version if retriever_instance is not None else None
+        if (
+            requested_version
+            and requested_version != active_version
+            and requested_version != failed_version
+            and pending_index_version is None
+        ):
+            await reload_index(requested_version)
+            if last_reload_error is not None:
+                failed_version = requested_version
+
+
+# --- دوال مساعدة لمسار الطلب غير المتزامن ---
+async def run_in_retrieval_executor(func, *args, **kwargs):
+    """تشغيل دالة متزامنة كثيفة المعالجة على منفذ الاسترجاع دون حجب حلقة الأحداث."""
+    loop = asyncio.get_running_loop()
+    if current_trace() is None:
+        return await loop.run_in_executor(retrieval_executor, partial(func, *args, **kwargs))
+    # run_in_executor لا ينقل متغيرات السياق، فننقلها يدويًا حتى تُسجَّل مقاطع التتبع من خيط الاسترجاع
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(retrieval_executor, partial(context.run, profiled(func), *args, **kwargs))
+
+
+async def resolve_retriever(index: Optional[str], request: Request) -> Optional[Retriever]:
+    """
+    المسترجع الذي يوجَّه إليه الطلب: الافتراضي (retriever_instance) إن لم يُحدد فهرس،
+    وإلا الفهرس المسمى من سجل الفهارس (مع تحميله إن لم يكن محمَّلًا). الفهرس المسمى محجوز
+    للطلب حتى آخر جزء من الاستجابة (release_index_leases) فلا يُغلق إن أُخرج في أثنائه.
+    """
+    if not index or index == settings.DEFAULT_INDEX_NAME:
+        return retriever_instance
+    if index_registry is None or index not in index_registry:
+        raise HTTPException(status_code=404, detail=f"Unknown index: {index}")
+    try:
+        retriever = await index_registry.acquire(index)
+    except Exception as e:
+        logger.exception("تعذر تحميل الفهرس المسمى %s: %s", index, e)
+        raise HTTPException(status_code=503, detail=f"Service not ready: index '{index}' is unavailable.")
+    request.state.index_leases = getattr(request.state, "index_leases", []) + [retriever]
+    return retriever
+
+
+async def retrieve(retriever: Retriever, query: str, k: int) -> Tuple[List[Dict], Optional[Any]]:
+    """
+    الاسترجاع عبر محرك التجميع إن كان مفعّلًا، وإلا عبر منفذ الاسترجاع مباشرة.
+    الطلبات المتتبَّعة تتجاوز المُجمِّع حتى تُنسب مقاطع الترميز والبحث إلى الطلب نفسه.
+    تُرجع (المقاطع، متجه الاستعلام) ليُعاد استخدام المتجه في ذاكرة الإجابات؛ المتجه None إن
+    أُجيب الاستعلام من المسار المعجمي دون ترميز.
+    """
+    with span("retrieve", k=k):
+        if retrieval_batcher is not None and current_trace() is None:
+            return await asyncio.wrap_future(retrieval_batcher.submit(retriever, query, k))
+        return await run_in_retrieval_executor(retriever.search, query, k=k, return_vector=True)
+
+
+async def generate_with_cache(
+    retriever: Retriever,
+    query: str,
+    context_chunks: List[Dict],
+    query_vector: Optional[Any] = None
+) -> Tuple[Dict[str, Any], str]:
+    """
+    إجابة مباشرة من سجل الأسئلة الشائعة الأعلى تطابقًا، أو إجابة مخزنة لسؤال مشابه بنفس المصادر،
+    أو توليدها عبر Gemini وتخزينها. تُرجع (بيانات الإجابة، مصدر الإجابة).
+    """
+    if direct_answerer is not None:
+        with span("direct_answer"):
+            direct_data = direct_answerer.answer(context_chunks)
+        if direct_data is not None:
+            return direct_data, "direct"
+
+    if answer_cache is None:
+        with span("generate"):
+            generated_data = await generate_answer(query=query, context_chunks=await pack_context(retriever, query, context_chunks))
+        return with_fallback(generated_data, context_chunks)
+
+    with span("answer_cache.lookup"):
+        # الاستعلام الذي أُجيب معجميًا (دون متجه) يُطابَق بنصه المُطبَّع فلا يُرمَّز لأجل الذاكرة
+        source_ids = [c["id"] for c in context_chunks]
+        cached_data = answer_cache.get(query_vector, source_ids, retriever.index_version, query=query)
+    if cached_data is not None:
+        return cached_data, "cache"
+
+    with span("generate"):
+        generated_data = await generate_answer(query=query, context_chunks=await pack_context(retriever, query, context_chunks))
+    # لا نخزن رسائل الاعتذار الناتجة عن أخطاء التوليد
+    if generated_data["confidence_score"] > 0:
+        answer_cache.put(query_vector, source_ids, retriever.index_version, generated_data, query=query)
+    return with_fallback(generated_data, context_chunks)
+
+
+async def pack_context(retriever: Retriever, query: str, context_chunks: List[Dict]) -> List[Dict]:
+    """
+    المقاطع التي تُرسل فعلًا إلى Gemini: دون المقاطع شبه المكررة ومحصورة في CONTEXT_MAX_INPUT_TOKENS.
+    المتجهات تُقرأ من الفهرس (دون إعادة ترميز) وعند تعذر ذلك تُقارن المقاطع بمصطلحاتها.
+    قراءة المتجهات والمقارنة تعملان على منفذ الاسترجاع حتى لا تحجبا حلقة الأحداث.
+    """
+    if context_packer is None or not context_chunks:
+        return context_chunks
+    with span("context.pack", chunks=len(context_chunks)):
+        packed = await run_in_retrieval_executor(_pack_chunks, retriever, query, context_chunks)
+    if packed.removed_ids:
+        logger.debug(
+            "تعبئة السياق: أُزيل %d مقطع مكرر و%d مقطع خارج الميزانية (%s)",
+            packed.duplicates_removed, packed.chunks_dropped, packed.removed_ids,
+        )
+    return packed.chunks
+
+
+def _pack_chunks(retriever: Retriever, query: str, context_chunks: List[Dict]) -> PackedContext:
+    vectors = retriever.chunk_vectors(context_chunks)
+    return context_packer.pack(
+        context_chunks,
+        vectors=vectors if isinstance(vectors, np.ndarray) else None,
+        reserved_tokens=context_packer.tokens(build_prompt(query, [])),
+    )
+
+
+def token_timings(generated_data: Dict[str, Any], answer_source: str) -> Dict[str, int]:
+    """عدد رموز الموجه والإجابة لاستدعاء Gemini الفعلي (لا رموز للإجابات المخزنة أو المباشرة)."""
+    usage = generated_data.get("usage")
+    if answer_source != "llm" or not usage:
+        return {}
+    return {"prompt_tokens": usage["prompt_tokens"], "output_tokens": usage["output_tokens"]}
+
+
+async def answer_query(retriever: Retriever, query: str, k: int) -> Tuple[List[Dict], Dict[str, Any], str, Dict[str, float]]:
+    """الاسترجاع ثم التوليد لطلب /api/v1/ask. تُرجع (المقاطع، بيانات الإجابة، مصدر الإجابة، توقيتات المراحل)."""
+    # 1. مرحلة الاسترجاع
+    retrieval_start = time.perf_counter()
+    context_chunks, query_vector = await retrieve(retriever, query, k)
+    retrieval_end = time.perf_counter()
+
+    # 2. مرحلة التوليد (أو جلب إجابة مخزنة لسؤال مشابه بنفس المصادر)
+    generation_start = time.perf_counter()
+    generated_data, answer_source = await generate_with_cache(
+        retriever, query, context_chunks, query_vector=query_vector
+    )
+    generation_end = time.perf_counter()
+
+    stage_timings = {
+        "retrieval_ms": (retrieval_end - retrieval_start) * 1000,
+        generation_timing_key(answer_source): (generation_end - generation_start) * 1000,
+        **token_timings(generated_data, answer_source),
+    }
+    return context_chunks, generated_data, answer_source, stage_timings
+
+
+def with_fallback(generated_data: Dict[str, Any], context_chunks: List[Dict]) -> Tuple[Dict[str, Any], str]:
+    """استبدال رسالة الاعتذار بالإجابة المخزنة لأعلى سجل عندما يكون سبب الفشل تعذر الوصول إلى Gemini."""
+    if generated_data.get("finish_reason") in UPSTREAM_FAILURE_REASONS and fallback_answerer is not None:
+        fallback_data = fallback_answerer.answer(context_chunks)
+        if fallback_data is not None:
+            return fallback_data, "fallback"
+    return generated_data, "llm"
+
+
+def generation_timing_key(answer_source: str) -> str:
+    """الإجابات المباشرة لها توقيت خاص بها منفصل عن زمن التوليد."""
+    return "direct_answer_ms" if answer_source == "direct" else "generation_ms"
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """تنسيق حدث Server-Sent Events واحد."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 # --- نقاط النهاية (Endpoints) ---
 @app.get("/healthz", tags=["Monitoring"], response_model=HealthResponse)
 def health_check():
     is_retriever_ready = bool(retriever_instance and getattr(retriever_instance, "is_ready", False))
+    query_cache = getattr(retriever_instance, "query_cache", None) if retriever_instance else None
     return HealthResponse(
         status="ok",
-        index_version=settings.INDEX_VERSION,
-        retriever_ready=is_retriever_ready
+        index_version=retriever_instance.index_version if retriever_instance is not None else settings.INDEX_VERSION,
+        retriever_ready=is_retriever_ready,
+        pending_index_version=pending_index_version,
+        last_reload_error=last_reload_error,
+        embedding_cache=query_cache.stats() if query_cache is not None else None,
+        answer_cache=answer_cache.stats() if answer_cache is not None else None,
+        direct_answer=direct_answerer.stats() if direct_answerer is not None else None,
+        batcher=retrieval_batcher.stats() if retrieval_batcher is not None else None,
+        retrieval=getattr(retriever_instance, "retrieval_stats", None) if retriever_instance else None,
+        llm=get_llm_caller().stats(),
+        coalescing=request_coalescer.stats() if request_coalescer is not None else None,
+        indexes=index_registry.stats() if index_registry is not None else None,
+        startup=startup_timings or None
     )
 
+@app.get("/metrics", tags=["Monitoring"], include_in_schema=False)
+def metrics():
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled.")
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+@app.post(
+    "/admin/reload-index",
+    tags=["Admin"],
+    status_code=202,
+    response_model=ReloadResponse,
+    summary="تحميل إصدار جديد من الفهرس وتفعيله دون توقف الخدمة"
+)
+async def reload_index_endpoint(
+    version: str = Query(..., min_length=1, max_length=64, pattern=r"^[A-Za-z0-9_.-]+$", description="إصدار الفهرس الجديد"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    if not settings.ADMIN_TOKEN or not secrets.compare_digest(x_admin_token or "", settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if pending_index_version is not None:
+        raise HTTPException(status_code=409, detail=f"Index reload already in progress: {pending_index_version}")
+
+    start_index_reload(version)
+    return ReloadResponse(status="accepted", index_version=version)
+
 @app.post(
     "/api/v1/ask",
     tags=["RAG"],
     response_model=RAGResponse,
     summary="اطرح سؤالاً على وكيل الدعم الذكي"
 )
-def ask_question(
+async def ask_question(
     request: Request,
     query: str = Query(..., min_length=3, max_length=512, description="السؤال المراد طرحه"),
-    k: int = Query(3, ge=1, le=5, description="عدد المصادر المراد استرجاعها")
+    k: int = Query(3, ge=1, le=5, description="عدد المصادر المراد استرجاعها"),
+    index: Optional[str] = Query(None, max_length=64, description="اسم الفهرس (الافتراضي إن لم يُحدد)"),
+    x_index: Optional[str] = Header(None)
 ):
     request_id = getattr(request.state, "request_id", str(uuid.uuid4()))
+    # نثبت المسترجع المستخدم طوال عمر الطلب
+    retriever = await resolve_retriever(index or x_index, request)
 
-    if retriever_instance is None or not retriever_instance.is_ready:
+    if retriever is None or not retriever.is_ready:
         logger.warning("المسترجع غير جاهز (request_id=%s)", request_id)
         raise HTTPException(status_code=503, detail="Service not ready: Retriever is unavailable.")
 
     full_start_time = time.perf_counter()
 
-    # 1. مرحلة الاسترجاع
-    retrieval_start = time.perf_counter()
-    context_chunks = retriever_instance.search(query, k=k)
-    retrieval_end = time.perf_counter()
-
-    # 2. مرحلة التوليد
-    generation_start = time.perf_counter()
-    generated_data = generate_answer(query=query, context_chunks=context_chunks)
-    generation_end = time.perf_counter()
+    shared = False
+    if request_coalescer is not None and current_trace() is None:
+        # الطلبات المتطابقة الجارية تنتظر نتيجة الطلب الأول بدل استرجاع وتوليد جديدين.
+        # الطلبات المتتبَّعة تُنفَّذ منفردة حتى تُنسب مقاطعها إليها.
+        try:
+            (context_chunks, generated_data, answer_source, stage_timings), shared = await request_coalescer.do(
+                coalescing_key(query, k, retriever.index_version),
+                lambda: answer_query(retriever, query, k),
+                timeout=settings.COALESCING_MAX_WAIT_SECONDS,
+            )
+        except WaitTimeoutError:
+            logger.warning("انتهت مهلة انتظار طلب مدمج (request_id=%s)", request_id)
+            raise HTTPException(status_code=504, detail="Timed out waiting for an identical in-flight request.")
+    else:
+        context_chunks, generated_data, answer_source, stage_timings = await answer_query(retriever, query, k)
 
     full_end_time = time.perf_counter()
 
-    # 3. تجميع الاستجابة
-    timings = {
-        "retrieval_ms": (retrieval_end - retrieval_start) * 1000,
-        "generation_ms": (generation_end - generation_start) * 1000,
-        "total_ms": (full_end_time - full_start_time) * 1000
-    }
+    # 3. تجميع الاستجابة (الطلب المدمج لم ينفذ الاسترجاع أو التوليد بنفسه، فله زمن انتظاره فقط)
+    if shared:
+        stage_timings = {"coalesced_wait_ms": (full_end_time - full_start_time) * 1000}
+    timings = {**stage_timings, "total_ms": (full_end_time - full_start_time) * 1000}
 
-    logger.info("تمت معالجة الطلب (request_id=%s) بنجاح. التوقيتات: %s", request_id, timings)
+    ANSWERS.labels(answer_source).inc()
+    observe_timings(timings)
+    logger.info(
+        "تمت معالجة الطلب (request_id=%s) بنجاح. مصدر الإجابة: %s%s. التوقيتات: %s",
+        request_id, answer_source, " (مدمج)" if shared else "", timings,
+    )
 
     # بناء قائمة المصادر مباشرة من نتائج المسترجع
     response_sources = [Source(**c) for c in context_chunks]
@@ -147,5 +725,230 @@ def ask_question(
         answer=generated_data["answer"],
         confidence_score=generated_data["confidence_score"],
         sources=response_sources,
-        timings=timings
+        timings=timings,
+        answer_source=answer_source
+    )
+
+
+@app.api_route(
+    "/api/v1/ask/stream",
+    methods=["GET", "POST"],
+    tags=["RAG"],
+    response_class=StreamingResponse,
+    summary="اطرح سؤالاً واستلم الإجابة متدفقة (Server-Sent Events)"
+)
+async def ask_question_stream(
+    request: Request,
+    query: str = Query(..., min_length=3, max_length=512, description="السؤال المراد طرحه"),
+    k: int = Query(3, ge=1, le=5, description="عدد المصادر المراد استرجاعها"),
+    index: Optional[str] = Query(None, max_length=64, description="اسم الفهرس (الافتراضي إن لم يُحدد)"),
+    x_index: Optional[str] = Header(None)
+):
+    """
+    تُرسل المصادر في حدث `sources` فور انتهاء الاسترجاع، ثم أجزاء الإجابة في أحداث `token`،
+    وأخيرًا حدث `done` يحتوي على درجة الثقة والتوقيتات (بما فيها ttft_ms: زمن أول جزء من الإجابة).
+    """
+    request_id = getattr(request.state, "request_id", str(uuid.uuid4()))
+    retriever = await resolve_retriever(index or x_index, request)
+
+    if retriever is None or not retriever.is_ready:
+        logger.warning("المسترجع غير جاهز (request_id=%s)", request_id)
+        raise HTTPException(status_code=503, detail="Service not ready: Retriever is unavailable.")
+
+    async def event_stream() -> AsyncIterator[str]:
+        full_start_time = time.perf_counter()
+
+        # 1. مرحلة الاسترجاع وإرسال المصادر فورًا
+        retrieval_start = time.perf_counter()
+        try:
+            context_chunks, query_vector = await retrieve(retriever, query, k)
+        except Exception as e:
+            # الاستجابة بدأت بالفعل (200)، فيُبلَّغ العميل بحدث خطأ بدل قطع التدفق دون تفسير
+            logger.exception("خطأ أثناء الاسترجاع للطلب المتدفق (request_id=%s): %s", request_id, e)
+            yield format_sse("error", ErrorResponse(
+                error="Internal Server Error",
+                detail=f"request_id={request_id}"
+            ).model_dump())
+            return
+        retrieval_end = time.perf_counter()
+
+        response_sources = [Source(**c).model_dump() for c in context_chunks]
+        yield format_sse("sources", {"request_id": request_id, "sources": response_sources})
+
+        # 2. مرحلة التوليد المتدفق (أو إرسال إجابة مخزنة دفعة واحدة)
+        generation_start = time.perf_counter()
+        first_token_time = None
+        answer_source = "llm"
+        confidence_score = 0.0
+        usage = None
+        cached_data = None
+        with span("direct_answer"):
+            direct_data = direct_answerer.answer(context_chunks) if direct_answerer is not None else None
+        if direct_data is None and answer_cache is not None:
+            with span("answer_cache.lookup"):
+                source_ids = [c["id"] for c in context_chunks]
+                cached_data = answer_cache.get(query_vector, source_ids, retriever.index_version, query=query)
+
+        stored_data = None
+        if direct_data is not None or cached_data is not None:
+            stored_data = direct_data or cached_data
+            answer_source = "direct" if direct_data is not None else "cache"
+        elif fallback_answerer is not None and not llm_available():
+            # قاطع الدائرة مفتوح: الإجابة المخزنة لأعلى سجل بدل رسالة الاعتذار
+            stored_data = fallback_answerer.answer(context_chunks)
+            answer_source = "fallback" if stored_data is not None else answer_source
+
+        if stored_data is not None:
+            confidence_score = stored_data["confidence_score"]
+            first_token_time = time.perf_counter()
+            yield format_sse("token", {"text": stored_data["answer"]})
+        else:
+            answer_parts = []
+            try:
+                packed_chunks = await pack_context(retriever, query, context_chunks)
+                async for event in generate_answer_stream(query=query, context_chunks=packed_chunks):
+                    if event["type"] == "token":
+                        if first_token_time is None:
+                            first_token_time = time.perf_counter()
+                        answer_parts.append(event["text"])
+                        yield format_sse("token", {"text": event["text"]})
+                    elif event["type"] == "end":
+                        confidence_score = event["confidence_score"]
+                        usage = event.get("usage")
+                        if "answer" in event:
+                            # فشل التوليد قبل أول جزء: الإجابة المخزنة لأعلى سجل أو رسالة الاعتذار، كما في /ask
+                            end_data, answer_source = with_fallback(event, context_chunks)
+                            confidence_score = end_data["confidence_score"]
+                            first_token_time = time.perf_counter()
+                            yield format_sse("token", {"text": end_data["answer"]})
+            except Exception as e:
+                logger.exception("خطأ أثناء التوليد المتدفق (request_id=%s): %s", request_id, e)
+                yield format_sse("error", ErrorResponse(
+                    error="Internal Server Error",
+                    detail=f"request_id={request_id}"
+                ).model_dump())
+                return
+
+            if answer_cache is not None and answer_source == "llm" and confidence_score > 0:
+                answer_cache.put(
+                    query_vector, source_ids, retriever.index_version,
+                    {"answer": "".join(answer_parts).strip(), "confidence_score": confidence_score},
+                    query=query,
+                )
+        generation_end = time.perf_counter()
+
+        # 3. الحدث الأخير: درجة الثقة والتوقيتات
+        full_end_time = time.perf_counter()
+        timings = {
+            "retrieval_ms": (retrieval_end - retrieval_start) * 1000,
+            generation_timing_key(answer_source): (generation_end - generation_start) * 1000,
+            "ttft_ms": ((first_token_time or generation_end) - full_start_time) * 1000,
+            "total_ms": (full_end_time - full_start_time) * 1000,
+            **token_timings({"usage": usage}, answer_source),
+        }
+        ANSWERS.labels(answer_source).inc()
+        observe_timings(timings)
+        logger.info("تمت معالجة الطلب المتدفق (request_id=%s) بنجاح. مصدر الإجابة: %s. التوقيتات: %s", request_id, answer_source, timings)
+        yield format_sse("done", {
+            "request_id": request_id,
+            "confidence_score": confidence_score,
+            "answer_source": answer_source,
+            "timings": timings,
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post(
+    "/api/v1/ask/batch",
+    tags=["RAG"],
+    response_model=BatchAskResponse,
+    summary="اطرح مجموعة من الأسئلة دفعة واحدة (للمهام المجمّعة والليلية)"
+)
+async def ask_questions_batch(
+    request: Request,
+    batch: BatchAskRequest,
+    index: Optional[str] = Query(None, max_length=64, description="اسم الفهرس (الافتراضي إن لم يُحدد)"),
+    x_index: Optional[str] = Header(None)
+):
+    """
+    تُرمَّز جميع الأسئلة ويُبحث عنها كعملية مصفوفة واحدة، ثم يُوزَّع التوليد بتزامن محدود.
+    تُرجع نتيجة لكل عنصر بنفس ترتيب الطلب، مع خطأ خاص بالعنصر بدلًا من إفشال الدفعة كاملة.
+    """
+    request_id = getattr(request.state, "request_id", str(uuid.uuid4()))
+    retriever = await resolve_retriever(index or x_index, request)
+
+    if retriever is None or not retriever.is_ready:
+        logger.warning("المسترجع غير جاهز (request_id=%s)", request_id)
+        raise HTTPException(status_code=503, detail="Service not ready: Retriever is unavailable.")
+
+    queries = [item.query for item in batch.items]
+    ks = [item.k for item in batch.items]
+    full_start_time = time.perf_counter()
+
+    # 1. استرجاع مجمّع: ترميز واحد واستدعاء واحد لـ index.search
+    retrieval_start = time.perf_counter()
+    with span("retrieve", items=len(queries)):
+        # متجهات البحث تُعاد لاستخدامها في ذاكرة الإجابات دون ترميز ثانٍ
+        all_chunks, query_vectors = await run_in_retrieval_executor(
+            retriever.search_batch, queries, ks, return_vectors=True
+        )
+    retrieval_ms = (time.perf_counter() - retrieval_start) * 1000
+
+    # 2. توليد موزّع بتزامن محدود
+    generation_slots = asyncio.Semaphore(settings.BATCH_ASK_GENERATION_CONCURRENCY)
+
+    async def answer_item(position: int) -> BatchAskResult:
+        item_request_id = f"{request_id}-{position}"
+        context_chunks = all_chunks[position]
+        try:
+            async with generation_slots:
+                generation_start = time.perf_counter()
+                generated_data, answer_source = await generate_with_cache(
+                    retriever, queries[position], context_chunks,
+                    query_vector=query_vectors[position]
+                )
+                generation_end = time.perf_counter()
+            ANSWERS.labels(answer_source).inc()
+            # توقيتات الاسترجاع والإجمالي مشتركة بين عناصر الدفعة، لذا تُسجَّل مرحلة الإجابة وحدها
+            observe_stage(generation_timing_key(answer_source)[:-3], generation_end - generation_start)
+        except Exception as e:
+            logger.exception("فشل توليد عنصر في الدفعة (request_id=%s): %s", item_request_id, e)
+            return BatchAskResult(
+                index=position,
+                error=ErrorResponse(error="Generation failed", detail=f"request_id={item_request_id}")
+            )
+
+        return BatchAskResult(
+            index=position,
+            response=RAGResponse(
+                request_id=item_request_id,
+                answer=generated_data["answer"],
+                confidence_score=generated_data["confidence_score"],
+                sources=[Source(**c) for c in context_chunks],
+                timings={
+                    "retrieval_ms": retrieval_ms,
+                    generation_timing_key(answer_source): (generation_end - generation_start) * 1000,
+                    "total_ms": (generation_end - full_start_time) * 1000,
+                    **token_timings(generated_data, answer_source),
+                },
+                answer_source=answer_source
+            )
+        )
+
+    results = await asyncio.gather(*[answer_item(position) for position in range(len(queries))])
+
+    timings = {
+        "retrieval_ms": retrieval_ms,
+        "total_ms": (time.perf_counter() - full_start_time) * 1000
+    }
+    failed = sum(1 for result in results if result.error is not None)
+    logger.info(
+        "تمت معالجة الدفعة (request_id=%s): %d عنصر، %d خطأ. التوقيتات: %s",
+        request_id, len(results), failed, timings
     )
+    return BatchAskResponse(request_id=request_id, results=results, timings=timings)
@@ -0,0 +1,102 @@
+# scripts/benchmark_batching.py
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# إضافة جذر المشروع إلى مسار بايثون لاستيراد الوحدات بشكل صحيح
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger("sentence_transformers").setLevel(logging.WARNING)
+
+from app.core.batcher import RetrievalBatcher
+from app.core.retriever import Retriever
+
+# --- إعدادات ---
+GOLDEN_SET_PATH = 'evaluation/golden_set.json'
+KNOWLEDGE_BASE_PATH = 'knowledge_base/faq.json'
+
+
+def load_queries():
+    """تحميل أسئلة مجموعة التقييم وقاعدة المعرفة لاستخدامها كحمل اختباري."""
+    queries = []
+    with open(GOLDEN_SET_PATH, 'r', encoding='utf-8') as f:
+        queries.extend(item['question'] for item in json.load(f))
+    with open(KNOWLEDGE_BASE_PATH, 'r', encoding='utf-8') as f:
+        queries.extend(item['question'] for item in json.load(f))
+    return queries
+
+
+def run_load(search_fn, queries, total_requests, concurrency, k):
+    """
+    تشغيل عدد ثابت من الطلبات بمستوى تزامن محدد وقياس الإنتاجية وزمن الاستجابة.
+    """
+    latencies = []
+
+    def one_request(i):
+        start = time.perf_counter()
+        search_fn(queries[i % len(queries)], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(total_requests)))
+    wall_seconds = time.perf_counter() - wall_start
+
+    return {
+        "qps": total_requests / wall_seconds,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس إنتاجية الاسترجاع مقابل نافذة التجميع.")
+    parser.add_argument("--windows", default="0,1,2,5,10,20", help="نوافذ الانتظار بالمللي ثانية (0 = بدون تجميع).")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--output", help="مسار ملف JSON لحفظ النتائج.")
+    args = parser.parse_args()
+
+    retriever = Retriever()
+    retriever.load()
+    # نعطل ذاكرة المتجهات المؤقتة حتى يقيس الاختبار كلفة الترميز الفعلية
+    retriever.query_cache = None
+    queries = load_queries()
+
+    rows = []
+    for window_ms in [float(w) for w in args.windows.split(",")]:
+        if window_ms <= 0:
+            result = run_load(lambda q, k: retriever.search(q, k=k), queries, args.requests, args.concurrency, args.k)
+        else:
+            batcher = RetrievalBatcher(max_batch_size=args.max_batch_size, max_wait_ms=window_ms)
+            batcher.start()
+            try:
+                result = run_load(lambda q, k: batcher.search(retriever, q, k), queries, args.requests, args.concurrency, args.k)
+                result["avg_batch_size"] = batcher.stats()["avg_batch_size"]
+            finally:
+                batcher.stop()
+        result["window_ms"] = window_ms
+        rows.append(result)
+        print(
+            f"window={window_ms:>5.1f}ms  qps={result['qps']:>8.1f}  "
+            f"p50={result['p50_ms']:>7.2f}ms  p95={result['p95_ms']:>7.2f}ms  p99={result['p99_ms']:>7.2f}ms  "
+            f"avg_batch={result.get('avg_batch_size', 1.0):.1f}"
+        )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"concurrency": args.concurrency, "requests": args.requests, "results": rows}, f, indent=2)
+        print(f"تم حفظ النتائج في: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
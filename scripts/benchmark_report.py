@@ -0,0 +1,85 @@
+# scripts/benchmark_report.py
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# أدوات مشتركة لسكربتات القياس: النسب المئوية، حفظ النتائج بصيغة JSON مع بيانات التشغيل
+# (الإيداع، الوقت، الجهاز)، ومقارنة النتائج بملف أساس من إيداع سابق.
+
+
+def percentiles(values: Iterable[float]) -> Dict[str, float]:
+    values = np.asarray(list(values), dtype=np.float64)
+    if not len(values):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(values.max()),
+    }
+
+
+def run_info() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor_count": str(os.cpu_count()),
+    }
+
+
+def write_results(path: str, kind: str, config: Dict, scenarios: List[Dict]) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"kind": kind, "run": run_info(), "config": config, "scenarios": scenarios},
+                  f, ensure_ascii=False, indent=2)
+    print(f"تم حفظ النتائج في: {path}")
+
+
+def compare_to_baseline(scenarios: List[Dict], baseline_path: str, metric_paths: List[str],
+                        tolerance: float) -> List[str]:
+    """
+    مقارنة مقاييس الزمن (مسارات مثل "total_ms.p95") لكل سيناريو بالسيناريو الذي يحمل الاسم نفسه
+    في ملف الأساس. تُرجع قائمة التراجعات التي تتجاوز نسبة التسامح.
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {scenario["name"]: scenario for scenario in json.load(f)["scenarios"]}
+
+    regressions = []
+    for scenario in scenarios:
+        previous = baseline.get(scenario["name"])
+        if previous is None:
+            continue
+        for metric_path in metric_paths:
+            current_value = _lookup(scenario, metric_path)
+            previous_value = _lookup(previous, metric_path)
+            if current_value is None or not previous_value:
+                continue
+            change = current_value / previous_value - 1
+            line = f"{scenario['name']:<28} {metric_path:<22} {previous_value:10.2f} -> {current_value:10.2f} ({change:+.1%})"
+            print(line)
+            if change > tolerance:
+                regressions.append(line)
+    return regressions
+
+
+def _lookup(data: Dict, path: str) -> Optional[float]:
+    for key in path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
@@ -0,0 +1,123 @@
+# scripts/compare_embedding_backends.py
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+# إضافة جذر المشروع إلى مسار بايثون لاستيراد الوحدات بشكل صحيح
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger("sentence_transformers").setLevel(logging.WARNING)
+
+from app.core.embedding_backends import load_embedding_model
+from app.core.ingestion_pipeline import chunk_record, iter_json_records
+
+# --- إعدادات ---
+GOLDEN_SET_PATH = 'evaluation/golden_set.json'
+KNOWLEDGE_BASE_PATH = 'knowledge_base/faq.json'
+MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+
+
+def evaluate_backend(model, chunks, golden_set, k, repeats):
+    """
+    بناء فهرس Flat في الذاكرة بمتجهات الواجهة نفسها، ثم قياس Recall@1 وRecall@k
+    وزمن ترميز استعلام واحد ومعدل الترميز المجمّع.
+    """
+    texts = [chunk['chunk_text'] for chunk in chunks]
+    questions = [item['question'] for item in golden_set]
+
+    model.encode(questions[:2], normalize_embeddings=True)  # تسخين
+    batch_start = time.perf_counter()
+    document_vectors = np.asarray(model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+    batch_seconds = time.perf_counter() - batch_start
+
+    latencies = []
+    for _ in range(repeats):
+        for question in questions:
+            start = time.perf_counter()
+            model.encode([question], normalize_embeddings=True)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    index = faiss.IndexFlatIP(document_vectors.shape[1])
+    index.add(document_vectors)
+    query_vectors = np.asarray(model.encode(questions, normalize_embeddings=True), dtype=np.float32)
+    _, found = index.search(query_vectors, k)
+    retrieved = [[chunks[row]['id'] for row in rows if row != -1] for rows in found]
+    expected = [item['expected_id'] for item in golden_set]
+
+    return {
+        "recall_at_1": float(np.mean([ids[:1] == [target] for ids, target in zip(retrieved, expected)])),
+        f"recall_at_{k}": float(np.mean([target in ids for ids, target in zip(retrieved, expected)])),
+        "query_p50_ms": float(np.percentile(latencies, 50)),
+        "query_p95_ms": float(np.percentile(latencies, 95)),
+        "batch_texts_per_second": len(texts) / batch_seconds,
+    }, query_vectors, retrieved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="مقارنة دقة وزمن واجهتي الترميز (PyTorch وONNX) على مجموعة التقييم.")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--onnx-model-dir", default=os.path.join('data', 'onnx', MODEL_NAME))
+    parser.add_argument("--onnx-threads", type=int, default=0)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=5, help="عدد مرات تكرار ترميز كل سؤال لقياس الزمن.")
+    parser.add_argument("--output", help="مسار ملف JSON لحفظ النتائج.")
+    args = parser.parse_args()
+
+    with open(GOLDEN_SET_PATH, 'r', encoding='utf-8') as f:
+        golden_set = json.load(f)
+    chunks = [chunk for record in iter_json_records(KNOWLEDGE_BASE_PATH) for chunk in chunk_record(record)]
+
+    results = {}
+    vectors = {}
+    retrieved = {}
+    for backend in ("sentence_transformers", "onnx"):
+        model = load_embedding_model(
+            args.model, backend=backend, onnx_model_dir=args.onnx_model_dir, num_threads=args.onnx_threads
+        )
+        results[backend], vectors[backend], retrieved[backend] = evaluate_backend(
+            model, chunks, golden_set, args.k, args.repeats
+        )
+        row = results[backend]
+        print(
+            f"{backend:<22} recall@1={row['recall_at_1']:.3f}  recall@{args.k}={row[f'recall_at_{args.k}']:.3f}  "
+            f"p50={row['query_p50_ms']:.2f}ms  p95={row['query_p95_ms']:.2f}ms  "
+            f"batch={row['batch_texts_per_second']:.1f} texts/s"
+        )
+
+    # مدى تطابق المتجهات ونتائج البحث بين الواجهتين
+    cosine = np.sum(vectors["sentence_transformers"] * vectors["onnx"], axis=1)
+    top1_agreement = float(np.mean([
+        a[:1] == b[:1] for a, b in zip(retrieved["sentence_transformers"], retrieved["onnx"])
+    ]))
+    speedup = results["sentence_transformers"]["query_p50_ms"] / results["onnx"]["query_p50_ms"]
+    print(f"cosine(min/mean)={cosine.min():.4f}/{cosine.mean():.4f}  top1_agreement={top1_agreement:.3f}  p50_speedup={speedup:.2f}x")
+
+    recall_unchanged = all(
+        results["onnx"][metric] >= results["sentence_transformers"][metric]
+        for metric in ("recall_at_1", f"recall_at_{args.k}")
+    )
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "results": results,
+                "cosine_min": float(cosine.min()),
+                "cosine_mean": float(cosine.mean()),
+                "top1_agreement": top1_agreement,
+                "p50_speedup": speedup,
+                "recall_unchanged": recall_unchanged,
+            }, f, indent=2)
+        print(f"تم حفظ النتائج في: {args.output}")
+
+    if not recall_unchanged:
+        print("⚠️ انخفض الاسترجاع مع واجهة ONNX مقارنة بـ PyTorch.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
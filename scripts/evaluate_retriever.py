@@ -1,8 +1,14 @@
 # scripts/evaluate_retriever.py
+import argparse
 import json
 import logging
 import sys
 import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
 
 # إضافة جذر المشروع إلى مسار بايثون لاستيراد الوحدات بشكل صحيح
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -10,11 +16,17 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # تعطيل سجلات sentence-transformers المزعجة أثناء التقييم
 logging.getLogger("sentence_transformers").setLevel(logging.WARNING)
 
+from benchmark_report import compare_to_baseline, percentiles, write_results
+
+from app.config import settings
+from app.core.embedding_cache import QueryEmbeddingCache
 from app.core.retriever import Retriever
 
 # --- إعدادات ---
 GOLDEN_SET_PATH = 'evaluation/golden_set.json'
 K_FOR_EVALUATION = 3 # سنقوم بالبحث عن أفضل 3 نتائج لكل سؤال
+# ذاكرة المتجهات الدائمة المشتركة مع scripts/ingest.py
+DEFAULT_EMBEDDING_CACHE_DIR = 'data/embedding_cache'
 
 # --- دوال مساعدة لطباعة ملونة ---
 def color_text(text, color_code):
@@ -25,7 +37,7 @@ def red(text): return color_text(text, "91")
 def yellow(text): return color_text(text, "93")
 def bold(text): return color_text(text, "1")
 
-def evaluate_with_diagnostics():
+def evaluate_with_diagnostics(embedding_cache_dir=DEFAULT_EMBEDDING_CACHE_DIR):
     """
     يقوم بتقييم محرك الاسترجاع مع طباعة معلومات تشخيصية مفصلة لكل خطوة.
     """
@@ -50,6 +62,10 @@ def evaluate_with_diagnostics():
         return
     print("✅ المسترجع جاهز للعمل.\n")
 
+    # ترميز أسئلة التقييم مرة واحدة عبر ذاكرة المتجهات الدائمة؛ التشغيلات التالية لا تعيد الترميز
+    if embedding_cache_dir:
+        retriever.prime_query_cache([item['question'] for item in golden_set], disk_cache_dir=embedding_cache_dir)
+
     # 3. حساب المقاييس مع التشخيص
     hits_at_1 = 0
     hits_at_k = 0
@@ -107,5 +123,186 @@ def evaluate_with_diagnostics():
     else:
         print(red(f"\n⚠️ O critério de sucesso (≥ 85%) não foi alcançado. É necessária uma análise mais aprofundada."))
 
+
+# --- التقييم المجمّع (--batch) ---
+# ترميز جميع الأسئلة بتمريرة مصفوفة واحدة والبحث عنها دفعة واحدة عبر Retriever.search_batch،
+# ثم حساب Recall@k وMRR وnDCG@k بعمليات مصفوفات، مع قياس زمن الترميز والبحث لكل استعلام منفرد
+# على عينة من الأسئلة. يمكن تقييم عدة إعدادات (فهارس، nprobe/efSearch، وضع الاسترجاع، واجهة
+# الترميز) في تشغيل واحد؛ كل إعداد مجموعة قيم تتجاوز AppSettings أثناء تقييمه فقط.
+BASELINE_METRICS = ["encode_ms.p95", "search_ms.p95"]
+# إعدادات تحدد نموذج التضمين؛ الإعدادات المتطابقة فيها تتشارك النموذج المحمَّل
+MODEL_SETTINGS = ("EMBEDDING_MODEL_NAME", "EMBEDDING_BACKEND", "ONNX_MODEL_DIR", "ONNX_NUM_THREADS", "EMBEDDING_SERVER_ADDRESS")
+
+
+def parse_config(spec: str) -> Tuple[str, Dict[str, object]]:
+    """
+    تحليل إعداد بالصيغة "الاسم:مفتاح=قيمة,مفتاح=قيمة" (مثل "ivf-16:INDEX_VERSION=v2,INDEX_NPROBE=16").
+    تُقرأ القيم كـ JSON إن أمكن (أرقام، true/false، null) وإلا كنصوص.
+    """
+    name, _, assignments = spec.partition(":")
+    overrides: Dict[str, object] = {}
+    for assignment in filter(None, assignments.split(",")):
+        key, separator, raw_value = assignment.partition("=")
+        key = key.strip().upper()
+        if not separator or not hasattr(settings, key):
+            raise ValueError(f"إعداد غير معروف في '{spec}': {key}")
+        try:
+            overrides[key] = json.loads(raw_value)
+        except json.JSONDecodeError:
+            overrides[key] = raw_value
+    return name.strip() or "default", overrides
+
+
+@contextmanager
+def override_settings(overrides: Dict[str, object]):
+    previous = {key: getattr(settings, key) for key in overrides}
+    try:
+        for key, value in overrides.items():
+            setattr(settings, key, value)
+        yield
+    finally:
+        for key, value in previous.items():
+            setattr(settings, key, value)
+
+
+def ranking_metrics(retrieved_ids: Sequence[Sequence[str]], expected_ids: Sequence[str], ks: Sequence[int]) -> Dict[str, float]:
+    """
+    Recall@k وnDCG@k لكل k، وMRR على أعمق قائمة، لسؤال له إجابة صحيحة واحدة.
+    مع إجابة واحدة يكون nDCG@k = 1/log2(الترتيب + 1) إن ظهرت ضمن أول k (IDCG = 1).
+    """
+    depth = max([max(ks)] + [len(ids) for ids in retrieved_ids])
+    matrix = np.full((len(retrieved_ids), depth), None, dtype=object)
+    for row, ids in enumerate(retrieved_ids):
+        matrix[row, :len(ids)] = ids
+    hits = matrix == np.asarray(expected_ids, dtype=object)[:, None]
+    found = hits.any(axis=1)
+    ranks = np.where(found, hits.argmax(axis=1) + 1, np.inf)
+
+    metrics = {"mrr": float(np.mean(1.0 / ranks))}
+    for k in ks:
+        within = ranks <= k
+        metrics[f"recall_at_{k}"] = float(np.mean(within))
+        metrics[f"ndcg_at_{k}"] = float(np.mean(np.where(within, 1.0 / np.log2(ranks + 1), 0.0)))
+    return metrics
+
+
+def evaluate_batch(retriever: Retriever, golden_set: List[Dict], ks: Sequence[int], latency_samples: int) -> Dict:
+    questions = [item['question'] for item in golden_set]
+    expected = [item['expected_id'] for item in golden_set]
+    depth = max(ks)
+
+    # ترميز كل الأسئلة بتمريرة واحدة؛ ذاكرة المتجهات تُحجَّم لتتسع لها فلا يُعاد ترميزها أثناء البحث
+    retriever.query_cache = QueryEmbeddingCache(max(len(questions), 1))
+    encode_start = time.perf_counter()
+    retriever.encode_queries(questions)
+    encode_seconds = time.perf_counter() - encode_start
+
+    search_start = time.perf_counter()
+    results = retriever.search_batch(questions, [depth] * len(questions))
+    search_seconds = time.perf_counter() - search_start
+    retrieved = [[result.get('id') for result in rows] for rows in results]
+    retrieval_paths = dict(retriever.retrieval_stats)
+
+    # زمن الاستعلام المنفرد (ترميز سؤال واحد، ثم البحث عنه بمتجهه المخزن) على عينة ثابتة من الأسئلة
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(questions), size=min(latency_samples, len(questions)), replace=False)
+    encode_latencies, search_latencies = [], []
+    for position in sample:
+        start = time.perf_counter()
+        retriever.model.encode([questions[position]], convert_to_tensor=False, normalize_embeddings=True)
+        encode_latencies.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        retriever.search_batch([questions[position]], [depth])
+        search_latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        **ranking_metrics(retrieved, expected, ks),
+        "questions": len(questions),
+        "encode_ms": percentiles(encode_latencies),
+        "search_ms": percentiles(search_latencies),
+        "batch_encode_qps": len(questions) / encode_seconds if encode_seconds else None,
+        "batch_search_qps": len(questions) / search_seconds if search_seconds else None,
+        "retrieval_paths": retrieval_paths,
+        "misses": [
+            {"question": question, "expected_id": target, "retrieved": ids}
+            for question, target, ids in zip(questions, expected, retrieved) if target not in ids
+        ][:50],
+    }
+
+
+def run_batch_evaluation(config_specs: List[str], ks: List[int], latency_samples: int, output=None,
+                         baseline=None, tolerance: float = 0.10) -> None:
+    with open(GOLDEN_SET_PATH, 'r', encoding='utf-8') as f:
+        golden_set = json.load(f)
+    print(f"✅ تم تحميل {len(golden_set)} سؤال من مجموعة التقييم.")
+
+    configs = [parse_config(spec) for spec in config_specs] or [("default", {})]
+    models = {}
+    scenarios = []
+    for name, overrides in configs:
+        with override_settings(overrides):
+            model_key = tuple(getattr(settings, key) for key in MODEL_SETTINGS)
+            retriever = Retriever(model=models.get(model_key))
+            retriever.load()
+            models[model_key] = retriever.model
+            scenario = {
+                "name": name,
+                "overrides": overrides,
+                "index_version": retriever.index_version,
+                "index_type": retriever.index_config.index_type if retriever.index_config else None,
+                "index_size": int(retriever.index.ntotal),
+                "retrieval_mode": settings.RETRIEVAL_MODE,
+                "embedding_backend": settings.EMBEDDING_BACKEND,
+                **evaluate_batch(retriever, golden_set, ks, latency_samples),
+            }
+        scenarios.append(scenario)
+        recalls = "  ".join(f"recall@{k}={scenario[f'recall_at_{k}']:.3f}" for k in ks)
+        print(
+            f"{name:<20} {recalls}  mrr={scenario['mrr']:.3f}  ndcg@{ks[-1]}={scenario[f'ndcg_at_{ks[-1]}']:.3f}  "
+            f"encode p50/p95={scenario['encode_ms']['p50']:.2f}/{scenario['encode_ms']['p95']:.2f}ms  "
+            f"search p50/p95={scenario['search_ms']['p50']:.2f}/{scenario['search_ms']['p95']:.2f}ms"
+        )
+
+    # الفروق عن الإعداد الأول (الأساس) عند مقارنة عدة إعدادات
+    reference = scenarios[0]
+    for scenario in scenarios[1:]:
+        print(
+            f"{scenario['name']:<20} vs {reference['name']}: "
+            f"recall@{ks[-1]} {scenario[f'recall_at_{ks[-1]}'] - reference[f'recall_at_{ks[-1]}']:+.3f}  "
+            f"mrr {scenario['mrr'] - reference['mrr']:+.3f}  "
+            f"search p95 {scenario['search_ms']['p95'] / reference['search_ms']['p95']:.2f}x"
+        )
+
+    if output:
+        write_results(output, "retrieval_evaluation", {
+            "golden_set": GOLDEN_SET_PATH, "ks": ks, "latency_samples": latency_samples,
+        }, scenarios)
+    if baseline:
+        regressions = compare_to_baseline(scenarios, baseline, BASELINE_METRICS, tolerance)
+        if regressions:
+            print(red(f"⚠️ تراجع في {len(regressions)} مقياس مقارنة بملف الأساس."))
+            sys.exit(1)
+
+
 if __name__ == '__main__':
-    evaluate_with_diagnostics()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="تقييم محرك الاسترجاع على مجموعة التقييم.")
+    parser.add_argument("--embedding-cache-dir", default=DEFAULT_EMBEDDING_CACHE_DIR)
+    parser.add_argument("--no-embedding-cache", action="store_true")
+    parser.add_argument("--batch", action="store_true",
+                        help="تقييم مجمّع: ترميز وبحث دفعة واحدة، Recall@k وMRR وnDCG وأزمنة الاستعلام.")
+    parser.add_argument("--k", default="1,3,5", help="قيم k مفصولة بفواصل (مع --batch).")
+    parser.add_argument("--config", action="append", default=[],
+                        help="إعداد للمقارنة بالصيغة NAME:KEY=VALUE,... (يمكن تكراره، مع --batch).")
+    parser.add_argument("--latency-samples", type=int, default=200,
+                        help="عدد الأسئلة المستخدمة لقياس زمن الاستعلام المنفرد (مع --batch).")
+    parser.add_argument("--output", help="مسار ملف JSON لحفظ النتائج (مع --batch).")
+    parser.add_argument("--baseline", help="ملف نتائج سابق للمقارنة؛ يفشل السكربت عند تراجع يتجاوز --tolerance.")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+    if args.batch:
+        run_batch_evaluation(
+            args.config, sorted({int(k) for k in args.k.split(",")}), args.latency_samples,
+            output=args.output, baseline=args.baseline, tolerance=args.tolerance,
+        )
+    else:
+        evaluate_with_diagnostics(None if args.no_embedding_cache else args.embedding_cache_dir)
\ No newline at end of file
@@ -0,0 +1,145 @@
+# scripts/gemini_stub.py
+import argparse
+import asyncio
+import json
+import random
+from dataclasses import asdict, dataclass
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# خادم محلي يحاكي واجهة Gemini REST (generateContent و streamGenerateContent?alt=sse)
+# بزمن استجابة وأخطاء قابلة للضبط، لتشغيل الخدمة عبر GEMINI_API_ENDPOINT في اختبارات الحمل.
+ANSWER_WORD = "إجابة"
+
+
+@dataclass
+class StubProfile:
+    # الزمن الوسيط للاستجابة، وانتشاره (سيجما التوزيع اللوغاريتمي الطبيعي؛ 0 = زمن ثابت)
+    latency_ms: float = 800.0
+    latency_sigma: float = 0.3
+    # نسبة الطلبات المتعثرة (اتصال عالق) وزمن تعثرها
+    stall_rate: float = 0.0
+    stall_ms: float = 30000.0
+    # نسبة أخطاء HTTP 503 وأخطاء 429، ونسبة الإجابات المحجوبة بسبب السلامة (finishReason=SAFETY)
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    safety_rate: float = 0.0
+    # طول الإجابة بالكلمات وعدد أجزائها في وضع التدفق
+    output_words: int = 60
+    stream_chunks: int = 6
+    seed: int = 0
+
+
+def _candidate(text=None, finish_reason=None):
+    candidate = {"index": 0}
+    if text is not None:
+        candidate["content"] = {"role": "model", "parts": [{"text": text}]}
+    if finish_reason is not None:
+        candidate["finishReason"] = finish_reason
+    return candidate
+
+
+def create_stub_app(profile: StubProfile) -> FastAPI:
+    app = FastAPI(title="Gemini stub")
+    rng = random.Random(profile.seed)
+    stats = {"requests": 0, "errors": 0, "rate_limited": 0, "safety": 0, "stalls": 0}
+
+    def sample_latency() -> float:
+        if rng.random() < profile.stall_rate:
+            stats["stalls"] += 1
+            return profile.stall_ms / 1000
+        return profile.latency_ms * rng.lognormvariate(0, profile.latency_sigma) / 1000
+
+    def check_failures() -> None:
+        draw = rng.random()
+        if draw < profile.error_rate:
+            stats["errors"] += 1
+            raise HTTPException(status_code=503, detail="stub: service unavailable")
+        if draw < profile.error_rate + profile.rate_limit_rate:
+            stats["rate_limited"] += 1
+            raise HTTPException(status_code=429, detail="stub: resource exhausted")
+
+    def is_blocked() -> bool:
+        blocked = rng.random() < profile.safety_rate
+        stats["safety"] += blocked
+        return blocked
+
+    def usage(prompt_chars: int) -> dict:
+        return {"promptTokenCount": prompt_chars // 4, "candidatesTokenCount": profile.output_words}
+
+    @app.post("/v1beta/models/{model_action}")
+    async def generate(model_action: str, request: Request):
+        stats["requests"] += 1
+        _, _, action = model_action.partition(":")
+        prompt_chars = len(json.dumps(await request.json(), ensure_ascii=False))
+        latency = sample_latency()
+
+        if action == "generateContent":
+            await asyncio.sleep(latency)
+            check_failures()
+            if is_blocked():
+                return JSONResponse({"candidates": [_candidate(finish_reason="SAFETY")]})
+            text = " ".join([ANSWER_WORD] * profile.output_words)
+            return JSONResponse({
+                "candidates": [_candidate(text, "STOP")],
+                "usageMetadata": usage(prompt_chars),
+            })
+
+        if action == "streamGenerateContent":
+            chunks = max(profile.stream_chunks, 1)
+            # زمن أول جزء يساوي نصف الزمن الكلي، والباقي موزع على الأجزاء التالية
+            await asyncio.sleep(latency / 2)
+            check_failures()
+            blocked = is_blocked()
+
+            async def events():
+                if blocked:
+                    yield f"data: {json.dumps({'candidates': [_candidate(finish_reason='SAFETY')]})}\n\n"
+                    return
+                words_per_chunk = max(profile.output_words // chunks, 1)
+                for number in range(chunks):
+                    if number:
+                        await asyncio.sleep(latency / 2 / (chunks - 1))
+                    last = number == chunks - 1
+                    payload = {"candidates": [_candidate(
+                        " ".join([ANSWER_WORD] * words_per_chunk) + ("" if last else " "),
+                        "STOP" if last else None,
+                    )]}
+                    if last:
+                        payload["usageMetadata"] = usage(prompt_chars)
+                    yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        raise HTTPException(status_code=404, detail=f"stub: unsupported action {action}")
+
+    @app.get("/stats")
+    def get_stats():
+        return {"profile": asdict(profile), **stats}
+
+    return app
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = StubProfile()
+    for field, value in asdict(defaults).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+
+
+def profile_from_args(args: argparse.Namespace) -> StubProfile:
+    return StubProfile(**{field: getattr(args, field) for field in asdict(StubProfile())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="خادم Gemini محلي بزمن استجابة وأخطاء قابلة للضبط.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_stub_app(profile_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
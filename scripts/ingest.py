@@ -1,12 +1,43 @@
 # scripts/ingest.py
+import argparse
 import os
+import sys
 import json
 import numpy as np
-import pandas as pd
 import faiss
-from sentence_transformers import SentenceTransformer
 import logging
 
+# إضافة جذر المشروع إلى مسار بايثون لاستيراد الوحدات بشكل صحيح
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.disk_embedding_cache import DiskEmbeddingCache
+from app.core.embedding_backends import EMBEDDING_BACKENDS, embedding_cache_name, load_embedding_model
+from app.core.incremental import (
+    apply_incremental_update,
+    content_hashes,
+    load_content_hashes,
+    plan_incremental_update,
+    save_content_hashes,
+)
+from app.core.indexing import (
+    INCREMENTAL_INDEX_TYPES,
+    INDEX_TYPES,
+    IndexConfig,
+    load_index_config,
+    save_index_config,
+    save_vector_ids,
+    vector_ids_for,
+    vector_ids_path,
+)
+from app.core.ingestion_pipeline import (
+    DEFAULT_BATCH_SIZE,
+    StreamingIndexBuilder,
+    chunk_record,
+    iter_json_records,
+)
+from app.core.lexical_index import build_lexical_index
+from app.core.metadata_store import metadata_store_path, write_metadata_store
+
 # إعداد التسجيل (Logging) لمتابعة العملية
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -14,13 +45,24 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # اسم النموذج المستخدم لإنشاء المتجهات. اختياره حاسم لجودة البحث.
 MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2' 
 
-# مسار ملف قاعدة المعرفة
+# مسار ملف قاعدة المعرفة (JSON بمصفوفة سجلات، أو JSONL بسجل في كل سطر)
 KNOWLEDGE_BASE_PATH = 'knowledge_base/faq.json'
 
 # مسارات حفظ المخرجات (الفهرس والبيانات الوصفية)
 OUTPUT_DIR = 'data'
-INDEX_PATH = os.path.join(OUTPUT_DIR, 'index_v1.faiss')
-METADATA_PATH = os.path.join(OUTPUT_DIR, 'metadata_v1.json')
+DEFAULT_INDEX_VERSION = 'v1'
+# ذاكرة المتجهات الدائمة: إعادة البناء لنفس النصوص ونفس النموذج لا تعيد الترميز
+DEFAULT_EMBEDDING_CACHE_DIR = os.path.join(OUTPUT_DIR, 'embedding_cache')
+# واجهة الترميز: sentence_transformers (PyTorch) أو onnx (نموذج مُصدَّر عبر python -m app.core.onnx_encoder)
+EMBEDDING_BACKEND = 'sentence_transformers'
+ONNX_MODEL_DIR = os.path.join(OUTPUT_DIR, 'onnx', MODEL_NAME)
+
+
+def output_paths(index_version):
+    """مسارات الفهرس والبيانات الوصفية لإصدار معين، بنفس التسمية التي يتوقعها Retriever."""
+    index_path = os.path.join(OUTPUT_DIR, f'index_{index_version}.faiss')
+    metadata_path = os.path.join(OUTPUT_DIR, f'metadata_{index_version}.json')
+    return index_path, metadata_path
 
 def create_output_directory():
     """ينشئ مجلد المخرجات إذا لم يكن موجودًا."""
@@ -28,61 +70,218 @@ def create_output_directory():
         logging.info(f"إنشاء مجلد المخرجات: {OUTPUT_DIR}")
         os.makedirs(OUTPUT_DIR)
 
-def ingest_and_build_index():
+def load_knowledge_base(input_path=KNOWLEDGE_BASE_PATH):
     """
-    الوظيفة الرئيسية التي تقوم بقراءة البيانات، إنشاء المتجهات، وبناء فهرس FAISS.
+    قراءة قاعدة المعرفة كاملة وتقسيمها (للاستيعاب التزايدي). تُرجع None عند الفشل.
     """
-    logging.info("--- بدء عملية استيعاب البيانات وبناء الفهرس ---")
-    
-    # --- 2. قراءة ومعالجة البيانات ---
     try:
-        df = pd.read_json(KNOWLEDGE_BASE_PATH)
-        logging.info(f"تم تحميل {len(df)} سجل من قاعدة المعرفة.")
+        metadata = [chunk for record in iter_json_records(input_path) for chunk in chunk_record(record)]
+        logging.info(f"تم تحميل {len(metadata)} جزء من قاعدة المعرفة.")
     except Exception as e:
         logging.error(f"فشل في تحميل قاعدة المعرفة: {e}")
-        return
+        return None
+    return metadata
+
+_model = None
+
+def get_model():
+    """تحميل النموذج عند أول حاجة فقط؛ لا يُحمَّل إطلاقًا إن كانت كل المتجهات في الذاكرة الدائمة."""
+    global _model
+    if _model is None:
+        # تحميل متأخر: عمليات التقسيم لا تحتاج إلى النموذج ولا إلى PyTorch.
+        # سيتم تنزيل نموذج sentence-transformers تلقائيًا في المرة الأولى وتخزينه مؤقتًا.
+        _model = load_embedding_model(MODEL_NAME, backend=EMBEDDING_BACKEND, onnx_model_dir=ONNX_MODEL_DIR)
+    return _model
+
+def cache_model_name():
+    return embedding_cache_name(MODEL_NAME, EMBEDDING_BACKEND, ONNX_MODEL_DIR)
+
+def encode_with_model(texts, show_progress_bar=True):
+    logging.info(f"بدء إنشاء المتجهات لـ {len(texts)} نص...")
+    return get_model().encode(texts, show_progress_bar=show_progress_bar, normalize_embeddings=True)
 
-    # استراتيجية التقسيم (Chunking): دمج السؤال والجواب في نص واحد للبحث الدلالي
-    # هذا يضمن أن معنى السؤال والجواب مرتبطان في متجه واحد.
-    df['chunk_text'] = df.apply(lambda row: f"سؤال: {row['question']} جواب: {row['answer']}", axis=1)
-    
-    texts_to_embed = df['chunk_text'].tolist()
-    metadata = df.to_dict(orient='records')
-
-    # --- 3. تحميل نموذج التضمين ---
-    logging.info(f"تحميل نموذج SentenceTransformer: {MODEL_NAME}")
-    # سيتم تنزيل النموذج تلقائيًا في المرة الأولى وتخزينه مؤقتًا.
-    model = SentenceTransformer(MODEL_NAME)
-
-    # --- 4. إنشاء المتجهات (Embeddings) ---
-    logging.info("بدء إنشاء المتجهات للنصوص... هذه العملية قد تستغرق بعض الوقت.")
-    embeddings = model.encode(texts_to_embed, show_progress_bar=True, normalize_embeddings=True)
+def make_batch_encoder(embedding_cache_dir=DEFAULT_EMBEDDING_CACHE_DIR):
+    """دالة ترميز لدفعة واحدة، عبر ذاكرة المتجهات الدائمة إن كانت مفعّلة."""
+    def encode_batch(texts):
+        return encode_with_model(texts, show_progress_bar=False)
+
+    if not embedding_cache_dir:
+        return encode_batch
+    cache = DiskEmbeddingCache(embedding_cache_dir, cache_model_name(), normalize=True)
+    return lambda texts: cache.encode(texts, encode_batch)
+
+def embed_texts(texts, embedding_cache_dir=DEFAULT_EMBEDDING_CACHE_DIR):
+    """
+    ترميز النصوص عبر ذاكرة المتجهات الدائمة إن كانت مفعّلة؛ لا يُحمَّل النموذج إلا إذا وُجدت نصوص غير مخزنة.
+    """
+    if embedding_cache_dir:
+        cache = DiskEmbeddingCache(embedding_cache_dir, cache_model_name(), normalize=True)
+        embeddings = cache.encode(texts, encode_with_model)
+        logging.info(f"إحصاءات ذاكرة المتجهات الدائمة: {cache.stats()}")
+    else:
+        embeddings = encode_with_model(texts)
     embeddings = np.array(embeddings, dtype='float32')
     logging.info(f"تم إنشاء {len(embeddings)} متجه. أبعاد المتجه الواحد: {embeddings.shape[1]}")
+    return embeddings
 
-    # --- 5. بناء وحفظ فهرس FAISS ---
-    index_dimension = embeddings.shape[1]
-    # استخدام IndexFlatL2: يقوم ببحث دقيق (exact search)، وهو مثالي للبداية ومجموعات البيانات الصغيرة.
-    index = faiss.IndexFlatL2(index_dimension)
-    
-    logging.info("إضافة المتجهات إلى فهرس FAISS.")
-    index.add(embeddings)
-    
-    logging.info(f"حفظ فهرس FAISS في المسار: {INDEX_PATH}")
-    faiss.write_index(index, INDEX_PATH)
-    
-    # --- 6. حفظ البيانات الوصفية (Metadata) ---
-    # نحفظ البيانات الوصفية في ملف منفصل. ترتيب السجلات هنا يطابق تمامًا
-    # ترتيب المتجهات في فهرس FAISS (مهم جدًا).
-    logging.info(f"حفظ البيانات الوصفية في المسار: {METADATA_PATH}")
-    with open(METADATA_PATH, 'w', encoding='utf-8') as f:
+def save_index_version(index, index_config, metadata, index_version):
+    """
+    حفظ الفهرس وإعداداته ومعرّفات متجهاته وبصمات المحتوى والفهرس المعجمي والبيانات الوصفية لإصدار معين.
+    """
+    index_path, metadata_path = output_paths(index_version)
+
+    logging.info(f"حفظ فهرس FAISS في المسار: {index_path}")
+    faiss.write_index(index, index_path)
+    # حفظ إعدادات الفهرس بجانبه ليطبق Retriever معاملات البحث نفسها عند التحميل
+    save_index_config(index_path, index_config)
+    # معرّف المتجه لكل صف من البيانات الوصفية، وبصمة محتوى كل سجل للاستيعاب التزايدي التالي
+    save_vector_ids(index_path, vector_ids_for(record['id'] for record in metadata))
+    save_content_hashes(index_path, content_hashes(metadata))
+    # الفهرس المعجمي (BM25) للبحث الهجين، بترتيب صفوف البيانات الوصفية نفسه
+    build_lexical_index(index_path, (record['chunk_text'] for record in metadata))
+
+    # --- حفظ البيانات الوصفية (Metadata) ---
+    # ترتيب السجلات هنا هو ترتيب صفوف البيانات الوصفية؛ يربطه Retriever بمتجهات الفهرس
+    # عبر ملف معرّفات المتجهات.
+    logging.info(f"حفظ البيانات الوصفية في المسار: {metadata_path}")
+    with open(metadata_path, 'w', encoding='utf-8') as f:
         json.dump(metadata, f, ensure_ascii=False, indent=4)
-        
+
+    # الصيغة العمودية المضغوطة التي يقرؤها Retriever عبر mmap (بنفس ترتيب الصفوف)
+    store_path = metadata_store_path(metadata_path)
+    logging.info(f"حفظ البيانات الوصفية العمودية في المسار: {store_path}")
+    write_metadata_store(store_path, metadata)
+
+def ingest_and_build_index(index_version=DEFAULT_INDEX_VERSION, index_config=None,
+                           embedding_cache_dir=DEFAULT_EMBEDDING_CACHE_DIR, input_path=KNOWLEDGE_BASE_PATH,
+                           batch_size=DEFAULT_BATCH_SIZE, workers=None, checkpoint_every=10, resume=False):
+    """
+    الوظيفة الرئيسية: قراءة السجلات تدريجيًا، تقسيمها على كل الأنوية، ترميزها في دفعات ثابتة الحجم
+    وإضافة كل دفعة إلى الفهرس مباشرة، مع نقاط حفظ قابلة للاستئناف (resume=True).
+    """
+    index_config = index_config or IndexConfig()
+    index_path, metadata_path = output_paths(index_version)
+    logging.info("--- بدء عملية استيعاب البيانات وبناء الفهرس ---")
+    # Flat: بحث دقيق مناسب للمجموعات الصغيرة. IVF-Flat / IVF-PQ / HNSW: بحث تقريبي للمجموعات الكبيرة.
+    # المتجهات مُطبَّعة، لذا يعطي مقياس الضرب الداخلي تشابه جيب التمام مباشرة.
+    logging.info(f"بناء فهرس من النوع {index_config.index_type} (المقياس: {index_config.metric}) من: {input_path}")
+
+    builder = StreamingIndexBuilder(
+        index_path,
+        metadata_path,
+        index_config,
+        encode=make_batch_encoder(embedding_cache_dir),
+        batch_size=batch_size,
+        workers=workers,
+        checkpoint_every=checkpoint_every,
+    )
+    index = builder.run(iter_json_records(input_path), resume=resume)
+
     logging.info(f"--- اكتملت العملية بنجاح! ---")
     logging.info(f"عدد المتجهات في الفهرس: {index.ntotal}")
 
+def ingest_incremental(base_version, index_version, index_config=None,
+                       embedding_cache_dir=DEFAULT_EMBEDDING_CACHE_DIR, input_path=KNOWLEDGE_BASE_PATH):
+    """
+    بناء إصدار جديد من إصدار سابق: ترميز السجلات الجديدة والمعدّلة فقط (حسب بصمة chunk_text)
+    وحذف متجهات السجلات المحذوفة. يرجع إلى البناء الكامل إن لم يكن الإصدار السابق قابلًا للتحديث.
+    """
+    base_index_path, _ = output_paths(base_version)
+    logging.info(f"--- بدء الاستيعاب التزايدي من الإصدار {base_version} إلى {index_version} ---")
+
+    previous_hashes = load_content_hashes(base_index_path)
+    base_config = load_index_config(base_index_path) if os.path.exists(base_index_path) else None
+    if (
+        previous_hashes is None
+        or base_config is None
+        or not os.path.exists(vector_ids_path(base_index_path))
+        or base_config.index_type not in INCREMENTAL_INDEX_TYPES
+    ):
+        logging.warning(
+            f"الإصدار {base_version} لا يدعم التحديث التزايدي (فهرس بدون معرّفات أو بصمات، "
+            f"أو نوع لا يدعم الحذف)؛ سيتم بناء الفهرس كاملًا."
+        )
+        ingest_and_build_index(index_version=index_version, index_config=index_config,
+                               embedding_cache_dir=embedding_cache_dir, input_path=input_path)
+        return
+
+    metadata = load_knowledge_base(input_path)
+    if metadata is None:
+        return
+    plan = plan_incremental_update(previous_hashes, content_hashes(metadata))
+    logging.info(
+        f"سجلات جديدة: {len(plan.added)}، معدّلة: {len(plan.changed)}، "
+        f"محذوفة: {len(plan.removed)}، دون تغيير: {plan.unchanged}"
+    )
+
+    index = faiss.read_index(base_index_path)
+    embeddings = None
+    if plan.to_embed:
+        texts_by_id = {str(record['id']): record['chunk_text'] for record in metadata}
+        embeddings = embed_texts([texts_by_id[record_id] for record_id in plan.to_embed], embedding_cache_dir)
+    apply_incremental_update(index, plan, embeddings)
+
+    save_index_version(index, base_config, metadata, index_version)
+
+    logging.info(f"--- اكتمل الاستيعاب التزايدي بنجاح! ---")
+    logging.info(f"عدد المتجهات في الفهرس: {index.ntotal}")
+
+def parse_args():
+    defaults = IndexConfig()
+    parser = argparse.ArgumentParser(description="بناء فهرس FAISS من قاعدة المعرفة.")
+    parser.add_argument("--version", default=DEFAULT_INDEX_VERSION, help="إصدار الفهرس (يطابق INDEX_VERSION).")
+    parser.add_argument("--input", default=KNOWLEDGE_BASE_PATH, help="ملف قاعدة المعرفة (JSON أو JSONL).")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=defaults.index_type)
+    parser.add_argument("--nlist", type=int, default=defaults.nlist, help="عدد الخلايا لفهارس IVF.")
+    parser.add_argument("--nprobe", type=int, default=defaults.nprobe, help="عدد الخلايا التي يُبحث فيها لفهارس IVF.")
+    parser.add_argument("--pq-m", type=int, default=defaults.pq_m, help="عدد المكمّمات الفرعية لفهرس IVF-PQ.")
+    parser.add_argument("--pq-nbits", type=int, default=defaults.pq_nbits, help="عدد البتات لكل مكمّم فرعي.")
+    parser.add_argument("--hnsw-m", type=int, default=defaults.hnsw_m, help="عدد الجيران لكل عقدة في HNSW.")
+    parser.add_argument("--ef-construction", type=int, default=defaults.ef_construction)
+    parser.add_argument("--ef-search", type=int, default=defaults.ef_search)
+    parser.add_argument(
+        "--incremental-from",
+        metavar="BASE_VERSION",
+        help="بناء الإصدار الجديد تزايديًا من إصدار سابق: ترميز السجلات الجديدة والمعدّلة فقط.",
+    )
+    parser.add_argument(
+        "--embedding-cache-dir",
+        default=DEFAULT_EMBEDDING_CACHE_DIR,
+        help="مجلد ذاكرة المتجهات الدائمة (مفتاحها النموذج والتطبيع وبصمة النص).",
+    )
+    parser.add_argument("--no-embedding-cache", action="store_true", help="ترميز كل النصوص دون ذاكرة المتجهات الدائمة.")
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKEND)
+    parser.add_argument("--onnx-model-dir", default=ONNX_MODEL_DIR, help="مجلد نموذج ONNX المُصدَّر (لواجهة onnx).")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="عدد الأجزاء في كل دفعة ترميز.")
+    parser.add_argument("--workers", type=int, default=None, help="عدد عمليات التقسيم (الافتراضي: عدد الأنوية).")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="حفظ نقطة استئناف كل N نافذة من السجلات.")
+    parser.add_argument("--resume", action="store_true", help="استئناف بناء متوقف من آخر نقطة حفظ.")
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
+    args = parse_args()
+    config = IndexConfig(
+        index_type=args.index_type,
+        nlist=args.nlist,
+        nprobe=args.nprobe,
+        pq_m=args.pq_m,
+        pq_nbits=args.pq_nbits,
+        hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction,
+        ef_search=args.ef_search,
+    )
+    embedding_cache_dir = None if args.no_embedding_cache else args.embedding_cache_dir
+    EMBEDDING_BACKEND = args.embedding_backend
+    ONNX_MODEL_DIR = args.onnx_model_dir
     create_output_directory()
-    ingest_and_build_index()
+    if args.incremental_from:
+        ingest_incremental(args.incremental_from, args.version, index_config=config,
+                           embedding_cache_dir=embedding_cache_dir, input_path=args.input)
+    else:
+        ingest_and_build_index(index_version=args.version, index_config=config,
+                               embedding_cache_dir=embedding_cache_dir, input_path=args.input,
+                               batch_size=args.batch_size, workers=args.workers,
+                               checkpoint_every=args.checkpoint_every, resume=args.resume)
 
     
\ No newline at end of file
@@ -0,0 +1,234 @@
+# scripts/load_test.py
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from typing import Dict, List, Optional
+
+import httpx
+
+# إضافة جذر المشروع إلى مسار بايثون لاستيراد الوحدات بشكل صحيح
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_report import compare_to_baseline, percentiles, write_results
+from gemini_stub import add_profile_arguments, profile_from_args
+
+# --- إعدادات ---
+GOLDEN_SET_PATH = 'evaluation/golden_set.json'
+KNOWLEDGE_BASE_PATH = 'knowledge_base/faq.json'
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("retrieval_ms", "generation_ms", "total_ms")
+BASELINE_METRICS = ["client_ms.p95", "total_ms.p95", "generation_ms.p95", "retrieval_ms.p95"]
+
+
+def load_queries() -> List[str]:
+    """أسئلة مجموعة التقييم وقاعدة المعرفة كحمل اختباري."""
+    queries = []
+    with open(GOLDEN_SET_PATH, 'r', encoding='utf-8') as f:
+        queries.extend(item['question'] for item in json.load(f))
+    with open(KNOWLEDGE_BASE_PATH, 'r', encoding='utf-8') as f:
+        queries.extend(item['question'] for item in json.load(f))
+    return queries
+
+
+def start_process(command: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen(command, cwd=PROJECT_ROOT, env={**os.environ, **(env or {})})
+
+
+async def wait_until_ready(client: httpx.AsyncClient, url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get(url)
+            if response.status_code == 200 and response.json().get("retriever_ready", True):
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"لم تصبح الخدمة جاهزة خلال {timeout} ثانية: {url}")
+
+
+async def ask(client: httpx.AsyncClient, query: str, k: int, samples: List[Dict]) -> None:
+    start = time.perf_counter()
+    try:
+        response = await client.post("/api/v1/ask", params={"query": query, "k": k})
+        status = response.status_code
+        body = response.json() if status == 200 else {}
+    except httpx.HTTPError as e:
+        status, body = type(e).__name__, {}
+    samples.append({
+        "status": status,
+        "client_ms": (time.perf_counter() - start) * 1000,
+        "answer_source": body.get("answer_source"),
+        # أخطاء Gemini تُعاد كرسالة اعتذار بالحالة 200 ودرجة ثقة صفرية
+        "degraded": status == 200 and body.get("confidence_score") == 0,
+        **body.get("timings", {}),
+    })
+
+
+async def run_closed_loop(client, queries, concurrency: int, total_requests: int, k: int) -> tuple:
+    """مستوى تزامن ثابت: كل عامل يرسل طلبه التالي فور انتهاء السابق."""
+    samples: List[Dict] = []
+    counter = iter(range(total_requests))
+
+    async def worker():
+        for number in counter:
+            await ask(client, queries[number % len(queries)], k, samples)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return samples, time.perf_counter() - start
+
+
+async def run_open_loop(client, queries, rate: float, duration: float, k: int, seed: int) -> tuple:
+    """معدل وصول ثابت (عملية بواسون): الطلبات تُرسل في مواعيدها بغض النظر عن زمن الاستجابة."""
+    samples: List[Dict] = []
+    rng = random.Random(seed)
+    tasks = []
+    start = time.perf_counter()
+    next_arrival = 0.0
+    number = 0
+    while next_arrival < duration:
+        delay = start + next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(ask(client, queries[number % len(queries)], k, samples)))
+        number += 1
+        next_arrival += rng.expovariate(rate)
+    await asyncio.gather(*tasks)
+    return samples, time.perf_counter() - start
+
+
+def summarize(name: str, samples: List[Dict], wall_seconds: float, **details) -> Dict:
+    succeeded = [sample for sample in samples if sample["status"] == 200]
+    statuses: Dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample["status"])] = statuses.get(str(sample["status"]), 0) + 1
+    sources: Dict[str, int] = {}
+    for sample in succeeded:
+        sources[str(sample["answer_source"])] = sources.get(str(sample["answer_source"]), 0) + 1
+
+    result = {
+        "name": name,
+        **details,
+        "requests": len(samples),
+        "wall_seconds": wall_seconds,
+        "throughput_rps": len(succeeded) / wall_seconds if wall_seconds else 0.0,
+        "error_rate": 1 - len(succeeded) / len(samples) if samples else 0.0,
+        "degraded_rate": sum(sample["degraded"] for sample in succeeded) / len(succeeded) if succeeded else 0.0,
+        "statuses": statuses,
+        "answer_sources": sources,
+        "client_ms": percentiles(sample["client_ms"] for sample in succeeded),
+    }
+    for stage in STAGES:
+        result[stage] = percentiles(sample[stage] for sample in succeeded if stage in sample)
+    return result
+
+
+def print_row(result: Dict) -> None:
+    if not result["client_ms"].get("count"):
+        print(f"{result['name']:<18} لا توجد طلبات ناجحة ({result['statuses']})")
+        return
+    stages = "  ".join(
+        f"{stage[:-3]} p50/p95/p99={result[stage]['p50']:.0f}/{result[stage]['p95']:.0f}/{result[stage]['p99']:.0f}ms"
+        for stage in STAGES if result[stage].get("count")
+    )
+    print(f"{result['name']:<18} rps={result['throughput_rps']:8.1f}  errors={result['error_rate']:6.1%}  "
+          f"degraded={result['degraded_rate']:6.1%}  {stages}")
+
+
+async def run_benchmark(args) -> tuple:
+    """تُرجع (نتائج السيناريوهات، مسارات الاسترجاع التي سلكتها الخدمة كما في /healthz)."""
+    queries = load_queries()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.request_timeout, limits=limits) as client:
+        await wait_until_ready(client, "/healthz", args.startup_timeout)
+        # إحماء: تحميل مسارات الكود وملء ذاكرة المتجهات قبل القياس
+        await run_closed_loop(client, queries, min(4, len(queries)), args.warmup_requests, args.k)
+
+        results = []
+        for concurrency in [int(value) for value in args.concurrency.split(",") if value]:
+            samples, wall = await run_closed_loop(client, queries, concurrency, args.requests, args.k)
+            results.append(summarize(f"concurrency={concurrency}", samples, wall, mode="closed", concurrency=concurrency))
+            print_row(results[-1])
+        for rate in [float(value) for value in args.rates.split(",") if value]:
+            samples, wall = await run_open_loop(client, queries, rate, args.duration, args.k, args.seed)
+            results.append(summarize(f"rate={rate:g}/s", samples, wall, mode="open", rate=rate))
+            print_row(results[-1])
+        # عدد الاستعلامات حسب مسار البحث (dense، hybrid، lexical) لتفسير النتائج ومقارنتها
+        retrieval_paths = (await client.get("/healthz")).json().get("retrieval")
+        return results, retrieval_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="اختبار حمل لنقطة النهاية /api/v1/ask مقابل خادم Gemini محلي بزمن وأخطاء قابلة للضبط."
+    )
+    parser.add_argument("--url", help="عنوان خدمة تعمل مسبقًا؛ بدونه تُشغَّل الخدمة وخادم Gemini المحلي تلقائيًا.")
+    parser.add_argument("--app-port", type=int, default=8080)
+    parser.add_argument("--stub-port", type=int, default=8090)
+    parser.add_argument("--app-workers", type=int, default=1)
+    parser.add_argument("--keep-caches", action="store_true",
+                        help="إبقاء ذاكرة الإجابات والإجابة المباشرة وذاكرة المتجهات مفعّلة "
+                             "(معطلة افتراضيًا لقياس مسار الترميز والتوليد كاملًا).")
+    parser.add_argument("--retrieval-mode", choices=("hybrid", "dense"), default=os.environ.get("RETRIEVAL_MODE", "hybrid"),
+                        help="وضع الاسترجاع للخدمة التي يشغّلها السكربت (RETRIEVAL_MODE).")
+    parser.add_argument("--concurrency", default="1,8,32", help="مستويات التزامن الثابتة (حلقة مغلقة).")
+    parser.add_argument("--requests", type=int, default=200, help="عدد الطلبات لكل مستوى تزامن.")
+    parser.add_argument("--rates", default="", help="معدلات وصول بالطلب/ثانية (حلقة مفتوحة)، مثل 10,50.")
+    parser.add_argument("--duration", type=float, default=20.0, help="مدة كل معدل وصول بالثواني.")
+    parser.add_argument("--warmup-requests", type=int, default=20)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="مسار ملف JSON لحفظ النتائج.")
+    parser.add_argument("--baseline", help="ملف نتائج سابق للمقارنة؛ يفشل السكربت عند تراجع يتجاوز --tolerance.")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    profile = profile_from_args(args)
+
+    processes = []
+    if not args.url:
+        stub_command = [sys.executable, "scripts/gemini_stub.py", "--port", str(args.stub_port)]
+        for field, value in asdict(profile).items():
+            stub_command += [f"--{field.replace('_', '-')}", str(value)]
+        processes.append(start_process(stub_command))
+
+        app_env = {"GEMINI_API_ENDPOINT": f"http://127.0.0.1:{args.stub_port}", "RETRIEVAL_MODE": args.retrieval_mode}
+        if not args.keep_caches:
+            app_env.update({
+                "ANSWER_CACHE_ENABLED": "false", "DIRECT_ANSWER_ENABLED": "false", "EMBEDDING_CACHE_ENABLED": "false",
+            })
+        processes.append(start_process([
+            sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.app_port),
+            "--workers", str(args.app_workers), "--log-level", "warning",
+        ], env=app_env))
+        args.url = f"http://127.0.0.1:{args.app_port}"
+
+    try:
+        results, retrieval_paths = asyncio.run(run_benchmark(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=30)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    # المسارات الفعلية: الوضع hybrid يعود إلى dense إن لم يوجد الفهرس المعجمي
+    config["retrieval_paths"] = retrieval_paths
+    if args.output:
+        write_results(args.output, "load_test", config, results)
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, BASELINE_METRICS, args.tolerance)
+        if regressions:
+            print(f"⚠️ تراجع في {len(regressions)} مقياس مقارنة بملف الأساس.")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
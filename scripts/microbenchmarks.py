@@ -0,0 +1,116 @@
+# scripts/microbenchmarks.py
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict
+
+# إضافة جذر المشروع إلى مسار بايثون لاستيراد الوحدات بشكل صحيح
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger("sentence_transformers").setLevel(logging.WARNING)
+
+from benchmark_report import compare_to_baseline, percentiles, write_results
+
+from app.core.generator import build_prompt
+from app.core.retriever import Retriever
+
+# --- إعدادات ---
+GOLDEN_SET_PATH = 'evaluation/golden_set.json'
+KNOWLEDGE_BASE_PATH = 'knowledge_base/faq.json'
+BASELINE_METRICS = ["latency_ms.p50", "latency_ms.p95"]
+
+
+def load_queries():
+    queries = []
+    with open(GOLDEN_SET_PATH, 'r', encoding='utf-8') as f:
+        queries.extend(item['question'] for item in json.load(f))
+    with open(KNOWLEDGE_BASE_PATH, 'r', encoding='utf-8') as f:
+        queries.extend(item['question'] for item in json.load(f))
+    return queries
+
+
+def measure(name: str, operation: Callable[[int], object], iterations: int, warmup: int, items: int = 1) -> Dict:
+    """تشغيل العملية iterations مرة (بعد warmup مرة غير محسوبة) وقياس زمن كل استدعاء."""
+    for number in range(warmup):
+        operation(number)
+    latencies = []
+    for number in range(iterations):
+        start = time.perf_counter()
+        operation(number)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latency = percentiles(latencies)
+    result = {
+        "name": name,
+        "items_per_call": items,
+        "latency_ms": latency,
+        "items_per_second": items * 1000 / latency["mean"],
+    }
+    print(f"{name:<28} p50={latency['p50']:8.3f}ms  p95={latency['p95']:8.3f}ms  p99={latency['p99']:8.3f}ms  "
+          f"{result['items_per_second']:10.1f} items/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياسات دقيقة لمراحل المسار: الترميز، البحث في الفهرس وبناء الموجه.")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--output", help="مسار ملف JSON لحفظ النتائج.")
+    parser.add_argument("--baseline", help="ملف نتائج سابق للمقارنة؛ يفشل السكربت عند تراجع يتجاوز --tolerance.")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    retriever = Retriever()
+    retriever.load()
+    # نعطل ذاكرة المتجهات المؤقتة حتى يقيس الاختبار كلفة الترميز الفعلية
+    retriever.query_cache = None
+    queries = load_queries()
+    batch = [queries[i % len(queries)] for i in range(args.batch_size)]
+    query_vectors = retriever.encode_queries(batch)
+    chunks = retriever.search(queries[0], k=args.k)
+
+    def encode(texts):
+        return retriever.model.encode(texts, convert_to_tensor=False, normalize_embeddings=True)
+
+    results = [
+        measure("encode[1]", lambda n: encode([queries[n % len(queries)]]), args.iterations, args.warmup),
+        measure(f"encode[{args.batch_size}]", lambda n: encode(batch), max(args.iterations // 10, 5), 2,
+                items=args.batch_size),
+        measure("index.search[1]", lambda n: retriever.index.search(query_vectors[n % len(batch)][None], args.k),
+                args.iterations, args.warmup),
+        measure(f"index.search[{args.batch_size}]", lambda n: retriever.index.search(query_vectors, args.k),
+                args.iterations, args.warmup, items=args.batch_size),
+        measure(f"build_prompt[k={len(chunks)}]", lambda n: build_prompt(queries[n % len(queries)], chunks),
+                args.iterations, args.warmup),
+    ]
+    if retriever.lexical_index is not None:
+        results.append(measure(
+            "lexical.search[1]", lambda n: retriever.lexical_index.search(queries[n % len(queries)], args.k),
+            args.iterations, args.warmup,
+        ))
+    results.append(measure("retriever.search[1]", lambda n: retriever.search(queries[n % len(queries)], k=args.k),
+                           args.iterations, args.warmup))
+
+    config = {
+        "index_version": retriever.index_version,
+        "index_type": retriever.index_config.index_type,
+        "index_size": int(retriever.index.ntotal),
+        "iterations": args.iterations,
+        "batch_size": args.batch_size,
+        "k": args.k,
+    }
+    if args.output:
+        write_results(args.output, "microbenchmarks", config, results)
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, BASELINE_METRICS, args.tolerance)
+        if regressions:
+            print(f"⚠️ تراجع في {len(regressions)} مقياس مقارنة بملف الأساس.")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# tests/test_answer_cache.py
+import numpy as np
+
+from app.core.answer_cache import SemanticAnswerCache
+
+ANSWER = {"answer": "إجابة", "confidence_score": 0.85}
+
+
+def test_hit_requires_similarity_and_same_sources():
+    """اختبار أن الإصابة تتطلب تشابهًا فوق العتبة ونفس مجموعة المصادر."""
+    cache = SemanticAnswerCache(similarity_threshold=0.95)
+    cache.put(np.array([1.0, 0.0]), ["faq-001", "faq-002"], "v1", ANSWER)
+
+    assert cache.get(np.array([0.99, 0.05]), ["faq-002", "faq-001"], "v1") == ANSWER
+    assert cache.get(np.array([0.99, 0.05]), ["faq-001"], "v1") is None
+    assert cache.get(np.array([0.0, 1.0]), ["faq-001", "faq-002"], "v1") is None
+
+
+def test_entries_expire_and_follow_index_version():
+    """اختبار انتهاء الصلاحية وحذف مدخلات إصدار الفهرس عند إبطاله فقط."""
+    cache = SemanticAnswerCache(ttl_seconds=0.0)
+    cache.put(np.array([1.0, 0.0]), ["faq-001"], "v1", ANSWER)
+    assert cache.get(np.array([1.0, 0.0]), ["faq-001"], "v1") is None
+
+    cache = SemanticAnswerCache()
+    cache.put(np.array([1.0, 0.0]), ["faq-001"], "v1", ANSWER)
+    assert cache.get(np.array([1.0, 0.0]), ["faq-001"], "v2") is None
+    assert cache.invalidate("v1") == 1
+    assert cache.get(np.array([1.0, 0.0]), ["faq-001"], "v1") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_interleaved_index_versions_keep_their_entries():
+    """اختبار أن تناوب الطلبات بين فهرسين لا يفرغ الذاكرة، وأن الإبطال يخص إصداره وحده."""
+    cache = SemanticAnswerCache()
+    answer_a, answer_b = {**ANSWER, "answer": "أ"}, {**ANSWER, "answer": "ب"}
+    for _ in range(3):
+        cache.put(np.array([1.0, 0.0]), ["faq-001"], "v-a", answer_a)
+        cache.put(np.array([1.0, 0.0]), ["faq-001"], "v-b", answer_b)
+        assert cache.get(np.array([1.0, 0.0]), ["faq-001"], "v-a") == answer_a
+        assert cache.get(np.array([1.0, 0.0]), ["faq-001"], "v-b") == answer_b
+
+    assert cache.stats()["invalidations"] == 0
+    cache.invalidate("v-a")
+    assert cache.get(np.array([1.0, 0.0]), ["faq-001"], "v-a") is None
+    assert cache.get(np.array([1.0, 0.0]), ["faq-001"], "v-b") == answer_b
+
+
+def test_queries_without_vectors_match_by_normalized_text():
+    """اختبار أن الاستعلام المُجاب معجميًا (دون متجه) يُطابَق بنصه المُطبَّع ومصادره دون ترميز."""
+    cache = SemanticAnswerCache()
+    cache.put(None, ["faq-001"], "v1", ANSWER, query="سياسة الإرجاع")
+
+    assert cache.get(None, ["faq-001"], "v1", query="  سياسة الارجاع") == ANSWER
+    assert cache.get(None, ["faq-002"], "v1", query="سياسة الإرجاع") is None
+    assert cache.get(None, ["faq-001"], "v2", query="سياسة الإرجاع") is None
+    # المدخل الحرفي لا يدخل مصفوفة التشابه الدلالي
+    assert cache.get(np.array([1.0, 0.0]), ["faq-001"], "v1") is None
+    cache.invalidate("v1")
+    assert cache.get(None, ["faq-001"], "v1", query="سياسة الإرجاع") is None
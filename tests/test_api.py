@@ -1,18 +1,37 @@
 # tests/test_api.py
+import json
+
+import numpy as np
+import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch
+from app import main
 from app.main import app
 
 client = TestClient(app)
 
+
+@pytest.fixture(autouse=True)
+def clear_answer_cache():
+    """تفريغ ذاكرة الإجابات المؤقتة بين الاختبارات."""
+    if main.answer_cache is not None:
+        main.answer_cache.clear()
+
+
+def _configure_retriever_mock(mock_retriever_instance):
+    mock_retriever_instance.search.return_value = (
+        [{"id": "test-001", "source": "test.pdf", "retrieval_score": 0.9}],
+        np.ones((1, 4), dtype="float32"),
+    )
+    mock_retriever_instance.index_version = "test"
+
+
 @patch('app.main.retriever_instance')
 @patch('app.main.generate_answer')
 def test_ask_question_success(mock_generate_answer, mock_retriever_instance):
     """اختبار المسار الناجح لنقطة النهاية /api/v1/ask."""
     # إعداد المخرجات الوهمية (Mocks)
-    mock_retriever_instance.search.return_value = [
-        {"id": "test-001", "source": "test.pdf", "retrieval_score": 0.9}
-    ]
+    _configure_retriever_mock(mock_retriever_instance)
     mock_generate_answer.return_value = {
         "answer": "هذه إجابة وهمية.",
         "confidence_score": 0.9
@@ -27,5 +46,157 @@ def test_ask_question_success(mock_generate_answer, mock_retriever_instance):
     assert data["answer"] == "هذه إجابة وهمية."
     assert len(data["sources"]) == 1
     assert data["sources"][0]["id"] == "test-001"
-    mock_retriever_instance.search.assert_called_once_with("test", k=1)
-    mock_generate_answer.assert_called_once()
\ No newline at end of file
+    mock_retriever_instance.search.assert_called_once_with("test", k=1, return_vector=True)
+    mock_generate_answer.assert_called_once()
+    # ذاكرة الإجابات تستخدم متجه الاسترجاع نفسه دون ترميز ثانٍ
+    mock_retriever_instance.encode_query.assert_not_called()
+
+
+@patch('app.main.retriever_instance')
+@patch('app.main.generate_answer')
+def test_confident_faq_hit_skips_generation(mock_generate_answer, mock_retriever_instance):
+    """اختبار أن سجل الأسئلة الشائعة عالي التطابق يُعاد مباشرة دون استدعاء Gemini مع توقيت خاص به."""
+    if main.direct_answerer is None:
+        pytest.skip("الإجابة المباشرة معطلة في الإعدادات.")
+    _configure_retriever_mock(mock_retriever_instance)
+    mock_retriever_instance.search.return_value = ([
+        {"id": "faq-001", "source": "a.pdf", "retrieval_score": 0.97, "answer": "إجابة مخزنة."},
+        {"id": "faq-002", "source": "b.pdf", "retrieval_score": 0.41, "answer": "إجابة أخرى."},
+    ], None)
+
+    data = client.post("/api/v1/ask?query=test&k=2").json()
+
+    assert data["answer"] == "إجابة مخزنة."
+    assert data["answer_source"] == "direct"
+    assert "direct_answer_ms" in data["timings"] and "generation_ms" not in data["timings"]
+    mock_generate_answer.assert_not_called()
+    assert main.direct_answerer.stats()["hits"] >= 1
+
+
+@patch('app.main.retriever_instance')
+@patch('app.main.generate_answer')
+def test_ask_question_served_from_answer_cache(mock_generate_answer, mock_retriever_instance):
+    """اختبار أن تكرار السؤال بنفس المصادر يُخدم من ذاكرة الإجابات دون استدعاء Gemini."""
+    if main.answer_cache is None:
+        pytest.skip("ذاكرة الإجابات المؤقتة معطلة في الإعدادات.")
+    _configure_retriever_mock(mock_retriever_instance)
+    mock_generate_answer.return_value = {
+        "answer": "هذه إجابة وهمية.",
+        "confidence_score": 0.9
+    }
+
+    first = client.post("/api/v1/ask?query=test&k=1").json()
+    second = client.post("/api/v1/ask?query=test&k=1").json()
+
+    assert first["answer_source"] == "llm"
+    assert second["answer_source"] == "cache"
+    assert second["answer"] == first["answer"]
+    mock_generate_answer.assert_called_once()
+
+
+@patch('app.main.retriever_instance')
+@patch('app.main.generate_answer')
+def test_lexical_fast_path_query_is_cached_without_encoding(mock_generate_answer, mock_retriever_instance):
+    """اختبار أن استعلام المسار المعجمي (دون متجه) يُخزَّن ويُسترجع بنصه دون استدعاء نموذج التضمين."""
+    if main.answer_cache is None:
+        pytest.skip("ذاكرة الإجابات المؤقتة معطلة في الإعدادات.")
+    mock_retriever_instance.index_version = "test"
+    mock_retriever_instance.search.return_value = (
+        [{"id": "doc-001", "source": "a.pdf", "retrieval_score": 1.0, "retrieval_method": "lexical"}], None
+    )
+    mock_generate_answer.return_value = {"answer": "إجابة.", "confidence_score": 0.9}
+
+    first = client.post("/api/v1/ask?query=سياسة الإرجاع&k=1").json()
+    second = client.post("/api/v1/ask?query=سياسة الارجاع&k=1").json()
+
+    assert [first["answer_source"], second["answer_source"]] == ["llm", "cache"]
+    mock_retriever_instance.encode_query.assert_not_called()
+
+
+def _parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@patch('app.main.retriever_instance')
+@patch('app.main.generate_answer_stream')
+def test_ask_question_stream_sends_sources_tokens_and_timings(mock_generate_answer_stream, mock_retriever_instance):
+    """اختبار ترتيب أحداث SSE: المصادر أولًا، ثم أجزاء الإجابة، ثم التوقيتات."""
+    _configure_retriever_mock(mock_retriever_instance)
+
+    async def fake_stream(query, context_chunks):
+        yield {"type": "token", "text": "جزء أول "}
+        yield {"type": "token", "text": "جزء ثانٍ"}
+        yield {"type": "end", "confidence_score": 0.85, "finish_reason": "STOP"}
+
+    mock_generate_answer_stream.side_effect = fake_stream
+
+    response = client.get("/api/v1/ask/stream?query=test&k=1")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _parse_sse(response.text)
+    assert [name for name, _ in events] == ["sources", "token", "token", "done"]
+    assert events[0][1]["sources"][0]["id"] == "test-001"
+    assert "".join(data["text"] for name, data in events if name == "token") == "جزء أول جزء ثانٍ"
+    timings = events[-1][1]["timings"]
+    assert {"retrieval_ms", "generation_ms", "ttft_ms", "total_ms"} <= set(timings)
+    mock_retriever_instance.encode_query.assert_not_called()
+    assert timings["ttft_ms"] <= timings["total_ms"]
+
+
+@patch('app.main.retriever_instance')
+def test_ask_question_stream_reports_retrieval_errors_as_sse(mock_retriever_instance):
+    """اختبار أن فشل الاسترجاع بعد بدء التدفق يُرسل حدث error بدل قطع الاتصال."""
+    mock_retriever_instance.search.side_effect = RuntimeError("index unavailable")
+
+    with patch.object(main, "retrieval_batcher", None):
+        response = client.get("/api/v1/ask/stream?query=test&k=1")
+
+    assert response.status_code == 200
+    events = _parse_sse(response.text)
+    assert [name for name, _ in events] == ["error"]
+    assert events[0][1]["error"] == "Internal Server Error"
+
+
+@patch('app.main.retriever_instance')
+@patch('app.main.generate_answer')
+def test_ask_batch_returns_per_item_results_and_errors(mock_generate_answer, mock_retriever_instance):
+    """اختبار أن الدفعة تُسترجع باستدعاء واحد وأن خطأ عنصر لا يُفشل بقية العناصر."""
+    mock_retriever_instance.index_version = "test"
+    vectors = np.eye(2, dtype="float32")
+    mock_retriever_instance.search_batch.return_value = (
+        [
+            [{"id": "faq-001", "source": "a.pdf", "retrieval_score": 0.9}],
+            [{"id": "faq-002", "source": "b.pdf", "retrieval_score": 0.8}],
+        ],
+        [vectors[0:1], vectors[1:2]],
+    )
+
+    async def fake_generate_answer(query, context_chunks):
+        if query == "سؤال يفشل":
+            raise RuntimeError("boom")
+        return {"answer": f"إجابة: {query}", "confidence_score": 0.9}
+
+    mock_generate_answer.side_effect = fake_generate_answer
+
+    response = client.post("/api/v1/ask/batch", json={
+        "items": [{"query": "سؤال ناجح", "k": 1}, {"query": "سؤال يفشل", "k": 2}]
+    })
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["response"]["answer"] == "إجابة: سؤال ناجح"
+    assert results[0]["response"]["sources"][0]["id"] == "faq-001"
+    assert results[0]["error"] is None
+    assert results[1]["response"] is None
+    assert results[1]["error"]["error"] == "Generation failed"
+    mock_retriever_instance.search_batch.assert_called_once_with(
+        ["سؤال ناجح", "سؤال يفشل"], [1, 2], return_vectors=True
+    )
+    # متجهات البحث تُستخدم في ذاكرة الإجابات دون إعادة ترميز
+    mock_retriever_instance.encode_queries.assert_not_called()
+    mock_retriever_instance.encode_query.assert_not_called()
@@ -0,0 +1,106 @@
+# tests/test_batcher.py
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import faiss
+import numpy as np
+
+from app.core.batcher import RetrievalBatcher
+from app.core.indexing import IndexConfig
+from app.core.metadata_store import InMemoryMetadataStore
+from app.core.retriever import Retriever
+
+
+class FakeRetriever:
+    """مسترجع وهمي يسجل أحجام الدفعات التي يستقبلها."""
+
+    def __init__(self):
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def search_batch(self, queries, ks, return_vectors=False):
+        with self._lock:
+            self.batch_sizes.append(len(queries))
+        return [[{"id": query, "k": k}] for query, k in zip(queries, ks)], [None] * len(queries)
+
+
+def test_concurrent_requests_are_batched_and_routed_back():
+    """اختبار أن الطلبات المتزامنة تُجمع في دفعات وأن كل مستدعٍ يستلم نتيجته."""
+    retriever = FakeRetriever()
+    batcher = RetrievalBatcher(max_batch_size=8, max_wait_ms=50)
+    batcher.start()
+    try:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            futures = [pool.submit(batcher.search, retriever, f"q{i}", i % 5 + 1) for i in range(16)]
+            results = [future.result(timeout=5) for future in futures]
+    finally:
+        batcher.stop()
+
+    assert [result[0]["id"] for result in results] == [f"q{i}" for i in range(16)]
+    assert [result[0]["k"] for result in results] == [i % 5 + 1 for i in range(16)]
+    assert sum(retriever.batch_sizes) == 16
+    assert max(retriever.batch_sizes) > 1
+    assert max(retriever.batch_sizes) <= 8
+
+
+class BlockingRetriever(FakeRetriever):
+    """مسترجع وهمي ينتظر إشارة قبل إنهاء الدفعة الأولى."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def search_batch(self, queries, ks, return_vectors=False):
+        self.started.set()
+        self.release.wait(timeout=5)
+        return super().search_batch(queries, ks, return_vectors)
+
+
+def test_cancelled_caller_does_not_stop_the_worker():
+    """اختبار أن إلغاء انتظار مستدعٍ (قبل البحث أو أثناءه) لا يوقف العامل وأن الطلب التالي يكتمل."""
+    retriever = BlockingRetriever()
+    batcher = RetrievalBatcher(max_batch_size=8, max_wait_ms=1)
+    batcher.start()
+
+    async def run():
+        # إلغاء أثناء البحث: Future في حالة RUNNING فلا يفسد الإلغاء تعيين النتيجة
+        during = asyncio.ensure_future(asyncio.wrap_future(batcher.submit(retriever, "أثناء", 1)))
+        await asyncio.to_thread(retriever.started.wait, 5)
+        during.cancel()
+        retriever.release.set()
+        # إلغاء قبل أن يلتقطه العامل: يُتخطى الطلب
+        before = batcher.submit(retriever, "قبل", 1)
+        before.cancel()
+        return await asyncio.wait_for(asyncio.wrap_future(batcher.submit(retriever, "بعد", 2)), timeout=5)
+
+    try:
+        results, vectors = asyncio.run(run())
+        assert batcher._worker.is_alive()
+    finally:
+        batcher.stop()
+
+    assert results == [{"id": "بعد", "k": 2}]
+    assert vectors is None
+
+
+def test_retriever_search_batch_uses_single_encode_and_search():
+    """اختبار أن search_batch يرمّز الاستعلامات باستدعاء واحد ويحترم k لكل استعلام."""
+    vectors = np.eye(3, dtype="float32")
+    retriever = Retriever()
+    retriever.model = MagicMock()
+    retriever.model.encode.return_value = vectors[[0, 2]]
+    retriever.index = faiss.IndexFlatIP(3)
+    retriever.index.add(vectors)
+    retriever.index_config = IndexConfig()
+    retriever.metadata = InMemoryMetadataStore([{"id": f"doc-{i}"} for i in range(3)])
+    retriever.is_ready = True
+
+    results = retriever.search_batch(["أول", "ثالث"], [1, 3])
+
+    retriever.model.encode.assert_called_once()
+    assert [r["id"] for r in results[0]] == ["doc-0"]
+    assert len(results[1]) == 3
+    assert results[1][0]["id"] == "doc-2"
@@ -0,0 +1,113 @@
+# tests/test_context_packing.py
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core import generator
+from app.core.context_packing import TRUNCATION_MARKER, ContextPacker
+
+client = TestClient(main.app)
+
+
+def _chunk(chunk_id, text, score=0.5):
+    return {"id": chunk_id, "source": "faq.json", "chunk_text": text, "retrieval_score": score}
+
+
+def test_near_duplicate_chunks_are_removed_by_vector_similarity():
+    """اختبار إزالة المقطع شبه المكرر بتشابه متجهه المخزن مع الإبقاء على الأعلى ترتيبًا."""
+    chunks = [_chunk("a", "سياسة الإرجاع"), _chunk("b", "نص مختلف تمامًا"), _chunk("c", "الشحن الدولي")]
+    vectors = np.array([[1.0, 0.0, 0.0], [0.99, 0.01, 0.0], [0.0, 1.0, 0.0]], dtype=np.float32)
+
+    packed = ContextPacker(dedup_threshold=0.95).pack(chunks, vectors=vectors)
+
+    assert [c["id"] for c in packed.chunks] == ["a", "c"]
+    assert packed.duplicates_removed == 1
+    assert packed.removed_ids == ["b"]
+
+
+def test_duplicates_fall_back_to_term_overlap_without_vectors():
+    chunks = [
+        _chunk("a", "يمكن إرجاع المنتج خلال 14 يومًا من الاستلام"),
+        _chunk("b", "يمكن إرجاع المنتج خلال 14 يومًا من الاستلام."),
+        _chunk("c", "الشحن مجاني للطلبات فوق 200 ريال"),
+    ]
+
+    packed = ContextPacker().pack(chunks)
+
+    assert [c["id"] for c in packed.chunks] == ["a", "c"]
+
+
+def test_budget_truncates_then_drops_lowest_ranked_chunks():
+    """اختبار أن الميزانية تُملأ بترتيب الاسترجاع: قص المقطع الذي لا يتسع كاملًا وإسقاط ما بعده."""
+    words = " ".join(f"كلمة{i}" for i in range(60))
+    chunks = [_chunk("a", words[:150]), _chunk("b", words), _chunk("c", "مقطع أخير")]
+    original = [dict(c) for c in chunks]
+    packer = ContextPacker(max_input_tokens=100, chars_per_token=3.0, min_chunk_tokens=10)
+
+    packed = packer.pack(chunks, reserved_tokens=20)
+
+    assert [c["id"] for c in packed.chunks] == ["a", "b"]
+    assert packed.chunks[0]["chunk_text"] == chunks[0]["chunk_text"]
+    assert packed.chunks[1]["chunk_text"].endswith(TRUNCATION_MARKER)
+    assert packed.truncated and packed.chunks_dropped == 1
+    assert packed.context_tokens <= 80
+    # المقاطع الأصلية (المصادر المعروضة) لا تتغير
+    assert chunks == original
+
+
+def test_first_chunk_is_kept_even_when_over_budget():
+    packed = ContextPacker(max_input_tokens=10, min_chunk_tokens=8).pack(
+        [_chunk("a", "نص " * 200), _chunk("b", "نص آخر")], reserved_tokens=50
+    )
+    assert [c["id"] for c in packed.chunks] == ["a"]
+    assert packed.chunks[0]["chunk_text"].endswith(TRUNCATION_MARKER)
+
+
+def test_token_usage_prefers_usage_metadata():
+    response = SimpleNamespace(usage_metadata=SimpleNamespace(prompt_token_count=120, candidates_token_count=30))
+    assert generator.token_usage(response, "x" * 900, "y") == {"prompt_tokens": 120, "output_tokens": 30}
+    # تقدير من طول النص عند غياب usage_metadata
+    assert generator.token_usage(None, "x" * 30, "y" * 6) == {"prompt_tokens": 10, "output_tokens": 2}
+
+
+@patch('app.main.retriever_instance')
+@patch('app.main.generate_answer')
+def test_ask_sends_packed_context_and_reports_tokens(mock_generate_answer, mock_retriever_instance):
+    """اختبار أن Gemini يستلم المقاطع بعد إزالة المكرر بينما تبقى المصادر كاملة وتظهر الرموز في timings."""
+    chunks = [_chunk("faq-001", "سياسة الإرجاع", 0.6), _chunk("faq-002", "سياسة الإرجاع", 0.55)]
+    mock_retriever_instance.search.return_value = (chunks, None)
+    mock_retriever_instance.index_version = "test"
+    packed_on_event_loop = []
+
+    def chunk_vectors(chunks):
+        try:
+            asyncio.get_running_loop()
+            packed_on_event_loop.append(True)
+        except RuntimeError:
+            packed_on_event_loop.append(False)
+        return np.ones((2, 4), dtype=np.float32)
+
+    mock_retriever_instance.chunk_vectors.side_effect = chunk_vectors
+    mock_generate_answer.return_value = {
+        "answer": "إجابة.", "confidence_score": 0.85, "usage": {"prompt_tokens": 42, "output_tokens": 7},
+    }
+
+    with patch.object(main, "answer_cache", None), patch.object(main, "direct_answerer", None):
+        response = client.post("/api/v1/ask?query=test&k=2")
+
+    assert response.status_code == 200
+    sent_chunks = mock_generate_answer.call_args.kwargs["context_chunks"]
+    assert [c["id"] for c in sent_chunks] == ["faq-001"]
+    assert [s["id"] for s in response.json()["sources"]] == ["faq-001", "faq-002"]
+    assert response.json()["timings"]["prompt_tokens"] == 42
+    assert response.json()["timings"]["output_tokens"] == 7
+    # قراءة المتجهات والتعبئة تعملان خارج خيط حلقة الأحداث
+    assert packed_on_event_loop == [False]
+
+
+def test_generation_config_caps_output_tokens():
+    assert generator.generation_config["max_output_tokens"] == main.settings.LLM_MAX_OUTPUT_TOKENS
@@ -0,0 +1,27 @@
+# tests/test_direct_answer.py
+from app.core.direct_answer import DirectAnswerer
+
+
+def _chunk(score, answer="يمكن إرجاع المنتجات خلال 30 يومًا."):
+    return {"id": "faq-001", "source": "a.pdf", "retrieval_score": score, "answer": answer}
+
+
+def test_confident_faq_hit_is_answered_directly():
+    """اختبار أن النتيجة الأولى ذات التشابه العالي والفارق الواضح تُعاد إجابتها المخزنة."""
+    answerer = DirectAnswerer(min_score=0.8, min_margin=0.1)
+    result = answerer.answer([_chunk(0.93), _chunk(0.6)])
+
+    assert result == {"answer": "يمكن إرجاع المنتجات خلال 30 يومًا.", "confidence_score": 0.93}
+    assert answerer.stats() == {"hits": 1, "misses": 0, "hit_rate": 1.0}
+
+
+def test_low_score_small_margin_or_missing_answer_falls_back_to_llm():
+    answerer = DirectAnswerer(min_score=0.8, min_margin=0.1)
+
+    assert answerer.answer([_chunk(0.75)]) is None
+    assert answerer.answer([_chunk(0.9), _chunk(0.85)]) is None
+    assert answerer.answer([_chunk(0.95, answer=None)]) is None
+    assert answerer.answer([]) is None
+    # نتيجة واحدة فقط: تكفي العتبة
+    assert answerer.answer([_chunk(0.85)]) is not None
+    assert answerer.stats()["hit_rate"] == 0.2
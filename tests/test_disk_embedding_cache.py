@@ -0,0 +1,62 @@
+# tests/test_disk_embedding_cache.py
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from app.core.disk_embedding_cache import DiskEmbeddingCache
+from app.core.embedding_cache import QueryEmbeddingCache
+from app.core.retriever import Retriever
+from app.core.text_normalization import normalize_query
+
+
+def _encoder(calls):
+    def encode(texts):
+        calls.append(list(texts))
+        return np.array([[len(text), 1.0, 0.0] for text in texts], dtype=np.float32)
+    return encode
+
+
+def test_only_missing_texts_are_encoded_and_persisted(tmp_path):
+    """اختبار أن النصوص المخزنة لا يُعاد ترميزها، حتى بعد إعادة فتح الذاكرة من القرص."""
+    calls = []
+    cache = DiskEmbeddingCache(str(tmp_path), "model-a")
+    first = cache.encode(["a", "bb", "a"], _encoder(calls))
+    assert calls == [["a", "bb"]]
+    assert first.shape == (3, 3)
+
+    reopened = DiskEmbeddingCache(str(tmp_path), "model-a")
+    second = reopened.encode(["bb", "ccc", "a"], _encoder(calls))
+    assert calls[1:] == [["ccc"]]
+    np.testing.assert_array_equal(second[0], first[1])
+    np.testing.assert_array_equal(second[2], first[0])
+    assert len(reopened) == 3
+
+
+def test_cache_is_keyed_by_model_and_normalization(tmp_path):
+    calls = []
+    DiskEmbeddingCache(str(tmp_path), "model-a").encode(["a"], _encoder(calls))
+    DiskEmbeddingCache(str(tmp_path), "model-b").encode(["a"], _encoder(calls))
+    DiskEmbeddingCache(str(tmp_path), "model-a", normalize=False).encode(["a"], _encoder(calls))
+    assert len(calls) == 3
+
+
+def test_writes_from_another_instance_are_visible(tmp_path):
+    """اختبار أن عمليتين تتشاركان نفس المجلد تريان إضافات بعضهما دون إعادة فتح."""
+    reader = DiskEmbeddingCache(str(tmp_path), "model-a")
+    writer = DiskEmbeddingCache(str(tmp_path), "model-a")
+    writer.put_many(["x"], np.ones((1, 3), dtype=np.float32))
+    assert reader.get_many(["x"])[0] is not None
+
+
+def test_retriever_primes_query_cache_from_disk(tmp_path):
+    """اختبار أن التسخين يملأ ذاكرة الاستعلامات من القرص دون استدعاء النموذج في التشغيل التالي."""
+    for expected_calls in (1, 0):
+        retriever = Retriever(index_version="v-test")
+        retriever.model = MagicMock()
+        retriever.model.encode.side_effect = lambda texts, **kwargs: np.ones((len(texts), 3), dtype=np.float32)
+        retriever.query_cache = QueryEmbeddingCache(8)
+
+        retriever.prime_query_cache(["ما هي سياسة الإرجاع؟"], disk_cache_dir=str(tmp_path))
+
+        assert retriever.model.encode.call_count == expected_calls
+        assert retriever.query_cache.get(normalize_query("ما هي سياسة الإرجاع؟")) is not None
@@ -0,0 +1,44 @@
+# tests/test_embedding_cache.py
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from app.core.embedding_cache import QueryEmbeddingCache
+from app.core.retriever import Retriever
+from app.core.text_normalization import normalize_query
+
+
+def test_normalize_query_unifies_arabic_variants():
+    """اختبار أن التشكيل وأشكال الألف والياء والمسافات لا تغيّر المفتاح."""
+    assert normalize_query("  مَا هِيَ  سياسة الإرجاع؟ ") == normalize_query("ما هي سياسة الارجاع؟")
+    assert normalize_query("إلى") == normalize_query("الي")
+
+
+def test_cache_evicts_least_recently_used():
+    """اختبار الإخلاء حسب الأقدم استخدامًا وعدّادات الإحصاءات."""
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put("a", np.zeros((1, 2)))
+    cache.put("b", np.ones((1, 2)))
+    assert cache.get("a") is not None  # يصبح "a" الأحدث استخدامًا
+    cache.put("c", np.ones((1, 2)))
+
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+
+def test_retriever_encodes_repeated_query_once():
+    """اختبار أن الصيغ المتكافئة للاستعلام لا تستدعي النموذج إلا مرة واحدة."""
+    retriever = Retriever()
+    retriever.model = MagicMock()
+    retriever.model.encode.return_value = np.ones((1, 4), dtype="float32")
+
+    first = retriever.encode_query("سياسة الإرجاع")
+    second = retriever.encode_query("سياسة  الارجاع")
+
+    assert retriever.model.encode.call_count == 1
+    np.testing.assert_array_equal(first, second)
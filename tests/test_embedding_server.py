@@ -0,0 +1,99 @@
+# tests/test_embedding_server.py
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.core import embedding_server
+from app.core.embedding_server import EmbeddingServer, RemoteEncoder
+
+AUTHKEY = b"test-key"
+
+
+class FakeModel:
+    def encode(self, texts, convert_to_tensor=False, normalize_embeddings=False):
+        if "فشل" in texts:
+            raise ValueError("نص غير صالح")
+        return np.array([[len(text), 1.0] for text in texts], dtype="float32")
+
+
+@pytest.fixture
+def server_address(tmp_path):
+    address = str(tmp_path / "embed.sock")
+    server = EmbeddingServer(FakeModel(), address=address, authkey=AUTHKEY)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if os.path.exists(address):
+            break
+        time.sleep(0.01)
+    yield address
+    server.close()
+
+
+def test_remote_encoder_matches_model_interface(server_address):
+    """اختبار أن العميل البعيد يعيد نفس مخرجات النموذج لعدة خيوط متزامنة."""
+    encoder = RemoteEncoder(server_address, authkey=AUTHKEY)
+    results = {}
+
+    def worker(text):
+        results[text] = encoder.encode([text, "ab"], normalize_embeddings=True)
+
+    threads = [threading.Thread(target=worker, args=(text,)) for text in ("a", "abc", "abcd")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    np.testing.assert_array_equal(results["abc"], [[3.0, 1.0], [2.0, 1.0]])
+    assert encoder.encode("abcde").shape == (2,)
+
+
+def test_remote_encoder_surfaces_server_errors(server_address):
+    """اختبار أن أخطاء الترميز في الخادم تصل للعميل كاستثناء دون إسقاط الاتصال."""
+    encoder = RemoteEncoder(server_address, authkey=AUTHKEY)
+    with pytest.raises(RuntimeError):
+        encoder.encode(["فشل"])
+    assert encoder.encode(["ok"]).shape == (1, 2)
+
+
+def test_socket_is_private_to_its_owner(server_address):
+    assert os.stat(server_address).st_mode & 0o777 == 0o600
+
+
+def test_server_and_client_refuse_missing_authkey(tmp_path):
+    with pytest.raises(ValueError):
+        EmbeddingServer(FakeModel(), address=str(tmp_path / "embed.sock"), authkey=b"")
+    with pytest.raises(ValueError):
+        RemoteEncoder(str(tmp_path / "embed.sock"), authkey=None)
+
+
+def test_connection_reset_during_handshake_does_not_stop_the_server(tmp_path, monkeypatch):
+    """اختبار أن ConnectionResetError من accept لاتصال واحد يُسجَّل ويستمر الخادم في قبول الاتصالات."""
+    class ResettingListener(embedding_server.Listener):
+        resets = 0
+
+        def accept(self):
+            if ResettingListener.resets == 0:
+                ResettingListener.resets += 1
+                raise ConnectionResetError("انقطع العميل أثناء المصافحة")
+            return super().accept()
+
+    monkeypatch.setattr(embedding_server, "Listener", ResettingListener)
+    address = str(tmp_path / "embed.sock")
+    server = EmbeddingServer(FakeModel(), address=address, authkey=AUTHKEY)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        for _ in range(100):
+            if os.path.exists(address):
+                break
+            time.sleep(0.01)
+        vectors = RemoteEncoder(address, authkey=AUTHKEY).encode(["abc"])
+        assert ResettingListener.resets == 1
+        assert vectors.tolist() == [[3.0, 1.0]]
+        assert thread.is_alive()
+    finally:
+        server.close()
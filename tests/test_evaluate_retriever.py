@@ -0,0 +1,42 @@
+# tests/test_evaluate_retriever.py
+import os
+import sys
+
+import pytest
+
+from app.config import settings
+
+# السكربتات تستورد benchmark_report من مجلدها مباشرة
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from evaluate_retriever import override_settings, parse_config, ranking_metrics  # noqa: E402
+
+
+def test_ranking_metrics_for_single_relevant_answer():
+    """اختبار حساب Recall@k وMRR وnDCG@k بعمليات المصفوفات لسؤال له إجابة صحيحة واحدة."""
+    retrieved = [["a", "b", "c"], ["b", "a", "c"], ["c", "b"], []]
+    expected = ["a", "a", "a", "a"]
+
+    metrics = ranking_metrics(retrieved, expected, [1, 3])
+
+    assert metrics["recall_at_1"] == pytest.approx(0.25)
+    assert metrics["recall_at_3"] == pytest.approx(0.5)
+    assert metrics["mrr"] == pytest.approx((1 + 0.5) / 4)
+    # الترتيب 2 يساهم بـ 1/log2(3)
+    assert metrics["ndcg_at_3"] == pytest.approx((1 + 1 / 1.584962500721156) / 4)
+
+
+def test_parse_config_reads_typed_overrides():
+    name, overrides = parse_config("ivf-16:INDEX_VERSION=v2,INDEX_NPROBE=16,lexical_fast_path_enabled=false")
+    assert name == "ivf-16"
+    assert overrides == {"INDEX_VERSION": "v2", "INDEX_NPROBE": 16, "LEXICAL_FAST_PATH_ENABLED": False}
+    assert parse_config("baseline") == ("baseline", {})
+    with pytest.raises(ValueError):
+        parse_config("bad:NOT_A_SETTING=1")
+
+
+def test_override_settings_restores_previous_values():
+    previous = settings.RETRIEVAL_MODE
+    with override_settings({"RETRIEVAL_MODE": "dense"}):
+        assert settings.RETRIEVAL_MODE == "dense"
+    assert settings.RETRIEVAL_MODE == previous
@@ -0,0 +1,48 @@
+# tests/test_gemini_rest.py
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.gemini_rest import RestGenerativeModel
+from scripts.gemini_stub import ANSWER_WORD, StubProfile, create_stub_app
+
+
+def _model(**profile):
+    stub = create_stub_app(StubProfile(latency_ms=1, latency_sigma=0, **profile))
+    return RestGenerativeModel(
+        endpoint="http://stub",
+        api_key="test-key",
+        model_name="gemini-1.5-flash",
+        generation_config={"max_output_tokens": 256},
+        transport=httpx.ASGITransport(app=stub),
+    )
+
+
+def test_rest_model_returns_sdk_responses_from_local_stub():
+    """اختبار أن استجابة خادم Gemini المحلي تُحوَّل إلى كائن GenerateContentResponse المعتاد."""
+    model = _model(output_words=3)
+    response = asyncio.run(model.generate_content_async("سؤال"))
+
+    assert response.text == " ".join([ANSWER_WORD] * 3)
+    assert response.candidates[0].finish_reason.name == "STOP"
+    assert model.generation_config == {"maxOutputTokens": 256}
+
+
+def test_rest_model_streams_chunks_and_reports_safety_blocks():
+    async def collect(model):
+        return [chunk async for chunk in await model.generate_content_async("سؤال", stream=True)]
+
+    chunks = asyncio.run(collect(_model(output_words=6, stream_chunks=3)))
+    assert len(chunks) == 3
+    assert "".join(chunk.text for chunk in chunks).split() == [ANSWER_WORD] * 6
+
+    blocked = asyncio.run(collect(_model(safety_rate=1.0)))
+    assert not blocked[0].parts
+    assert blocked[0].candidates[0].finish_reason.name == "SAFETY"
+
+
+def test_stub_error_profile_surfaces_http_errors():
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        asyncio.run(_model(error_rate=1.0).generate_content_async("سؤال"))
+    assert error.value.response.status_code == 503
@@ -1,6 +1,9 @@
 #tests/test_generator.py
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
 
-
+from app.core import generator
 from app.core.generator import build_prompt
 def test_build_prompt_structure():
     """اختبار أن الموجه يحتوي على الأقسام الرئيسية."""
@@ -13,4 +16,122 @@ def test_build_prompt_structure():
     assert "السؤال: سؤالي" in prompt
     assert "الإجابة:" in prompt
 
-    
\ No newline at end of file
+    
+
+def test_generate_answer_limits_concurrent_llm_calls():
+    """اختبار أن الاستدعاءات غير المتزامنة لـ Gemini لا تتجاوز LLM_MAX_CONCURRENCY."""
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_generate_content_async(prompt):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return SimpleNamespace(parts=[object()], text=" إجابة ")
+
+    fake_model = MagicMock()
+    fake_model.generate_content_async = fake_generate_content_async
+
+    async def run_many():
+        return await asyncio.gather(*[
+            generator.generate_answer("كم تستغرق عملية الشحن؟", [{"chunk_text": "نص"}])
+            for _ in range(6)
+        ])
+
+    with patch.object(generator, "model", fake_model), \
+            patch.object(generator, "is_client_configured", True), \
+            patch.object(generator.settings, "LLM_MAX_CONCURRENCY", 2), \
+            patch.object(generator, "_llm_semaphore", None):
+        results = asyncio.run(run_many())
+
+    assert all(result["answer"] == "إجابة" for result in results)
+    assert max_in_flight == 2
+
+
+def test_generate_answer_stream_yields_tokens_then_end():
+    """اختبار أن التدفق يمرر أجزاء Gemini ثم حدث النهاية، ويستبدل الإجابة المحجوبة برسالة السلامة."""
+
+    def chunk(text, finish_reason=None):
+        candidate = SimpleNamespace(finish_reason=SimpleNamespace(name=finish_reason) if finish_reason else None)
+        return SimpleNamespace(parts=[object()] if text else [], text=text, candidates=[candidate])
+
+    class FakeStream:
+        def __init__(self, chunks):
+            self._chunks = list(chunks)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            if not self._chunks:
+                raise StopAsyncIteration
+            return self._chunks.pop(0)
+
+    async def collect(chunks):
+        fake_model = MagicMock()
+
+        async def fake_generate_content_async(prompt, stream=False):
+            assert stream is True
+            return FakeStream(chunks)
+
+        fake_model.generate_content_async = fake_generate_content_async
+        with patch.object(generator, "model", fake_model), \
+                patch.object(generator, "is_client_configured", True):
+            return [event async for event in generator.generate_answer_stream("كم تستغرق عملية الشحن؟", [])]
+
+    events = asyncio.run(collect([chunk("أ"), chunk("ب", "STOP")]))
+    assert [e["text"] for e in events if e["type"] == "token"] == ["أ", "ب"]
+    end = events[-1]
+    assert {key: end[key] for key in ("type", "confidence_score", "finish_reason")} == {
+        "type": "end", "confidence_score": 0.85, "finish_reason": "STOP"
+    }
+    assert set(end["usage"]) == {"prompt_tokens", "output_tokens"}
+
+    events = asyncio.run(collect([chunk("", "SAFETY")]))
+    assert events[0]["text"] == generator.SAFETY_BLOCKED_MESSAGE
+
+
+def test_generate_answer_stream_releases_slot_before_slow_consumer_finishes():
+    """اختبار أن مقعد LLM_MAX_CONCURRENCY يُحرَّر بانتهاء تدفق Gemini لا بانتهاء قراءة العميل البطيء."""
+
+    class FakeStream:
+        def __init__(self):
+            self._chunks = [
+                SimpleNamespace(parts=[object()], text=text, candidates=[SimpleNamespace(finish_reason=None)])
+                for text in ("أ", "ب", "ج")
+            ]
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            if not self._chunks:
+                raise StopAsyncIteration
+            return self._chunks.pop(0)
+
+    async def fake_generate_content_async(prompt, stream=False):
+        return FakeStream()
+
+    fake_model = MagicMock()
+    fake_model.generate_content_async = fake_generate_content_async
+
+    async def consume_slowly():
+        stream = generator.generate_answer_stream("سؤال", [])
+        first = await stream.__anext__()
+        # العميل لم يقرأ بقية الأجزاء بعد، لكن التدفق من Gemini انتهى
+        await asyncio.sleep(0.05)
+        free_slots = generator._get_llm_semaphore()._value
+        rest = [event async for event in stream]
+        return first, free_slots, rest
+
+    with patch.object(generator, "model", fake_model), \
+            patch.object(generator, "is_client_configured", True), \
+            patch.object(generator.settings, "LLM_MAX_CONCURRENCY", 1), \
+            patch.object(generator, "_llm_semaphore", None):
+        first, free_slots, rest = asyncio.run(consume_slowly())
+
+    assert first["text"] == "أ"
+    assert free_slots == 1
+    assert [e["text"] for e in rest if e["type"] == "token"] == ["ب", "ج"]
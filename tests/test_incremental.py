@@ -0,0 +1,85 @@
+# tests/test_incremental.py
+import numpy as np
+import pytest
+
+from app.core.incremental import (
+    apply_incremental_update,
+    content_hashes,
+    load_content_hashes,
+    plan_incremental_update,
+    save_content_hashes,
+)
+from app.core.indexing import (
+    IndexConfig,
+    VectorIdMap,
+    build_id_mapped_index,
+    train_index,
+    vector_ids_for,
+)
+
+
+def _records(texts):
+    return [{"id": record_id, "chunk_text": text} for record_id, text in texts.items()]
+
+
+def _vectors(n, d=16, seed=0):
+    vectors = np.random.default_rng(seed).random((n, d), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_plan_detects_added_changed_and_removed_records():
+    """اختبار أن الخطة تعتمد على بصمة المحتوى وتصنّف السجلات بشكل صحيح."""
+    previous = content_hashes(_records({"faq-001": "a", "faq-002": "b", "faq-003": "c"}))
+    current = content_hashes(_records({"faq-001": "a", "faq-002": "b2", "faq-004": "d"}))
+    plan = plan_incremental_update(previous, current)
+
+    assert plan.added == ["faq-004"]
+    assert plan.changed == ["faq-002"]
+    assert plan.removed == ["faq-003"]
+    assert plan.unchanged == 1
+    assert plan.to_embed == ["faq-004", "faq-002"]
+    assert plan.to_remove == ["faq-002", "faq-003"]
+    assert plan_incremental_update(current, current).is_empty
+
+
+def test_duplicate_record_ids_are_rejected():
+    with pytest.raises(ValueError):
+        content_hashes(_records({"faq-001": "a"}) * 2)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+def test_incremental_update_matches_rebuilt_index(index_type):
+    """اختبار أن التحديث التزايدي يعطي نتائج بحث مطابقة لإعادة بناء الفهرس من الصفر."""
+    vectors = _vectors(6)
+    config = IndexConfig(index_type=index_type, nlist=2, nprobe=2)
+    index = build_id_mapped_index(vectors.shape[1], config, num_vectors=5)
+    train_index(index, vectors[:5])
+    old_ids = ["faq-0", "faq-1", "faq-2", "faq-3", "faq-4"]
+    index.add_with_ids(vectors[:5], vector_ids_for(old_ids))
+
+    # faq-1 عُدّل (المتجه 5)، faq-3 حُذف، faq-9 جديد (المتجه 3 القديم)
+    plan = plan_incremental_update(
+        {record_id: "h" for record_id in old_ids},
+        {"faq-0": "h", "faq-1": "changed", "faq-2": "h", "faq-4": "h", "faq-9": "h"},
+    )
+    apply_incremental_update(index, plan, np.vstack([vectors[3], vectors[5]]))
+    assert index.ntotal == 5
+
+    metadata_ids = ["faq-0", "faq-1", "faq-2", "faq-4", "faq-9"]
+    id_map = VectorIdMap(vector_ids_for(metadata_ids))
+    _, found = index.search(np.vstack([vectors[5], vectors[3], vectors[4]]), 1)
+    rows = id_map.rows(found[:, 0])
+    assert [metadata_ids[row] for row in rows] == ["faq-1", "faq-9", "faq-4"]
+
+
+def test_vector_id_map_marks_unknown_ids():
+    id_map = VectorIdMap(np.array([30, 10, 20], dtype=np.int64))
+    assert list(id_map.rows(np.array([10, 20, 30, -1, 99]))) == [1, 2, 0, -1, -1]
+
+
+def test_content_hashes_round_trip(tmp_path):
+    index_path = str(tmp_path / "index_v1.faiss")
+    assert load_content_hashes(index_path) is None
+    hashes = content_hashes(_records({"faq-001": "سؤال"}))
+    save_content_hashes(index_path, hashes)
+    assert load_content_hashes(index_path) == hashes
@@ -0,0 +1,158 @@
+# tests/test_index_registry.py
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core import index_registry
+from app.core.index_registry import IndexRegistry, UnknownIndexError
+
+client = TestClient(main.app)
+
+MB = 2**20
+
+
+class FakeRetriever:
+    """مسترجع وهمي يسجل عدد مرات التحميل والنموذج الذي استلمه."""
+    loads = []
+    footprint_mb = {"v-a": 40, "v-b": 40, "v-c": 40}
+
+    def __init__(self, index_version=None, model=None):
+        self.index_version = index_version
+        self.model = model or f"model-of-{index_version}"
+        self.query_cache = None
+        self.is_ready = False
+        self.closed = False
+
+    def load(self):
+        self.loads.append(self.index_version)
+        self.is_ready = True
+
+    def warmup(self, queries, k=3):
+        pass
+
+    def footprint_bytes(self):
+        return self.footprint_mb[self.index_version] * MB
+
+    def close(self):
+        self.closed = True
+        self.is_ready = False
+
+
+def _registry(budget_mb=100, shared=None, on_evict=lambda index_version: None):
+    FakeRetriever.loads = []
+    return IndexRegistry(
+        {"a": "v-a", "b": "v-b", "c": "v-c"}, memory_budget_bytes=budget_mb * MB,
+        shared_retriever=lambda: shared, on_evict=on_evict,
+    )
+
+
+def test_indexes_load_lazily_and_share_the_embedding_model():
+    """اختبار تحميل الفهرس عند أول طلب فقط وتشارك نموذج التضمين وذاكرة المتجهات مع الفهرس الافتراضي."""
+    shared = MagicMock(is_ready=True, model="shared-model", query_cache="shared-cache")
+    registry = _registry(shared=shared)
+
+    async def run():
+        first = await registry.get("a")
+        again = await registry.get("a")
+        return first, again
+
+    with patch.object(index_registry, "Retriever", FakeRetriever):
+        first, again = asyncio.run(run())
+
+    assert first is again
+    assert FakeRetriever.loads == ["v-a"]
+    assert first.model == "shared-model" and first.query_cache == "shared-cache"
+    assert registry.stats()["hits"] == 1 and registry.stats()["misses"] == 1
+
+
+def test_least_recently_used_index_is_evicted_over_budget():
+    evicted = []
+    registry = _registry(budget_mb=100, on_evict=evicted.append)
+
+    async def run():
+        await registry.get("a")
+        await registry.get("b")
+        await registry.get("a")  # b أصبح الأقل استخدامًا مؤخرًا
+        await registry.get("c")
+
+    with patch.object(index_registry, "Retriever", FakeRetriever):
+        asyncio.run(run())
+
+    stats = registry.stats()
+    assert list(stats["resident"]) == ["a", "c"]
+    assert stats["evictions"] == 1
+    assert stats["memory_mb"] == pytest.approx(80)
+    assert evicted == ["v-b"]
+
+
+def test_evicted_index_is_closed_after_its_last_request():
+    """اختبار أن الفهرس المُخرج لا يُغلق وطلب جارٍ يحجزه، ويُغلق عند تحريره أو فورًا إن لم يكن محجوزًا."""
+    registry = _registry(budget_mb=50)
+
+    async def run():
+        a = await registry.acquire("a")
+        b = await registry.acquire("b")  # يُخرج a وهو ما زال محجوزًا
+        assert not a.closed and a.is_ready
+        assert registry.stats()["draining"] == 1
+        registry.release(a)
+        assert a.closed
+        registry.release(b)
+        await registry.get("c")  # يُخرج b غير المحجوز
+        return b
+
+    with patch.object(index_registry, "Retriever", FakeRetriever):
+        b = asyncio.run(run())
+
+    assert b.closed
+    assert registry.stats()["draining"] == 0
+
+
+def test_concurrent_first_requests_load_the_index_once():
+    registry = _registry()
+
+    async def run():
+        return await asyncio.gather(*[registry.get("b") for _ in range(5)])
+
+    with patch.object(index_registry, "Retriever", FakeRetriever):
+        retrievers = asyncio.run(run())
+
+    assert FakeRetriever.loads == ["v-b"]
+    assert all(retriever is retrievers[0] for retriever in retrievers)
+
+
+def test_unknown_index_is_rejected():
+    with pytest.raises(UnknownIndexError):
+        asyncio.run(_registry().get("missing"))
+
+
+@patch('app.main.retriever_instance')
+@patch('app.main.generate_answer')
+def test_ask_routes_by_parameter_or_header(mock_generate_answer, mock_retriever_instance):
+    """اختبار توجيه الطلب إلى الفهرس المسمى بالمعامل index أو الترويسة X-Index، و404 للاسم المجهول."""
+    mock_retriever_instance.search.return_value = ([{"id": "default-001", "source": "faq.json", "retrieval_score": 0.5}], None)
+    mock_retriever_instance.index_version = "v1"
+    named = MagicMock(is_ready=True, index_version="v-a")
+    named.search.return_value = ([{"id": "a-001", "source": "a.json", "retrieval_score": 0.5}], None)
+    mock_generate_answer.return_value = {"answer": "إجابة.", "confidence_score": 0.85}
+
+    registry = _registry()
+    registry.acquire = MagicMock(side_effect=lambda name: asyncio.sleep(0, result=named))
+    registry.release = MagicMock()
+    with patch.object(main, "index_registry", registry), \
+            patch.object(main, "retrieval_batcher", None), \
+            patch.object(main, "answer_cache", None), \
+            patch.object(main, "direct_answerer", None):
+        by_parameter = client.post("/api/v1/ask?query=test&k=1&index=a")
+        by_header = client.post("/api/v1/ask?query=test&k=1", headers={"X-Index": "a"})
+        default = client.post("/api/v1/ask?query=test&k=1")
+        unknown = client.post("/api/v1/ask?query=test&k=1&index=missing")
+
+    assert by_parameter.json()["sources"][0]["id"] == "a-001"
+    assert by_header.json()["sources"][0]["id"] == "a-001"
+    assert default.json()["sources"][0]["id"] == "default-001"
+    assert unknown.status_code == 404
+    # الحجز يُحرَّر بعد انتهاء الاستجابة لكل طلب وُجِّه إلى الفهرس المسمى
+    assert [call.args for call in registry.release.call_args_list] == [(named,), (named,)]
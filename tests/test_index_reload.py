@@ -0,0 +1,83 @@
+# tests/test_index_reload.py
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core.answer_cache import SemanticAnswerCache
+from app.main import app
+
+client = TestClient(app)
+
+
+class FakeRetriever:
+    """مسترجع وهمي يسجل النموذج المُمرَّر واستعلامات التسخين."""
+
+    def __init__(self, index_version=None, model=None):
+        self.index_version = index_version
+        self.model = model
+        self.is_ready = False
+        self.warmed_with = None
+
+    def load(self):
+        if self.index_version == "broken":
+            raise FileNotFoundError("index_broken.faiss")
+        self.is_ready = True
+
+    def warmup(self, queries, k=3):
+        self.warmed_with = list(queries)
+
+
+def test_reload_swaps_retriever_after_warmup_and_shares_model():
+    """اختبار أن الإصدار الجديد يُحمَّل ويُسخَّن ثم يُفعَّل مع إعادة استخدام نموذج التضمين."""
+    old = SimpleNamespace(index_version="v1", model="shared-model", is_ready=True)
+    with patch.object(main, "retriever_instance", old), patch.object(main, "Retriever", FakeRetriever):
+        asyncio.run(main.reload_index("v2"))
+        active = main.retriever_instance
+
+        assert active is not old
+        assert active.index_version == "v2"
+        assert active.model == "shared-model"
+        assert active.warmed_with == main.settings.WARMUP_QUERIES
+        assert main.pending_index_version is None
+
+
+def test_reload_drops_cached_answers_of_the_replaced_version_only():
+    cache = SemanticAnswerCache()
+    cache.put([1.0, 0.0], ["faq-001"], "v1", {"answer": "قديمة"})
+    cache.put([1.0, 0.0], ["faq-001"], "v-named", {"answer": "فهرس مسمى"})
+    old = SimpleNamespace(index_version="v1", model="shared-model", is_ready=True)
+    with patch.object(main, "retriever_instance", old), patch.object(main, "Retriever", FakeRetriever), \
+            patch.object(main, "answer_cache", cache), patch.object(main, "index_registry", None):
+        asyncio.run(main.reload_index("v2"))
+
+    assert cache.get([1.0, 0.0], ["faq-001"], "v1") is None
+    assert cache.get([1.0, 0.0], ["faq-001"], "v-named") == {"answer": "فهرس مسمى"}
+
+
+def test_failed_reload_keeps_serving_current_version():
+    """اختبار أن فشل التحميل لا يغيّر المسترجع النشط ويظهر في /healthz."""
+    old = SimpleNamespace(index_version="v1", model="shared-model", is_ready=True, query_cache=None)
+    with patch.object(main, "retriever_instance", old), patch.object(main, "Retriever", FakeRetriever):
+        asyncio.run(main.reload_index("broken"))
+        assert main.retriever_instance is old
+
+        health = client.get("/healthz").json()
+        assert health["index_version"] == "v1"
+        assert health["last_reload_error"].startswith("broken")
+    main.last_reload_error = None
+
+
+def test_reload_endpoint_requires_admin_token():
+    """اختبار أن نقطة النهاية الإدارية ترفض الطلبات بدون الرمز الصحيح."""
+    with patch.object(main.settings, "ADMIN_TOKEN", "secret"), \
+            patch.object(main, "start_index_reload") as mock_start:
+        assert client.post("/admin/reload-index?version=v2").status_code == 403
+        assert client.post("/admin/reload-index?version=v2", headers={"X-Admin-Token": "wrong"}).status_code == 403
+        assert client.post("/admin/reload-index?version=../etc", headers={"X-Admin-Token": "secret"}).status_code == 422
+
+        response = client.post("/admin/reload-index?version=v2", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 202
+        mock_start.assert_called_once_with("v2")
@@ -0,0 +1,60 @@
+# tests/test_indexing.py
+import faiss
+import numpy as np
+import pytest
+
+from app.core.indexing import (
+    INDEX_TYPES,
+    IndexConfig,
+    apply_search_params,
+    build_index,
+    distances_to_scores,
+    load_index_config,
+    save_index_config,
+    train_index,
+)
+
+
+def _normalized_vectors(n=300, d=32, seed=0):
+    vectors = np.random.default_rng(seed).random((n, d), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_each_index_type_finds_exact_match_with_cosine_score(index_type, tmp_path):
+    """اختبار أن كل نوع فهرس يُبنى ويُحفظ ويُحمَّل مع معاملات البحث، وأن الدرجة تشابه جيب تمام."""
+    vectors = _normalized_vectors()
+    config = IndexConfig(index_type=index_type, nlist=4, nprobe=4, pq_m=8, pq_nbits=4)
+    index = build_index(vectors.shape[1], config, num_vectors=len(vectors))
+    train_index(index, vectors)
+    index.add(vectors)
+
+    index_path = str(tmp_path / "index_test.faiss")
+    faiss.write_index(index, index_path)
+    save_index_config(index_path, config)
+
+    loaded = faiss.read_index(index_path)
+    loaded_config = load_index_config(index_path)
+    apply_search_params(loaded, loaded_config)
+
+    assert loaded_config == config
+    distances, indices = loaded.search(vectors[:5], 1)
+    scores = distances_to_scores(distances, loaded_config)
+    if index_type != "ivf_pq":
+        assert list(indices[:, 0]) == [0, 1, 2, 3, 4]
+        np.testing.assert_allclose(scores[:, 0], 1.0, atol=1e-4)
+
+
+def test_missing_config_means_legacy_flat_l2(tmp_path):
+    """اختبار أن الفهارس القديمة بدون ملف إعدادات تُعامل كـ IndexFlatL2."""
+    config = load_index_config(str(tmp_path / "index_v0.faiss"))
+    assert config.index_type == "flat"
+    assert config.metric == "l2"
+
+
+def test_ivf_nlist_is_clamped_to_corpus_size():
+    """اختبار تقليص nlist عندما تكون المجموعة أصغر من عدد الخلايا المطلوب."""
+    config = IndexConfig(index_type="ivf_flat", nlist=100, nprobe=50)
+    build_index(32, config, num_vectors=20)
+    assert config.nlist == 20
+    assert config.nprobe == 20
@@ -0,0 +1,177 @@
+# tests/test_ingestion_pipeline.py
+import hashlib
+import json
+
+import faiss
+import numpy as np
+import pytest
+
+from app.core import ingestion_pipeline
+from app.core.incremental import load_content_hashes
+from app.core.indexing import IndexConfig, VectorIdMap
+from app.core.ingestion_pipeline import (
+    StreamingIndexBuilder,
+    checkpoint_path,
+    chunk_record,
+    iter_json_records,
+)
+from app.core.lexical_index import BM25Builder, BM25Index
+from app.core.metadata_store import load_metadata_store
+
+RECORDS = [
+    {"id": f"faq-{number:03d}", "question": f"سؤال رقم {number}؟", "answer": f"جواب {number}", "source": "a.pdf"}
+    for number in range(40)
+]
+
+
+def _encode(texts):
+    vectors = np.array(
+        [np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest(), dtype=np.uint8) for text in texts],
+        dtype=np.float32,
+    ) + 1
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _builder(tmp_path, **kwargs):
+    options = {"batch_size": 4, "workers": 1, "window_size": 8, "checkpoint_every": 1}
+    options.update(kwargs)
+    config = options.pop("index_config", IndexConfig())
+    encode = options.pop("encode", _encode)
+    return StreamingIndexBuilder(
+        str(tmp_path / "index_v1.faiss"), str(tmp_path / "metadata_v1.json"), config, encode, **options
+    )
+
+
+def _search_ids(tmp_path, texts):
+    index = faiss.read_index(str(tmp_path / "index_v1.faiss"))
+    id_map = VectorIdMap(np.load(str(tmp_path / "index_v1.ids.npy")))
+    metadata = load_metadata_store(str(tmp_path / "metadata_v1.json"))
+    _, found = index.search(_encode(texts), 1)
+    return [metadata.record(int(row))["id"] for row in id_map.rows(found[:, 0])]
+
+
+def test_json_array_and_jsonl_are_read_incrementally(tmp_path, monkeypatch):
+    """اختبار أن قراءة مصفوفة JSON على كتل صغيرة تعطي نفس سجلات ملف JSONL."""
+    monkeypatch.setattr(ingestion_pipeline, "READ_BLOCK_SIZE", 7)
+    array_path = tmp_path / "kb.json"
+    array_path.write_text(json.dumps(RECORDS, ensure_ascii=False, indent=2), encoding="utf-8")
+    lines_path = tmp_path / "kb.jsonl"
+    lines_path.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in RECORDS), encoding="utf-8")
+
+    assert list(iter_json_records(str(array_path))) == RECORDS
+    assert list(iter_json_records(str(lines_path))) == RECORDS
+
+    truncated = tmp_path / "broken.json"
+    truncated.write_text(json.dumps(RECORDS)[:-10], encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(iter_json_records(str(truncated)))
+
+
+def test_chunking_of_faq_and_long_documents():
+    faq = chunk_record(RECORDS[0])
+    assert faq[0]["chunk_text"] == "سؤال: سؤال رقم 0؟ جواب: جواب 0"
+
+    pieces = chunk_record({"id": "doc-1", "text": "x" * 2500, "source": "manual.pdf"})
+    assert [piece["id"] for piece in pieces] == ["doc-1#0", "doc-1#1", "doc-1#2"]
+    assert all(len(piece["chunk_text"]) <= 1000 and piece["source"] == "manual.pdf" for piece in pieces)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_streaming_build_writes_a_searchable_version(tmp_path, workers):
+    """اختبار أن البناء المتدفق (مع مجموعة عمليات أو بدونها) ينتج فهرسًا وبيانات وصفية متطابقة."""
+    index = _builder(tmp_path, workers=workers).run(iter(RECORDS))
+
+    assert index.ntotal == len(RECORDS)
+    texts = [chunk_record(record)[0]["chunk_text"] for record in RECORDS[::7]]
+    assert _search_ids(tmp_path, texts) == [record["id"] for record in RECORDS[::7]]
+    assert len(load_content_hashes(str(tmp_path / "index_v1.faiss"))) == len(RECORDS)
+    with open(tmp_path / "metadata_v1.json", encoding="utf-8") as f:
+        assert [record["id"] for record in json.load(f)] == [record["id"] for record in RECORDS]
+    assert (tmp_path / "index_v1.bm25.npz").exists()
+    assert not (tmp_path / "index_v1.checkpoint.json").exists()
+
+
+def test_interrupted_build_resumes_from_checkpoint(tmp_path):
+    """اختبار أن الاستئناف لا يعيد ترميز السجلات المحفوظة في نقطة الحفظ الأخيرة."""
+    encoded = []
+
+    def failing_encode(texts):
+        if len(encoded) >= 20:
+            raise RuntimeError("انقطاع")
+        encoded.extend(texts)
+        return _encode(texts)
+
+    with pytest.raises(RuntimeError):
+        _builder(tmp_path, encode=failing_encode).run(iter(RECORDS))
+    assert json.loads(open(checkpoint_path(str(tmp_path / "index_v1.faiss"))).read())["records_consumed"] == 16
+
+    resumed = []
+    index = _builder(tmp_path, encode=lambda texts: resumed.extend(texts) or _encode(texts)).run(
+        iter(RECORDS), resume=True
+    )
+    assert index.ntotal == len(RECORDS)
+    assert len(resumed) == len(RECORDS) - 16
+    assert len(load_metadata_store(str(tmp_path / "metadata_v1.json"))) == len(RECORDS)
+    assert _search_ids(tmp_path, [chunk_record(RECORDS[3])[0]["chunk_text"]]) == ["faq-003"]
+
+
+@pytest.mark.parametrize("damage", ["missing", "truncated"])
+def test_resume_restarts_when_partial_metadata_is_missing_or_short(tmp_path, damage):
+    """اختبار أن الاستئناف لا يحشو ملف البيانات الوصفية المفقود أو المقتطع بأصفار بل يعيد البناء."""
+    def failing_encode(texts):
+        if "سؤال رقم 20؟" in " ".join(texts):
+            raise RuntimeError("انقطاع")
+        return _encode(texts)
+
+    with pytest.raises(RuntimeError):
+        _builder(tmp_path, encode=failing_encode).run(iter(RECORDS))
+    partial = tmp_path / "metadata_v1.partial.jsonl"
+    if damage == "missing":
+        partial.unlink()
+    else:
+        partial.write_bytes(partial.read_bytes()[:100])
+
+    encoded = []
+    index = _builder(tmp_path, encode=lambda texts: encoded.extend(texts) or _encode(texts)).run(
+        iter(RECORDS), resume=True
+    )
+    assert len(encoded) == len(RECORDS)
+    assert index.ntotal == len(RECORDS)
+    with open(tmp_path / "metadata_v1.json", encoding="utf-8") as f:
+        assert [record["id"] for record in json.load(f)] == [record["id"] for record in RECORDS]
+
+
+def test_checkpoints_do_not_rewrite_the_index(tmp_path, monkeypatch):
+    """اختبار أن نقاط الحفظ تكتب أجزاء المتجهات الجديدة فقط: الفهرس يُكتب مرتين (القالب والنسخة النهائية)."""
+    writes = []
+    original = faiss.write_index
+    monkeypatch.setattr(faiss, "write_index", lambda index, path: writes.append(path) or original(index, path))
+
+    _builder(tmp_path).run(iter(RECORDS))
+
+    assert writes == [str(tmp_path / "index_v1.partial.faiss"), str(tmp_path / "index_v1.faiss")]
+    assert not [path.name for path in tmp_path.iterdir() if "partial" in path.name or "postings" in path.name]
+
+
+def test_lexical_postings_spilled_to_disk_match_the_in_memory_build(tmp_path):
+    texts = [chunk_record(record)[0]["chunk_text"] for record in RECORDS]
+    in_memory = BM25Builder()
+    spilled = BM25Builder(spill_path=str(tmp_path / "postings"), buffer_size=7)
+    for text in texts:
+        in_memory.add(text)
+        spilled.add(text)
+    spilled.save(str(tmp_path / "spilled.npz"))
+    spilled.close()
+
+    expected, actual = in_memory.build(), BM25Index.load(str(tmp_path / "spilled.npz"))
+    np.testing.assert_array_equal(actual.offsets, expected.offsets)
+    np.testing.assert_array_equal(actual.rows, expected.rows)
+    np.testing.assert_allclose(actual.weights, expected.weights, rtol=1e-6)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["spilled.npz"]
+
+
+def test_ivf_index_is_trained_on_the_first_batches(tmp_path):
+    config = IndexConfig(index_type="ivf_flat", nlist=4, nprobe=4)
+    index = _builder(tmp_path, index_config=config, train_size=12).run(iter(RECORDS))
+    assert index.is_trained
+    assert index.ntotal == len(RECORDS)
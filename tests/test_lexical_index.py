@@ -0,0 +1,134 @@
+# tests/test_lexical_index.py
+from unittest.mock import MagicMock, patch
+
+import faiss
+import numpy as np
+
+from app.core.direct_answer import DirectAnswerer
+from app.core.indexing import IndexConfig
+from app.core.lexical_index import (
+    BM25Builder,
+    BM25Index,
+    analyze,
+    build_lexical_index,
+    lexical_index_path,
+    load_lexical_index,
+    reciprocal_rank_fusion,
+)
+from app.core.metadata_store import InMemoryMetadataStore
+from app.core.retriever import Retriever
+
+DOCUMENTS = [
+    "سؤال: ما هي سياسة الإرجاع؟ جواب: يمكنك إرجاع المنتجات خلال 14 يومًا.",
+    "سؤال: كم تستغرق عملية الشحن؟ جواب: يستغرق الشحن من 3 إلى 5 أيام عمل.",
+    "سؤال: كيف يمكنني تتبع طلبي؟ جواب: من صفحة الطلبات في حسابك.",
+    "سؤال: هل الشحن مجاني؟ جواب: الشحن مجاني للطلبات فوق 200 ريال.",
+]
+
+
+def _index():
+    builder = BM25Builder()
+    for text in DOCUMENTS:
+        builder.add(text)
+    return builder.build()
+
+
+def test_analyzer_normalizes_drops_stopwords_and_stems():
+    """اختبار أن أشكال الكلمة الواحدة (همزة، أل التعريف، تاء مربوطة، جمع) تعطي المصطلح نفسه."""
+    assert analyze("ما هي سياسة الإرجاع؟") == analyze("سياسه الارجاع")
+    assert analyze("المنتجات") == analyze("منتج")
+    assert analyze("ما هي") == []
+
+
+def test_bm25_ranks_matching_documents_and_reports_coverage():
+    hits = _index().search("سياسة الارجاع", k=3)
+    assert hits.rows[0] == 0
+    assert hits.coverage[0] == 1.0
+
+    shipping = _index().search("الشحن المجاني", k=3)
+    # المستند الذي يطابق المصطلحين يتقدم على المستند الذي يطابق أحدهما فقط
+    assert list(shipping.rows[:2]) == [3, 1]
+    assert list(shipping.coverage[:2]) == [1.0, 0.5]
+    assert len(_index().search("كلمة غير موجودة", k=3)) == 0
+
+
+def test_index_round_trips_next_to_faiss_index(tmp_path):
+    index_path = str(tmp_path / "index_v1.faiss")
+    assert lexical_index_path(index_path) == str(tmp_path / "index_v1.bm25.npz")
+    assert load_lexical_index(index_path) is None
+
+    built = build_lexical_index(index_path, DOCUMENTS)
+    loaded = load_lexical_index(index_path)
+    assert isinstance(loaded, BM25Index) and len(loaded) == len(DOCUMENTS)
+    expected, actual = built.search("تتبع الطلب", 4), loaded.search("تتبع الطلب", 4)
+    np.testing.assert_array_equal(expected.rows, actual.rows)
+    np.testing.assert_allclose(expected.scores, actual.scores)
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([np.array([1, 2, 3]), np.array([2, 4])], k=3, rrf_k=60)
+    assert [row for row, _ in fused] == [2, 1, 4]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+
+def _retriever(encoded_vectors):
+    vectors = np.eye(4, dtype=np.float32)
+    retriever = Retriever()
+    retriever.model = MagicMock()
+    retriever.model.encode.return_value = encoded_vectors
+    retriever.index = faiss.IndexFlatIP(4)
+    retriever.index.add(vectors)
+    retriever.index_config = IndexConfig()
+    retriever.metadata = InMemoryMetadataStore([
+        {"id": f"faq-{row}", "chunk_text": text, "source": "faq.pdf"} for row, text in enumerate(DOCUMENTS)
+    ])
+    retriever.lexical_index = _index()
+    retriever.query_cache = None
+    retriever.is_ready = True
+    return retriever
+
+
+def test_dominant_lexical_match_skips_encoding():
+    """اختبار أن المطابقة المعجمية المهيمنة تُرجع النتائج دون استدعاء نموذج التضمين."""
+    retriever = _retriever(np.eye(4, dtype=np.float32)[[0]])
+    results = retriever.search("سياسة الارجاع", k=2)
+
+    retriever.model.encode.assert_not_called()
+    assert results[0]["id"] == "faq-0"
+    assert results[0]["retrieval_method"] == "lexical"
+    assert retriever.retrieval_stats["lexical"] == 1
+    # المطابقة المهيمنة تحمل درجة قابلة للاستخدام في الإجابة المباشرة والاحتياطية
+    assert results[0]["retrieval_score"] == 1.0
+    assert all(r["retrieval_score"] <= 1 / 2.0 for r in results[1:])
+    assert DirectAnswerer().answer([{**results[0], "answer": "إجابة مخزنة."}, *results[1:]]) is not None
+
+
+def test_ambiguous_queries_are_fused_with_dense_results():
+    """اختبار أن الاستعلامات غير المهيمنة معجميًا تُرمَّز دفعة واحدة وتُدمج نتائجها بـ RRF."""
+    # الترميز الدلالي يفضّل المستند 1 للاستعلام الأول والمستند 2 للثاني
+    retriever = _retriever(np.eye(4, dtype=np.float32)[[1, 2]])
+    with patch("app.core.retriever.settings.HYBRID_CANDIDATES", 4):
+        results = retriever.search_batch(["الشحن", "ماذا عن الطلب", "سياسة الارجاع"], [2, 2, 1])
+
+    retriever.model.encode.assert_called_once()
+    assert retriever.model.encode.call_args[0][0] == ["الشحن", "ماذا عن الطلب"]
+    assert results[0][0]["retrieval_method"] == "hybrid"
+    assert {result["id"] for result in results[0]} == {"faq-1", "faq-3"}
+    assert results[1][0]["id"] == "faq-2"
+    assert results[2][0]["id"] == "faq-0"
+    assert retriever.retrieval_stats == {"dense": 0, "hybrid": 2, "lexical": 1}
+
+
+def test_search_batch_returns_the_vectors_it_encoded():
+    """اختبار أن return_vectors تعيد متجه البحث لكل استعلام مرمَّز وNone لما أُجيب معجميًا."""
+    encoded = np.eye(4, dtype=np.float32)[[1, 2]]
+    retriever = _retriever(encoded)
+    with patch("app.core.retriever.settings.HYBRID_CANDIDATES", 4):
+        results, vectors = retriever.search_batch(
+            ["الشحن", "ماذا عن الطلب", "سياسة الارجاع"], [2, 2, 1], return_vectors=True
+        )
+
+    assert len(results) == 3
+    np.testing.assert_array_equal(vectors[0], encoded[0:1])
+    np.testing.assert_array_equal(vectors[1], encoded[1:2])
+    assert vectors[2] is None
@@ -0,0 +1,265 @@
+# tests/test_llm_resilience.py
+import asyncio
+import json
+import random
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core import generator
+from app.core.gemini_rest import RestGenerativeModel
+from app.core.llm_resilience import CircuitBreaker, CircuitOpenError, ResilientCaller, is_retryable
+from scripts.gemini_stub import StubProfile, create_stub_app
+
+client = TestClient(main.app)
+
+
+def _status_error(status_code):
+    request = httpx.Request("POST", "http://stub/v1beta/models/m:generateContent")
+    return httpx.HTTPStatusError("stub", request=request, response=httpx.Response(status_code, request=request))
+
+
+def _caller(**options):
+    defaults = dict(retry_base_delay_ms=1, retry_max_delay_ms=5, hedge_enabled=False, rng=random.Random(0))
+    return ResilientCaller(**{**defaults, **options})
+
+
+def test_retryable_errors_are_classified():
+    assert is_retryable(_status_error(503))
+    assert is_retryable(_status_error(429))
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(httpx.ConnectError("refused"))
+    assert not is_retryable(_status_error(400))
+    assert not is_retryable(ValueError("bad prompt"))
+
+
+def test_retries_transient_errors_then_succeeds():
+    """اختبار إعادة المحاولة بعد خطأين مؤقتين (503) ثم النجاح."""
+    calls = []
+
+    async def operation():
+        calls.append(time.perf_counter())
+        if len(calls) < 3:
+            raise _status_error(503)
+        return "ok"
+
+    caller = _caller(max_retries=2)
+    assert asyncio.run(caller.call(operation)) == "ok"
+    assert len(calls) == 3
+    assert caller.breaker.state == "closed"
+
+
+def test_non_retryable_error_is_raised_immediately():
+    calls = 0
+
+    async def operation():
+        nonlocal calls
+        calls += 1
+        raise _status_error(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_caller(max_retries=3).call(operation))
+    assert calls == 1
+
+
+def test_stalled_attempt_times_out_and_is_retried():
+    """اختبار أن المحاولة العالقة تُقطع بعد مهلتها ويُعاد الطلب ضمن الموعد النهائي."""
+    attempts = 0
+
+    async def operation():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            await asyncio.sleep(10)
+        return "ok"
+
+    start = time.perf_counter()
+    assert asyncio.run(_caller(attempt_timeout_seconds=0.05, max_retries=1).call(operation)) == "ok"
+    assert time.perf_counter() - start < 1
+    assert attempts == 2
+
+
+def test_hedged_request_returns_the_faster_response():
+    """اختبار أن طلب التحوّط يُرسل بعد تجاوز النسبة المئوية وتُعاد أسرع إجابة ويُلغى الطلب البطيء."""
+    caller = _caller(hedge_enabled=True, hedge_min_samples=5, hedge_min_delay_ms=20)
+    for _ in range(5):
+        caller.latency.record(0.01)
+    started = []
+    cancelled = []
+
+    async def operation():
+        number = len(started)
+        started.append(number)
+        try:
+            await asyncio.sleep(5 if number == 0 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(number)
+            raise
+        return f"response-{number}"
+
+    start = time.perf_counter()
+    assert asyncio.run(caller.call(operation)) == "response-1"
+    assert time.perf_counter() - start < 1
+    assert started == [0, 1]
+    assert cancelled == [0]
+
+
+def test_concurrency_slots_bound_attempts_and_hedges():
+    """اختبار أن المقعد يُحجز لكل محاولة فقط (يُحرَّر أثناء التراجع) وأن التحوّط لا يُرسل دون مقعد شاغر."""
+    caller = _caller(hedge_enabled=True, hedge_min_samples=5, hedge_min_delay_ms=20, max_retries=1)
+    for _ in range(5):
+        caller.latency.record(0.01)
+    in_flight = 0
+    peak = 0
+    attempts = 0
+
+    async def operation():
+        nonlocal in_flight, peak, attempts
+        attempts += 1
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await asyncio.sleep(0.1)
+            if attempts <= 2:
+                raise _status_error(503)
+            return "ok"
+        finally:
+            in_flight -= 1
+
+    async def run():
+        limiter = asyncio.Semaphore(2)
+        results = await asyncio.gather(*[caller.call(operation, limiter=limiter) for _ in range(2)])
+        return results, limiter
+
+    results, limiter = asyncio.run(run())
+    assert results == ["ok", "ok"]
+    assert peak <= 2
+    assert limiter._value == 2
+
+
+def test_circuit_breaker_opens_and_probes_after_reset():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open() and not breaker.allow()
+
+    now[0] = 11
+    assert breaker.allow()  # استدعاء تجريبي واحد
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open()
+
+    now[0] = 22
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_non_retryable_error_leaves_half_open_breaker_unchanged():
+    """اختبار أن خطأ غير مؤقت (400) في الاستدعاء التجريبي لا يُغلق القاطع نصف المفتوح."""
+    now = [0.0]
+    caller = _caller(breaker=CircuitBreaker(failure_threshold=1, reset_seconds=10, clock=lambda: now[0]))
+    caller.breaker.record_failure()
+    now[0] = 11
+
+    async def operation():
+        raise _status_error(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(caller.call(operation))
+    assert caller.breaker.state == "half_open"
+    assert caller.breaker.consecutive_failures == 1
+    assert not caller.breaker.allow()
+
+
+def test_open_circuit_fails_fast():
+    caller = _caller(breaker=CircuitBreaker(failure_threshold=1, reset_seconds=60))
+    caller.breaker.record_failure()
+
+    async def operation():
+        raise AssertionError("should not be called")
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(caller.call(operation))
+
+
+def test_generate_answer_against_failing_stub_retries_then_opens_circuit():
+    """اختبار طبقة الحماية مع خادم Gemini المحلي: إعادة المحاولة على 503 ثم فتح القاطع والرفض الفوري."""
+    stub = create_stub_app(StubProfile(latency_ms=1, latency_sigma=0, error_rate=1.0))
+    model = RestGenerativeModel("http://stub", "key", "gemini-1.5-flash", transport=httpx.ASGITransport(app=stub))
+    caller = _caller(max_retries=2, breaker=CircuitBreaker(failure_threshold=3, reset_seconds=60))
+
+    async def ask_twice():
+        first = await generator.generate_answer("سؤال", [{"chunk_text": "نص"}])
+        second = await generator.generate_answer("سؤال", [{"chunk_text": "نص"}])
+        return first, second
+
+    with patch.object(generator, "model", model), \
+            patch.object(generator, "is_client_configured", True), \
+            patch.object(generator, "_llm_caller", caller), \
+            patch.object(generator, "_llm_semaphore", None):
+        first, second = asyncio.run(ask_twice())
+
+    assert first["finish_reason"] == "ERROR" and first["confidence_score"] == 0.0
+    assert second["finish_reason"] == "CIRCUIT_OPEN"
+    assert caller.breaker.times_opened == 1
+
+
+@patch('app.main.retriever_instance')
+@patch('app.main.generate_answer')
+def test_upstream_failure_falls_back_to_stored_faq_answer(mock_generate_answer, mock_retriever_instance):
+    """اختبار أن فشل Gemini يُستبدل بالإجابة المخزنة لأعلى سجل (answer_source = fallback)."""
+    if main.fallback_answerer is None:
+        pytest.skip("LLM_FALLBACK_ENABLED معطل")
+    mock_retriever_instance.search.return_value = ([
+        {"id": "faq-001", "source": "faq.json", "retrieval_score": 0.6, "answer": "الإرجاع خلال 14 يومًا."},
+        {"id": "faq-002", "source": "faq.json", "retrieval_score": 0.55},
+    ], None)
+    mock_retriever_instance.index_version = "test"
+    mock_generate_answer.return_value = {
+        "answer": generator.GENERATION_ERROR_MESSAGE, "confidence_score": 0.0, "finish_reason": "CIRCUIT_OPEN",
+    }
+
+    with patch.object(main, "answer_cache", None), patch.object(main, "direct_answerer", None):
+        response = client.post("/api/v1/ask?query=test&k=2")
+
+    assert response.status_code == 200
+    assert response.json()["answer_source"] == "fallback"
+    assert response.json()["answer"] == "الإرجاع خلال 14 يومًا."
+
+
+@patch('app.main.retriever_instance')
+def test_stream_failure_before_first_token_falls_back_to_stored_faq_answer(mock_retriever_instance):
+    """اختبار أن فشل Gemini قبل أول جزء في /ask/stream يُرسل الإجابة المخزنة بدل رسالة الاعتذار، كما في /ask."""
+    if main.fallback_answerer is None:
+        pytest.skip("LLM_FALLBACK_ENABLED معطل")
+    mock_retriever_instance.search.return_value = ([
+        {"id": "faq-001", "source": "faq.json", "retrieval_score": 0.6, "answer": "الإرجاع خلال 14 يومًا."},
+        {"id": "faq-002", "source": "faq.json", "retrieval_score": 0.55},
+    ], None)
+    mock_retriever_instance.index_version = "test"
+    mock_retriever_instance.is_ready = True
+    failing_model = MagicMock()
+    failing_model.generate_content_async = AsyncMock(side_effect=RuntimeError("upstream reset"))
+
+    with patch.object(main, "answer_cache", None), patch.object(main, "direct_answerer", None), \
+            patch.object(generator, "model", failing_model), \
+            patch.object(generator, "is_client_configured", True), \
+            patch.object(generator, "_llm_caller", _caller()), \
+            patch.object(generator, "_llm_semaphore", None):
+        response = client.get("/api/v1/ask/stream?query=test&k=2")
+
+    assert response.status_code == 200
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert [data["text"] for event, data in events if event == "token"] == ["الإرجاع خلال 14 يومًا."]
+    assert events[-1][0] == "done" and events[-1][1]["answer_source"] == "fallback"
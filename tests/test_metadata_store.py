@@ -0,0 +1,68 @@
+# tests/test_metadata_store.py
+import json
+
+from app.core.metadata_store import (
+    ColumnarMetadataStore,
+    InMemoryMetadataStore,
+    load_metadata_store,
+    metadata_store_path,
+    write_metadata_store,
+)
+
+RECORDS = [
+    {"id": "faq-002", "question": "كم تستغرق عملية الشحن؟", "source": "معلومات-الشحن.docx"},
+    {"id": "faq-010", "question": "", "source": "a.pdf"},
+    {"id": "faq-001", "question": "ما هي سياسة الإرجاع لديكم؟", "source": "سياسة-المبيعات.pdf"},
+]
+
+
+def test_columnar_store_round_trip_and_id_lookup(tmp_path):
+    """اختبار أن الصيغة العمودية تعيد السجلات بنفس ترتيب الصفوف وأن البحث بالمعرّف يعمل."""
+    path = str(tmp_path / "metadata_test.store")
+    write_metadata_store(path, RECORDS)
+    store = ColumnarMetadataStore(path)
+
+    assert len(store) == 3
+    assert [store.record(row) for row in range(3)] == RECORDS
+    assert store.row_for_id("faq-001") == 2
+    assert store.row_for_id("faq-010") == 1
+    assert store.row_for_id("faq-999") is None
+    store.close()
+
+
+def test_close_releases_file_handles_and_is_idempotent(tmp_path):
+    """اختبار أن close تغلق ملفات المخزن وmmap الخاصة به، وأن استدعاءها مرة ثانية آمن (عند إخراج الفهرس)."""
+    path = str(tmp_path / "metadata_test.store")
+    write_metadata_store(path, RECORDS)
+    store = ColumnarMetadataStore(path)
+    files = list(store._files)
+
+    store.close()
+    store.close()
+
+    assert files and all(f.closed for f in files)
+
+
+def test_records_are_fresh_per_call(tmp_path):
+    """اختبار أن تعديل نتيجة طلب لا يؤثر على الطلبات الأخرى."""
+    for store in (InMemoryMetadataStore([dict(r) for r in RECORDS]), _columnar(tmp_path)):
+        first = store.record(0)
+        first["retrieval_score"] = 0.5
+        assert "retrieval_score" not in store.record(0)
+
+
+def test_load_prefers_columnar_store_and_falls_back_to_json(tmp_path):
+    """اختبار اختيار الصيغة العمودية عند وجودها والرجوع إلى JSON عند غيابها."""
+    metadata_path = str(tmp_path / "metadata_v9.json")
+    with open(metadata_path, 'w', encoding='utf-8') as f:
+        json.dump(RECORDS, f, ensure_ascii=False)
+    assert isinstance(load_metadata_store(metadata_path), InMemoryMetadataStore)
+
+    write_metadata_store(metadata_store_path(metadata_path), RECORDS)
+    assert isinstance(load_metadata_store(metadata_path), ColumnarMetadataStore)
+
+
+def _columnar(tmp_path):
+    path = str(tmp_path / "metadata_fresh.store")
+    write_metadata_store(path, RECORDS)
+    return ColumnarMetadataStore(path)
@@ -0,0 +1,89 @@
+# tests/test_metrics.py
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import faiss
+import numpy as np
+from fastapi.testclient import TestClient
+from prometheus_client import CollectorRegistry, REGISTRY
+
+from app import main
+from app.core.answer_cache import SemanticAnswerCache
+from app.core.metrics import ServiceCollector, observe_timings
+from app.main import app
+
+client = TestClient(app)
+
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_endpoint_counts_unavailable_responses_by_route():
+    """اختبار أن استجابات 503 تُحسب بقالب المسار وأن /metrics يُرجع صيغة Prometheus النصية."""
+    before = _sample("rag_http_responses_total", {"path": "/api/v1/ask", "status": "503"})
+    with patch.object(main, "retriever_instance", None):
+        assert client.post("/api/v1/ask?query=test&k=1").status_code == 503
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "rag_stage_duration_seconds_bucket" in response.text
+    assert _sample("rag_http_responses_total", {"path": "/api/v1/ask", "status": "503"}) == before + 1
+    assert _sample("rag_requests_in_flight", {}) == 0
+
+
+def test_streaming_request_stays_in_flight_until_body_ends():
+    """اختبار أن طلب SSE يبقى محسوبًا في rag_requests_in_flight حتى يُرسل آخر حدث."""
+    retriever = SimpleNamespace(
+        is_ready=True, index_version="test",
+        search=lambda query, k, return_vector=False: (
+            [{"id": "test-001", "source": "test.pdf", "retrieval_score": 0.5}], None
+        ),
+    )
+    observed = []
+
+    async def fake_stream(query, context_chunks):
+        yield {"type": "token", "text": "جزء"}
+        # الاستجابة بدأت وأُرسل أول حدث، لكن التدفق لم ينته بعد
+        await asyncio.sleep(0.05)
+        observed.append(_sample("rag_requests_in_flight", {}))
+        yield {"type": "end", "confidence_score": 0.85, "finish_reason": "STOP"}
+
+    with patch.object(main, "retriever_instance", retriever), \
+            patch.object(main, "generate_answer_stream", fake_stream), \
+            patch.object(main, "retrieval_batcher", None), \
+            patch.object(main, "answer_cache", None), \
+            patch.object(main, "direct_answerer", None), \
+            patch.object(main, "context_packer", None):
+        response = client.get("/api/v1/ask/stream?query=test&k=1")
+
+    assert response.status_code == 200
+    assert observed == [1]
+    assert _sample("rag_requests_in_flight", {}) == 0
+
+
+def test_timings_are_recorded_in_stage_histograms():
+    before = _sample("rag_stage_duration_seconds_count", {"stage": "generation"})
+    observe_timings({"retrieval_ms": 4.0, "generation_ms": 250.0, "ttft_ms": 90.0, "total_ms": 260.0})
+    assert _sample("rag_stage_duration_seconds_count", {"stage": "generation"}) == before + 1
+
+
+def test_service_collector_reads_cache_and_index_state():
+    """اختبار أن إحصائيات الذاكرات المؤقتة وحجم الفهرس تُقرأ لحظة الجمع."""
+    index = faiss.IndexFlatIP(4)
+    index.add(np.eye(4, dtype=np.float32))
+    answer_cache = SemanticAnswerCache(max_size=4)
+    answer_cache.get(np.ones(4, dtype=np.float32), ["faq-001"], "v1")
+    retriever = SimpleNamespace(
+        index=index, index_version="v1", is_ready=True, query_cache=None,
+        retrieval_stats={"dense": 2, "hybrid": 5, "lexical": 3},
+    )
+
+    registry = CollectorRegistry()
+    registry.register(ServiceCollector(lambda: {"retriever": retriever, "answer_cache": answer_cache}))
+
+    assert registry.get_sample_value("rag_index_vectors", {"index_version": "v1"}) == 4
+    assert registry.get_sample_value("rag_cache_events_total", {"cache": "answer", "result": "miss"}) == 1
+    assert registry.get_sample_value("rag_retrieval_queries_total", {"path": "lexical"}) == 3
@@ -0,0 +1,60 @@
+# tests/test_onnx_encoder.py
+import numpy as np
+import pytest
+from tokenizers import Tokenizer, models, pre_tokenizers
+
+from app.core.embedding_backends import embedding_cache_name, load_embedding_model
+from app.core.onnx_encoder import OnnxEncoder
+
+VOCAB = ["[PAD]", "[UNK]", "a", "b", "c"]
+
+
+class FakeSession:
+    """جلسة ONNX وهمية: الحالة المخفية لكل رمز هي (معرّف الرمز، 1)، وتسجل أشكال المدخلات."""
+
+    def __init__(self):
+        self.batches = []
+
+    def run(self, output_names, feeds):
+        self.batches.append(feeds["input_ids"].shape)
+        input_ids = feeds["input_ids"].astype(np.float32)
+        return [np.stack([input_ids, np.ones_like(input_ids)], axis=-1)]
+
+
+def _encoder(batch_size=32):
+    tokenizer = Tokenizer(models.WordLevel({token: i for i, token in enumerate(VOCAB)}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    config = {
+        "input_names": ["input_ids", "attention_mask"],
+        "max_seq_length": 8,
+        "pooling": "mean",
+        "pad_token": "[PAD]",
+        "pad_token_id": 0,
+        "dimension": 2,
+    }
+    return OnnxEncoder(FakeSession(), tokenizer, config, batch_size=batch_size)
+
+
+def test_mean_pooling_ignores_padding_and_keeps_input_order():
+    """اختبار أن التجميع بالمتوسط يتجاهل رموز الحشو وأن الترتيب حسب الطول لا يغيّر ترتيب المخرجات."""
+    encoder = _encoder(batch_size=2)
+    vectors = encoder.encode(["a", "c c b", "b"])
+
+    np.testing.assert_allclose(vectors, [[2, 1], [(4 + 4 + 3) / 3, 1], [3, 1]], rtol=1e-6)
+    # الدفعة الأولى تضم أطول نصين، والثانية النص المتبقي دون حشو إضافي
+    assert encoder.session.batches == [(2, 3), (1, 1)]
+
+
+def test_normalization_and_single_sentence_shape():
+    vector = _encoder().encode("c", normalize_embeddings=True)
+    assert vector.shape == (2,)
+    np.testing.assert_allclose(np.linalg.norm(vector), 1.0, rtol=1e-6)
+
+
+def test_backend_selection_and_cache_namespace():
+    with pytest.raises(ValueError):
+        load_embedding_model("model", backend="tensorflow")
+    with pytest.raises(ValueError):
+        load_embedding_model("model", backend="onnx", onnx_model_dir=None)
+    assert embedding_cache_name("model") == "model"
+    assert embedding_cache_name("model", "onnx", "data/onnx/model-int8/") == "model@onnx:model-int8"
@@ -0,0 +1,129 @@
+# tests/test_singleflight.py
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from app import main
+from app.core.singleflight import SingleFlight, WaitTimeoutError, coalescing_key
+
+
+def test_identical_concurrent_calls_share_one_computation():
+    """اختبار أن الطلبات المتطابقة المتزامنة تنتظر حسابًا واحدًا وتستلم النتيجة نفسها."""
+    flights = SingleFlight()
+    calls = 0
+
+    async def operation():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"answer": "إجابة"}
+
+    async def run():
+        return await asyncio.gather(*[flights.do("key", operation) for _ in range(10)])
+
+    results = asyncio.run(run())
+
+    assert calls == 1
+    assert all(result is results[0][0] for result, _ in results)
+    assert [shared for _, shared in results].count(False) == 1
+    assert flights.stats()["followers"] == 9
+    assert len(flights) == 0
+
+
+def test_errors_reach_every_waiter_and_are_not_remembered():
+    flights = SingleFlight()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("retrieval failed")
+
+    async def run():
+        return await asyncio.gather(*[flights.do("key", failing) for _ in range(3)], return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert all(isinstance(error, ValueError) for error in errors)
+    # الخطأ لا يُخزَّن: الطلب التالي يبدأ حسابًا جديدًا
+    with pytest.raises(ValueError):
+        asyncio.run(flights.do("key", failing))
+    assert calls == 2
+
+
+def test_waiter_timeout_does_not_cancel_shared_computation():
+    """اختبار أن تجاوز أحد المنتظرين مهلته لا يلغي الحساب لبقية المنتظرين."""
+    flights = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "ok"
+
+    async def run():
+        leader = asyncio.ensure_future(flights.do("key", slow))
+        await asyncio.sleep(0)
+        with pytest.raises(WaitTimeoutError):
+            await flights.do("key", slow, timeout=0.01)
+        return await leader
+
+    assert asyncio.run(run()) == ("ok", False)
+    assert flights.stats()["timeouts"] == 1
+
+
+def test_computation_is_cancelled_when_every_waiter_gives_up():
+    flights = SingleFlight()
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        with pytest.raises(WaitTimeoutError):
+            await flights.do("key", slow, timeout=0.01)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert cancelled == [True]
+    assert len(flights) == 0
+
+
+def test_coalescing_key_normalizes_query():
+    assert coalescing_key("  ما هي  سياسة الإرجاع؟", 3, "v1") == coalescing_key("ما هى سياسة الارجاع؟", 3, "v1")
+    assert coalescing_key("سؤال", 3, "v1") != coalescing_key("سؤال", 3, "v2")
+
+
+@patch('app.main.retriever_instance')
+@patch('app.main.generate_answer')
+def test_identical_ask_requests_are_coalesced(mock_generate_answer, mock_retriever_instance):
+    """اختبار أن طلبات /api/v1/ask المتطابقة المتزامنة تنفذ استرجاعًا واحدًا واستدعاء Gemini واحدًا."""
+    mock_retriever_instance.search.return_value = ([{"id": "test-001", "source": "test.pdf", "retrieval_score": 0.5}], None)
+    mock_retriever_instance.index_version = "test"
+
+    async def slow_answer(query, context_chunks):
+        await asyncio.sleep(0.1)
+        return {"answer": "إجابة.", "confidence_score": 0.85}
+
+    mock_generate_answer.side_effect = slow_answer
+
+    async def ask_concurrently():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*[http.post("/api/v1/ask?query=test&k=1") for _ in range(5)])
+
+    with patch.object(main, "request_coalescer", SingleFlight()), \
+            patch.object(main, "retrieval_batcher", None), \
+            patch.object(main, "answer_cache", None), \
+            patch.object(main, "direct_answerer", None):
+        responses = asyncio.run(ask_concurrently())
+
+    assert [r.status_code for r in responses] == [200] * 5
+    assert mock_generate_answer.call_count == 1
+    assert mock_retriever_instance.search.call_count == 1
+    assert len({r.json()["request_id"] for r in responses}) == 5
+    assert sum("coalesced_wait_ms" in r.json()["timings"] for r in responses) == 4
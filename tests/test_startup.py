@@ -0,0 +1,85 @@
+# tests/test_startup.py
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app import main
+from app.core.retriever import Retriever
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_app_import_does_not_load_gemini_sdk():
+    """اختبار أن استيراد التطبيق لا يستورد google.generativeai (يُؤجَّل إلى configure_client)."""
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, app.main; print('google.generativeai' in sys.modules)"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, "GEMINI_API_KEY": "test", "INDEX_VERSION": "v1"},
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_retriever_loads_components_in_parallel():
+    """اختبار أن مراحل تحميل المسترجع تعمل في خيوط متوازية وتُسجَّل أزمنتها."""
+    barrier = threading.Barrier(4, timeout=5)
+    retriever = Retriever(index_version="v1")
+
+    def phase(**attributes):
+        def load(*args):
+            barrier.wait()
+            for name, value in attributes.items():
+                setattr(retriever, name, value)
+        return load
+
+    with patch.object(main.settings, "PARALLEL_LOADING", True), \
+            patch.object(retriever, "_load_model", phase(model="model")), \
+            patch.object(retriever, "_load_index", phase(index=SimpleNamespace(ntotal=2))), \
+            patch.object(retriever, "_load_metadata", phase(metadata=["a", "b"])), \
+            patch.object(retriever, "_load_lexical_index", phase()):
+        retriever.load()
+
+    assert retriever.is_ready
+    assert set(retriever.load_timings) == {"model_ms", "index_ms", "metadata_ms", "lexical_index_ms"}
+
+
+class FakeRetriever:
+    """مسترجع وهمي لا يكتمل تحميله إلا إذا جرت تهيئة عميل Gemini في الوقت نفسه."""
+    barrier = None
+
+    def __init__(self, index_version=None, model=None):
+        self.index_version = index_version or "v1"
+        self.is_ready = False
+        self.load_timings = {}
+        self.warmed_with = None
+
+    def load(self):
+        self.barrier.wait()
+        self.is_ready = True
+        self.load_timings["model_ms"] = 1.0
+
+    def warmup(self, queries, k=3):
+        # المسترجع لا يُتاح للطلبات قبل انتهاء التسخين
+        assert main.retriever_instance is None
+        self.warmed_with = list(queries)
+
+
+def test_lifespan_loads_concurrently_and_warms_up_before_serving():
+    FakeRetriever.barrier = threading.Barrier(2, timeout=5)
+
+    async def run_lifespan():
+        async with main.lifespan(main.app):
+            return main.retriever_instance, dict(main.startup_timings)
+
+    with patch.object(main, "Retriever", FakeRetriever), \
+            patch.object(main, "configure_client", lambda: FakeRetriever.barrier.wait() is not None), \
+            patch.object(main, "retriever_instance", None), \
+            patch.object(main, "startup_timings", {}), \
+            patch.object(main.settings, "BATCHING_ENABLED", False):
+        retriever, timings = asyncio.run(run_lifespan())
+
+    assert retriever.warmed_with == main.settings.WARMUP_QUERIES
+    assert {"retriever_load_ms", "llm_client_ms", "warmup_ms", "retriever.model_ms", "total_ms"} <= set(timings)
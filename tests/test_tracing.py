@@ -0,0 +1,118 @@
+# tests/test_tracing.py
+import contextvars
+import json
+import threading
+from unittest.mock import patch
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core.tracing import TraceWriter, current_trace, finish_trace, profiled, span, start_trace, trace_reason
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_spans_are_nested_under_their_parent(tmp_path):
+    """اختبار أن المقاطع المتداخلة تُسجَّل بمعرّف المقطع الأب الصحيح."""
+    trace, token = start_trace("req-1", "/api/v1/ask", "header")
+    with span("retrieve", k=3):
+        with span("embedding.encode"):
+            pass
+        with span("faiss.search"):
+            pass
+    main_context_trace = current_trace()
+    finish_trace(trace, token, TraceWriter(str(tmp_path / "traces.jsonl"), max_bytes=1_000_000, backup_count=1))
+
+    assert main_context_trace is trace
+    assert current_trace() is None
+
+    spans = {s["name"]: s for s in trace.spans}
+    assert spans["retrieve"]["parent"] is None
+    assert spans["retrieve"]["k"] == 3
+    assert spans["embedding.encode"]["parent"] == spans["retrieve"]["id"]
+    assert spans["faiss.search"]["parent"] == spans["retrieve"]["id"]
+
+
+def test_span_is_noop_without_active_trace():
+    assert current_trace() is None
+    with span("retrieve"):
+        pass
+    assert current_trace() is None
+    assert profiled(lambda x: x + 1)(1) == 2
+
+
+def test_trace_reason_header_and_sampling():
+    assert trace_reason("1", 0.0, True) == "header"
+    assert trace_reason("profile", 0.0, True) == "header"
+    assert trace_reason("1", 0.0, False) is None
+    assert trace_reason(None, 0.0, True) is None
+    assert trace_reason(None, 1.0, True) == "sampled"
+
+
+def test_trace_writer_records_profile(tmp_path):
+    """اختبار حفظ التتبع في JSONL وملف تعريف CPU للعمل المنفذ في خيط آخر."""
+    writer = TraceWriter(str(tmp_path / "traces.jsonl"), max_bytes=1_000_000, backup_count=1)
+    trace, token = start_trace("req-profile", "/api/v1/ask", "header", profile=True)
+    context = contextvars.copy_context()
+    worker = threading.Thread(target=context.run, args=(profiled(lambda: sum(range(10_000))),))
+    worker.start()
+    worker.join()
+    finish_trace(trace, token, writer, status=200)
+    writer.flush()
+
+    record = json.loads((tmp_path / "traces.jsonl").read_text(encoding="utf-8").splitlines()[0])
+    assert record["request_id"] == "req-profile"
+    assert record["status"] == 200
+    assert record["profile_top"]
+    assert (tmp_path / "profiles" / "req-profile.prof").exists()
+
+
+def test_trace_writer_writes_off_the_calling_thread(tmp_path):
+    """اختبار أن finish_trace لا تكتب الملف في الخيط المستدعي (حلقة الأحداث) بل في خيط الكتابة."""
+    writer = TraceWriter(str(tmp_path / "traces.jsonl"), max_bytes=1_000_000, backup_count=1)
+    threads = []
+    original = writer._write_record
+    writer._write_record = lambda trace, **extra: threads.append(threading.current_thread()) or original(trace, **extra)
+
+    trace, token = start_trace("req-async", "/api/v1/ask", "header")
+    finish_trace(trace, token, writer, status=200)
+    writer.flush()
+
+    assert threads and threads[0] is not threading.current_thread()
+    assert json.loads((tmp_path / "traces.jsonl").read_text(encoding="utf-8"))["request_id"] == "req-async"
+    writer.close()
+
+
+@patch('app.main.retriever_instance')
+@patch('app.main.generate_answer')
+def test_traced_request_writes_stage_spans(mock_generate_answer, mock_retriever_instance, tmp_path):
+    """اختبار أن ترويسة X-Trace تُنتج سجل تتبع يحتوي على مراحل الطلب بينما الطلبات العادية لا تُتتبَّع."""
+    def fake_search(query, k, return_vector=False):
+        with span("faiss.search", k=k):
+            return [{"id": "test-001", "source": "test.pdf", "retrieval_score": 0.5}], np.ones((1, 4), dtype="float32")
+
+    mock_retriever_instance.search.side_effect = fake_search
+    mock_retriever_instance.index_version = "test"
+    mock_generate_answer.return_value = {"answer": "إجابة.", "confidence_score": 0.9}
+
+    writer = TraceWriter(str(tmp_path / "traces.jsonl"), max_bytes=1_000_000, backup_count=1)
+    with patch.object(main, "trace_writer", writer), patch.object(main, "answer_cache", None):
+        untraced = client.post("/api/v1/ask?query=test&k=1")
+        traced = client.post("/api/v1/ask?query=test&k=1", headers={"X-Trace": "1"})
+    writer.flush()
+
+    assert "X-Trace-ID" not in untraced.headers
+    assert traced.status_code == 200
+    assert traced.headers["X-Trace-ID"] == traced.headers["X-Request-ID"]
+
+    lines = (tmp_path / "traces.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record["request_id"] == traced.headers["X-Request-ID"]
+    assert record["reason"] == "header"
+    spans = {s["name"]: s for s in record["spans"]}
+    assert {"retrieve", "faiss.search", "generate"} <= set(spans)
+    # المقطع المسجل من خيط آخر يُنسب إلى مقطع retrieve في حلقة الأحداث
+    assert spans["faiss.search"]["parent"] == spans["retrieve"]["id"]